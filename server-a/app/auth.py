@@ -7,25 +7,38 @@ if sys.version_info < (3, 9):
 else:
     from typing import Annotated
 import logging
-import dataclasses
 
 from app.config import ClientConfig
-from app.cache import CLIENT_CONFIG_CACHE
+from app.cache import current_snapshot, hash_api_key, key_id
+from app.timing import stage
 
 logger = logging.getLogger(__name__)
 
-@dataclasses.dataclass
-class ClientContext:
-    user_id: int
-    username: str
-    is_active: bool
-    daily_quota: int
-    api_key: str
+# The cached, immutable client record doubles as the per-request context, so
+# authentication attaches it to ``request.state`` without copying.
+ClientContext = ClientConfig
 
 async def get_client_context(
     request: Request,
     api_key: Annotated[Union[str, None], Header(alias="API-Key")] = None
 ) -> ClientContext:
+    with stage("auth"):
+        return _authenticate(request, api_key)
+
+
+def request_key_hash(request: Request, api_key: str) -> bytes:
+    """Return ``hash_api_key(api_key)``, computed at most once per request.
+
+    The idempotency middleware needs the hash before authentication runs; it
+    is kept on ``request.state`` so the HMAC is not computed twice.
+    """
+    key_hash = getattr(request.state, "api_key_hash", None)
+    if key_hash is None:
+        key_hash = request.state.api_key_hash = hash_api_key(api_key)
+    return key_hash
+
+
+def _authenticate(request: Request, api_key: Union[str, None]) -> ClientContext:
     if not api_key:
         logger.warning("Authentication failed: API-Key header missing.")
         raise HTTPException(
@@ -33,23 +46,23 @@ async def get_client_context(
             detail={"error_code": "UNAUTHORIZED", "message": "API-Key header missing"}
         )
 
-    client_config = CLIENT_CONFIG_CACHE.get(api_key)
+    key_hash = request_key_hash(request, api_key)
+    client_config = current_snapshot().clients.get(key_hash)
 
     if not client_config:
-        logger.warning("Authentication failed: Invalid API key.", extra={"client_api_key": api_key})
+        logger.warning("Authentication failed: Invalid API key.", extra={"client_key_id": key_id(key_hash)})
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"error_code": "UNAUTHORIZED", "message": "Invalid API key"}
         )
 
     if not client_config.is_active:
-        logger.warning("Authentication failed: Client is inactive.", extra={"client_api_key": api_key})
+        logger.warning("Authentication failed: Client is inactive.", extra={"client_key_id": client_config.key_id})
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"error_code": "UNAUTHORIZED", "message": "Client is inactive"}
         )
 
-    client_context = ClientContext(api_key=api_key, **dataclasses.asdict(client_config))
-    request.state.client = client_context
-    logger.info("Client authenticated successfully.", extra={"client_api_key": api_key, "client_name": client_context.username})
-    return client_context
\ No newline at end of file
+    request.state.client = client_config
+    logger.info("Client authenticated successfully.", extra={"client_key_id": client_config.key_id, "client_name": client_config.username})
+    return client_config
\ No newline at end of file
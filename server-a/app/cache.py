@@ -1,16 +1,253 @@
+import dataclasses
+import hashlib
+import hmac
 import json
+import math
 from pathlib import Path
-from typing import Dict
+from types import MappingProxyType
+from typing import Dict, Iterable, Iterator, Mapping, Optional, Tuple
 
-from app.config import ClientConfig, ProviderConfig, normalize_provider_key
+from app import snapshot_store
+from app.config import ClientConfig, ProviderConfig, get_settings, normalize_provider_key
 
-# In-memory caches populated from configuration state broadcasts
-CLIENT_CONFIG_CACHE: Dict[str, ClientConfig] = {}
-PROVIDER_CONFIG_CACHE: Dict[str, ProviderConfig] = {}
-PROVIDER_ALIAS_MAP_CACHE: Dict[str, str] = {}
+# Marks a key removed by an overlay of ``_LayeredMap``.
+_DELETED = object()
+# Overlays smaller than this are never folded back into their base.
+_COMPACT_MIN_OVERLAY = 1024
 
-# Path to the local on-disk cache used for warm starts
-CONFIG_CACHE_PATH = Path(__file__).resolve().parent / "state" / "config_cache.json"
+
+class _LayeredMap(Mapping):
+    """Immutable mapping made of a shared base dict and a small overlay.
+
+    ``with_changes`` returns a new map that reuses the base, so applying a
+    delta costs time proportional to the overlay, not to the whole map. The
+    overlay is folded into a fresh base once it grows past roughly the square
+    root of the base size, keeping lookups at two dict probes at most.
+    """
+
+    __slots__ = ("_base", "_overlay", "_len")
+
+    def __init__(self, base: Optional[Dict] = None, overlay: Optional[Dict] = None, length: Optional[int] = None):
+        self._base = base if base is not None else {}
+        self._overlay = overlay if overlay is not None else {}
+        self._len = len(self._base) if length is None else length
+
+    def get(self, key, default=None):
+        overlay = self._overlay
+        if overlay and key in overlay:
+            value = overlay[key]
+            return default if value is _DELETED else value
+        return self._base.get(key, default)
+
+    def __getitem__(self, key):
+        value = self.get(key, _DELETED)
+        if value is _DELETED:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        if key in self._overlay:
+            return self._overlay[key] is not _DELETED
+        return key in self._base
+
+    def __iter__(self) -> Iterator:
+        overlay = self._overlay
+        for key in self._base:
+            if key not in overlay:
+                yield key
+        for key, value in overlay.items():
+            if value is not _DELETED:
+                yield key
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self.items())!r})"
+
+    def with_changes(self, changes: Dict) -> "_LayeredMap":
+        """Return a new map with ``changes`` applied; ``_DELETED`` removes a key."""
+
+        if not changes:
+            return self
+        overlay = dict(self._overlay)
+        length = self._len
+        for key, value in changes.items():
+            present = key in self
+            if value is _DELETED:
+                if not present:
+                    continue
+                length -= 1
+                if key in self._base:
+                    overlay[key] = _DELETED
+                else:
+                    overlay.pop(key, None)
+            else:
+                if not present:
+                    length += 1
+                overlay[key] = value
+
+        if len(overlay) > max(_COMPACT_MIN_OVERLAY, math.isqrt(len(self._base))):
+            base = {key: value for key, value in self._base.items() if key not in overlay}
+            base.update((key, value) for key, value in overlay.items() if value is not _DELETED)
+            return _LayeredMap(base)
+        return _LayeredMap(self._base, overlay, length)
+
+
+def _frozen(mapping: Optional[Dict] = None) -> Mapping:
+    return MappingProxyType(dict(mapping or {}))
+
+
+@dataclasses.dataclass(frozen=True)
+class ConfigSnapshot:
+    """One consistent, read-only view of the configuration state.
+
+    Snapshots are never modified: ``apply_state`` and ``apply_delta`` build a
+    new one and publish it with a single reference swap, so a request that
+    holds a snapshot sees the clients and providers of the same version.
+    """
+
+    # Keyed by ``hash_api_key(api_key)``; raw API keys are never stored.
+    clients: Mapping[bytes, ClientConfig] = dataclasses.field(default_factory=_LayeredMap)
+    providers: Mapping[str, ProviderConfig] = dataclasses.field(default_factory=_frozen)
+    provider_aliases: Mapping[str, str] = dataclasses.field(default_factory=_frozen)
+    # Names of the providers that are active and operational, in config order;
+    # the candidates of smart selection.
+    active_providers: Tuple[str, ...] = ()
+    # Indexes used to apply deltas: server-b identifies users and providers
+    # by id, the maps above are keyed by API key hash and provider name.
+    key_hash_by_user_id: Mapping[int, bytes] = dataclasses.field(default_factory=_LayeredMap)
+    provider_name_by_id: Mapping[int, str] = dataclasses.field(default_factory=_frozen)
+    # Version of the state; ``None`` when it came from a source without
+    # versions (env bootstrap, legacy broadcasts).
+    version: Optional[int] = None
+    # Sum of the entity digests (see ``client_digest``), kept up to date as
+    # changes are applied.
+    digest: int = 0
+
+    @property
+    def fingerprint(self) -> str:
+        """Fingerprint of the state; server-b computes the same value."""
+        return fingerprint_hex(self.digest)
+
+    @classmethod
+    def build(
+        cls,
+        clients: Optional[Dict[bytes, ClientConfig]] = None,
+        providers: Optional[Dict[str, ProviderConfig]] = None,
+        provider_ids: Optional[Dict[int, str]] = None,
+        version: Optional[int] = None,
+    ) -> "ConfigSnapshot":
+        """Build a snapshot from plain dicts.
+
+        Raises:
+            ValueError: if two providers share the same alias.
+        """
+
+        clients = dict(clients or {})
+        providers = dict(providers or {})
+        digest = sum(client_digest(key, cfg) for key, cfg in clients.items())
+        digest += sum(provider_digest(name, cfg) for name, cfg in providers.items())
+        return cls(
+            clients=_LayeredMap(clients),
+            providers=_frozen(providers),
+            provider_aliases=_frozen(_build_provider_alias_map(providers)),
+            active_providers=_active_providers(providers),
+            key_hash_by_user_id=_LayeredMap(
+                {cfg.user_id: key for key, cfg in clients.items() if cfg.user_id is not None}
+            ),
+            provider_name_by_id=_frozen(provider_ids),
+            version=version,
+            digest=digest % _DIGEST_MODULUS,
+        )
+
+
+def hash_api_key(api_key: str) -> bytes:
+    """Return the keyed hash clients are indexed by.
+
+    HMAC-SHA256 with ``API_KEY_HASH_SECRET``; server-b computes the same value
+    (``core.config_state.api_key_hash``) so broadcasts never carry raw keys.
+    """
+
+    secret = get_settings().api_key_hash_secret.encode()
+    return hmac.new(secret, api_key.encode(), hashlib.sha256).digest()
+
+
+def key_id(key_hash: bytes) -> str:
+    """Short, non-secret identifier of an API key for logs, metrics and Redis keys."""
+    return key_hash[:8].hex()
+
+
+def _entry_key_hash(entry: Dict) -> Optional[bytes]:
+    """Return the index key of a user entry.
+
+    Broadcasts carry ``api_key_hash``; entries with a raw ``api_key`` (env
+    bootstrap, legacy exports) are hashed here.
+    """
+
+    key_hash = str(entry.get("api_key_hash") or "").strip()
+    if key_hash:
+        return bytes.fromhex(key_hash)
+    api_key = str(entry.get("api_key") or "").strip()
+    return hash_api_key(api_key) if api_key else None
+
+
+# Fingerprints are the sum, modulo 2**256, of one SHA-256 digest per user and
+# provider, so they do not depend on order and a change is re-fingerprinted by
+# subtracting the old entity's digest and adding the new one. The digested
+# fields must match ``core.config_state.entity_digest`` in server-b.
+_DIGEST_MODULUS = 1 << 256
+
+
+def _digest(fields) -> int:
+    data = json.dumps(fields, separators=(",", ":")).encode("utf-8")
+    return int.from_bytes(hashlib.sha256(data).digest(), "big")
+
+
+def client_digest(key_hash: bytes, cfg: ClientConfig) -> int:
+    return _digest(["user", key_hash.hex(), cfg.user_id, cfg.username, cfg.daily_quota, cfg.is_active])
+
+
+def provider_digest(name: str, cfg: ProviderConfig) -> int:
+    return _digest(["provider", name, cfg.is_active, cfg.is_operational, list(cfg.aliases)])
+
+
+def fingerprint_hex(digest: int) -> str:
+    return f"{digest:064x}"
+
+
+def _digest_changes(digest: int, old: Mapping, new: Mapping, keys, entity_digest) -> int:
+    """Return ``digest`` updated for the entities under ``keys`` going from ``old`` to ``new``."""
+
+    for key in keys:
+        before = old.get(key)
+        if before is not None:
+            digest -= entity_digest(key, before)
+        after = new.get(key)
+        if after is not None:
+            digest += entity_digest(key, after)
+    return digest % _DIGEST_MODULUS
+
+
+# The configuration state currently served; replaced, never mutated.
+_current: ConfigSnapshot = ConfigSnapshot()
+
+
+def current_snapshot() -> ConfigSnapshot:
+    """Return the configuration snapshot to use for one request."""
+    return _current
+
+
+def swap_snapshot(snapshot: ConfigSnapshot) -> ConfigSnapshot:
+    """Publish ``snapshot`` and return the one it replaced."""
+
+    global _current
+    previous, _current = _current, snapshot
+    return previous
+
+
+# Path to the local on-disk snapshot used for warm starts (see app.snapshot_store)
+CONFIG_CACHE_PATH = Path(__file__).resolve().parent / "state" / "config_cache.bin"
 CONFIG_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
 
 
@@ -23,7 +260,7 @@ def _build_provider_alias_map(providers: Dict[str, ProviderConfig]) -> Dict[str,
 
     alias_map: Dict[str, str] = {}
     for name, cfg in providers.items():
-        aliases = [name] + (cfg.aliases or [])
+        aliases = (name, *cfg.aliases)
         for alias in aliases:
             key = normalize_provider_key(alias)
             existing = alias_map.get(key)
@@ -36,13 +273,16 @@ def _build_provider_alias_map(providers: Dict[str, ProviderConfig]) -> Dict[str,
 
 
 def apply_state(state: Dict) -> None:
-    """Replace all in-memory caches with the given state.
+    """Replace the configuration snapshot with the given state.
 
     Accepts either canonical shape:
       {"users": {API_KEY: {..}}, "providers": {NAME: {..}}}
 
     Or server-b broadcast shape:
-      {"timestamp": ..., "data": {"users": [{"api_key": ..., ...}], "providers": [{"name": ..., ...}]}}
+      {"timestamp": ..., "version": ..., "data": {"users": [{"api_key_hash": ..., ...}], "providers": [{"name": ..., ...}]}}
+
+    Raw API keys (canonical shape, or ``api_key`` in a user entry) are hashed
+    on load.
     """
 
     # Unwrap nested data if present
@@ -51,70 +291,240 @@ def apply_state(state: Dict) -> None:
     users = raw.get("users", {})
     providers = raw.get("providers", {})
 
-    # Normalize users to dict keyed by api_key
+    provider_ids: Dict[int, str] = {}
+
+    # Normalize users to dict keyed by API key hash
     if isinstance(users, list):
         users_dict = {}
         for u in users:
-            api_key = str(u.get("api_key", "")).strip()
-            if not api_key:
+            key_hash = _entry_key_hash(u)
+            if key_hash is None:
                 continue
-            # Map expected fields for ClientConfig
-            users_dict[api_key] = {
-                "user_id": u.get("user_id"),
-                "username": u.get("username", ""),
-                "is_active": bool(u.get("is_active", True)),
-                "daily_quota": int(u.get("daily_quota", 0)),
-            }
+            users_dict[key_hash] = _client_fields(u)
         users = users_dict
+    else:
+        users = {hash_api_key(k): v for k, v in users.items()}
 
     # Normalize providers to dict keyed by name
     if isinstance(providers, list):
-        providers_dict = {}
-        for p in providers:
-            name = p.get("name") or p.get("slug")
-            if not name:
-                continue
-            providers_dict[name] = {
-                "is_active": bool(p.get("is_active", True)),
-                "is_operational": bool(p.get("is_operational", True)),
-                "aliases": p.get("aliases") or [],
-                "note": p.get("note"),
-            }
-        providers = providers_dict
+        providers, provider_ids = _provider_entries_by_name(providers)
+
+    snapshot = ConfigSnapshot.build(
+        clients={k: ClientConfig(**v, key_id=key_id(k)) for k, v in users.items()},
+        providers={k: ProviderConfig(**v) for k, v in providers.items()},
+        provider_ids=provider_ids,
+        version=state.get("version"),
+    )
+    swap_snapshot(snapshot)
+
+
+def _provider_entries_by_name(entries) -> Tuple[Dict[str, Dict], Dict[int, str]]:
+    providers: Dict[str, Dict] = {}
+    provider_ids: Dict[int, str] = {}
+    for p in entries:
+        name = p.get("name") or p.get("slug")
+        if not name:
+            continue
+        providers[name] = _provider_fields(p)
+        if p.get("id") is not None:
+            provider_ids[p["id"]] = name
+    return providers, provider_ids
+
+
+def get_state_version() -> Optional[int]:
+    return _current.version
+
+
+def confirm_snapshot(fingerprint: Optional[str], version: Optional[int]) -> bool:
+    """Adopt ``version`` if the current state has the snapshot's ``fingerprint``.
+
+    Returns ``True`` when the snapshot can be skipped.
+    """
+
+    current = _current
+    if not fingerprint or fingerprint != current.fingerprint:
+        return False
+    # Fingerprints survive deltas that cancel out, so an older snapshot can
+    # match too; never move the version backwards.
+    if version is not None and (current.version is None or version > current.version):
+        swap_snapshot(dataclasses.replace(current, version=version))
+    return True
 
-    new_client_cache = {k: ClientConfig(**v) for k, v in users.items()}
-    new_provider_cache = {k: ProviderConfig(**v) for k, v in providers.items()}
-    new_alias_map = _build_provider_alias_map(new_provider_cache)
 
-    CLIENT_CONFIG_CACHE.clear()
-    CLIENT_CONFIG_CACHE.update(new_client_cache)
+def apply_delta(delta: Dict) -> bool:
+    """Apply a versioned delta broadcast.
 
-    PROVIDER_CONFIG_CACHE.clear()
-    PROVIDER_CONFIG_CACHE.update(new_provider_cache)
+    Only the users and providers named in the delta are rebuilt; everything
+    else is shared with the current snapshot. Returns ``False`` without
+    changing anything when the delta does not follow the current version,
+    in which case a full resync is needed.
 
-    PROVIDER_ALIAS_MAP_CACHE.clear()
-    PROVIDER_ALIAS_MAP_CACHE.update(new_alias_map)
+    Raises:
+        ValueError: if the delta would create a provider alias collision.
+    """
+
+    current = _current
+    version = delta.get("version")
+    previous_version = delta.get("previous_version")
+    if current.version is None or version is None or previous_version is None:
+        return False
+    if version <= current.version:
+        # Already applied (e.g. redelivered); nothing to do.
+        return True
+    if previous_version != current.version:
+        return False
+
+    changes = delta.get("changes") or []
+    providers, provider_aliases, provider_name_by_id = _apply_provider_changes(
+        current, [c for c in changes if c.get("kind") == "provider"]
+    )
+    clients, key_hash_by_user_id, changed_keys = _apply_user_changes(
+        current, [c for c in changes if c.get("kind") == "user"]
+    )
+    digest = _digest_changes(current.digest, current.clients, clients, changed_keys, client_digest)
+    if providers is not current.providers:
+        changed_names = set(current.providers) | set(providers)
+        digest = _digest_changes(digest, current.providers, providers, changed_names, provider_digest)
+
+    swap_snapshot(
+        ConfigSnapshot(
+            clients=clients,
+            providers=providers,
+            provider_aliases=provider_aliases,
+            active_providers=(
+                current.active_providers if providers is current.providers else _active_providers(providers)
+            ),
+            key_hash_by_user_id=key_hash_by_user_id,
+            provider_name_by_id=provider_name_by_id,
+            version=version,
+            digest=digest,
+        )
+    )
+    return True
+
+
+def _apply_user_changes(current: ConfigSnapshot, changes) -> Tuple[Mapping, Mapping, Iterable[bytes]]:
+    # Every old key is removed before any new key is added, so users that
+    # swap API keys within one delta both keep their entry, whatever the
+    # order of the changes.
+    entries = {change.get("id"): change.get("entry") for change in changes}
+    client_changes: Dict = {}
+    key_changes: Dict = {}
+    for user_id in entries:
+        old_key = current.key_hash_by_user_id.get(user_id)
+        if old_key is not None:
+            client_changes[old_key] = _DELETED
+
+    for user_id, entry in entries.items():
+        key_hash = _entry_key_hash(entry) if entry else None
+        if key_hash is not None:
+            client_changes[key_hash] = ClientConfig(**_client_fields(entry), key_id=key_id(key_hash))
+            key_changes[user_id] = key_hash
+        else:
+            key_changes[user_id] = _DELETED
+
+    return (
+        current.clients.with_changes(client_changes),
+        current.key_hash_by_user_id.with_changes(key_changes),
+        client_changes.keys(),
+    )
 
 
-def save_state_to_file(state: Dict) -> None:
-    """Persist the raw state to the local cache file."""
-    with CONFIG_CACHE_PATH.open("w") as f:
-        json.dump(state, f)
+def _apply_provider_changes(current: ConfigSnapshot, changes) -> Tuple[Mapping, Mapping, Mapping]:
+    if not changes:
+        return current.providers, current.provider_aliases, current.provider_name_by_id
+
+    # Providers number in the tens, so their maps are simply rebuilt.
+    providers = dict(current.providers)
+    names_by_id = dict(current.provider_name_by_id)
+    # As for users, renames are applied in two passes so providers that swap
+    # names within one delta are both kept.
+    entries = {change.get("id"): change.get("entry") for change in changes}
+    for provider_id in entries:
+        old_name = names_by_id.pop(provider_id, None)
+        if old_name is not None:
+            providers.pop(old_name, None)
+    for provider_id, entry in entries.items():
+        name = entry and (entry.get("name") or entry.get("slug"))
+        if not name:
+            continue
+        providers[name] = ProviderConfig(**_provider_fields(entry))
+        names_by_id[provider_id] = name
+
+    alias_map = _build_provider_alias_map(providers)
+    return _frozen(providers), _frozen(alias_map), _frozen(names_by_id)
+
+
+def _active_providers(providers: Mapping[str, ProviderConfig]) -> Tuple[str, ...]:
+    return tuple(name for name, cfg in providers.items() if cfg.is_active and cfg.is_operational)
+
+
+def _client_fields(u: Dict) -> Dict:
+    """Map a server-b user entry to ``ClientConfig`` fields."""
+    return {
+        "user_id": u.get("user_id"),
+        "username": u.get("username", ""),
+        "is_active": bool(u.get("is_active", True)),
+        "daily_quota": int(u.get("daily_quota", 0)),
+    }
+
+
+def _provider_fields(p: Dict) -> Dict:
+    """Map a server-b provider entry to ``ProviderConfig`` fields."""
+    return {
+        "is_active": bool(p.get("is_active", True)),
+        "is_operational": bool(p.get("is_operational", True)),
+        "aliases": tuple(p.get("aliases") or ()),
+        "note": p.get("note"),
+    }
+
+
+def save_snapshot_to_file(snapshot: Optional[ConfigSnapshot] = None) -> None:
+    """Persist ``snapshot`` (the current one by default) to the local snapshot file."""
+
+    snapshot = snapshot or _current
+    provider_ids = {name: provider_id for provider_id, name in snapshot.provider_name_by_id.items()}
+    providers = [
+        {
+            "id": provider_ids.get(name),
+            "name": name,
+            "is_active": cfg.is_active,
+            "is_operational": cfg.is_operational,
+            "aliases": list(cfg.aliases),
+            "note": cfg.note,
+        }
+        for name, cfg in snapshot.providers.items()
+    ]
+    snapshot_store.write_snapshot(
+        CONFIG_CACHE_PATH, snapshot.clients, providers, snapshot.version, snapshot.fingerprint
+    )
 
 
 def load_state_from_file() -> bool:
-    """Load state from disk into caches.
+    """Load the local snapshot file into the configuration snapshot.
 
+    Client records stay in the memory-mapped file until they are first used.
     Returns True on success, False otherwise.
     """
 
     try:
-        with CONFIG_CACHE_PATH.open("r") as f:
-            state = json.load(f)
-        apply_state(state)
-        return True
-    except (FileNotFoundError, json.JSONDecodeError, ValueError):
+        stored = snapshot_store.read_snapshot(CONFIG_CACHE_PATH)
+        providers, provider_ids = _provider_entries_by_name(stored.providers)
+        provider_configs = {name: ProviderConfig(**fields) for name, fields in providers.items()}
+        snapshot = ConfigSnapshot(
+            clients=_LayeredMap(stored.clients),
+            providers=_frozen(provider_configs),
+            provider_aliases=_frozen(_build_provider_alias_map(provider_configs)),
+            active_providers=_active_providers(provider_configs),
+            key_hash_by_user_id=_LayeredMap(stored.key_hash_by_user_id),
+            provider_name_by_id=_frozen(provider_ids),
+            version=stored.version,
+            digest=int(stored.fingerprint, 16),
+        )
+    except (FileNotFoundError, ValueError):
         return False
+    swap_snapshot(snapshot)
+    return True
 
 
 # Expose helper for tests
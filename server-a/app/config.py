@@ -1,29 +1,43 @@
 import os
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence
 from dataclasses import dataclass, field
 
+# AMQP message priority for each supported request priority lane.
+MESSAGE_PRIORITY_LEVELS: Dict[str, int] = {"high": 9, "normal": 5, "low": 1}
+DEFAULT_MESSAGE_PRIORITY = "normal"
+
 def normalize_provider_key(name: str) -> str:
     """Normalize provider names by stripping non-alphanumeric characters and lowering case."""
     return ''.join(ch for ch in name.lower() if ch.isalnum())
 
-@dataclass
+# Cached records are shared by every request that reads them, so they are
+# frozen; slots keep a million of them from carrying a __dict__ each.
+@dataclass(frozen=True, slots=True)
 class ClientConfig:
     user_id: int
     username: str
     is_active: bool = True
     daily_quota: int = 1000
+    # ``cache.key_id`` of the client's API key hash; the raw key is not kept.
+    key_id: str = ""
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ProviderConfig:
     is_active: bool
     is_operational: bool
-    aliases: Optional[List[str]] = None
+    aliases: Sequence[str] = ()
     note: Optional[str] = None
 
+    def __post_init__(self):
+        object.__setattr__(self, "aliases", tuple(self.aliases or ()))
+
 class Settings:
     def __init__(self, **kwargs):
         self.app_name: str = os.getenv("APP_NAME", "SMS Gateway - Server A")
         self.log_level: str = os.getenv("LOG_LEVEL", "INFO")
+        self.log_queue_size: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+        self.log_info_sample_rate: float = float(os.getenv("LOG_INFO_SAMPLE_RATE", "1.0"))
+        self.log_rate_limit_per_second: float = float(os.getenv("LOG_RATE_LIMIT_PER_SECOND", "0"))
         self.redis_url: str = os.getenv("REDIS_URL", "redis://redis:6379/0")
         self.rabbit_host: str = os.getenv("RABBITMQ_HOST", "rabbitmq")
         self.rabbit_port: int = int(os.getenv("RABBITMQ_PORT", "5672"))
@@ -33,17 +47,32 @@ class Settings:
         self.outbound_sms_exchange: str = os.getenv("RABBITMQ_EXCHANGE", "sms_gateway_exchange")
         self.outbound_sms_queue: str = os.getenv("OUTBOUND_SMS_QUEUE", "sms_outbound_queue")
         self.outbound_sms_routing_key: str = os.getenv("RABBITMQ_ROUTING_KEY", self.outbound_sms_queue)
+        self.outbound_sms_high_priority_queue: str = os.getenv("OUTBOUND_SMS_HIGH_PRIORITY_QUEUE", "sms_outbound_high_queue")
+        self.outbound_sms_low_priority_queue: str = os.getenv("OUTBOUND_SMS_LOW_PRIORITY_QUEUE", "sms_outbound_low_queue")
         self.idempotency_ttl_seconds: int = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
         self.heartbeat_interval_seconds: int = int(os.getenv("HEARTBEAT_INTERVAL_SECONDS", "60"))
+        self.heartbeat_message_ttl_seconds: int = int(
+            os.getenv("HEARTBEAT_MESSAGE_TTL_SECONDS", str(3 * self.heartbeat_interval_seconds))
+        )
         self.PROVIDER_GATE_ENABLED: bool = os.getenv("PROVIDER_GATE_ENABLED", "True").lower() in ("true", "1", "t")
+        self.provider_gate_cache_size: int = int(os.getenv("PROVIDER_GATE_CACHE_SIZE", "1024"))
         self.QUOTA_PREFIX: str = os.getenv("QUOTA_PREFIX", "quota")
         self.CONFIG_STATE_SYNC_ENABLED: bool = os.getenv(
             "CONFIG_STATE_SYNC_ENABLED", "True"
         ).lower() in ("true", "1", "t")
+        self.config_state_exchange: str = os.getenv("CONFIG_STATE_EXCHANGE", "config_state_exchange")
+        self.config_state_direct_exchange: str = os.getenv("CONFIG_STATE_DIRECT_EXCHANGE", "config_state_direct_exchange")
+        self.config_state_resync_queue: str = os.getenv("CONFIG_STATE_RESYNC_QUEUE", "config_state_resync_queue")
+        self.api_key_hash_secret: str = os.getenv("API_KEY_HASH_SECRET", "")
+        self.config_resync_min_interval_seconds: float = float(os.getenv("CONFIG_RESYNC_MIN_INTERVAL_SECONDS", "10"))
         self.CLIENT_CONFIG: str = os.getenv("CLIENT_CONFIG", "{}")
         self.PROVIDERS_CONFIG: str = os.getenv("PROVIDERS_CONFIG", "{}")
         self.heartbeat_exchange_name: str = os.getenv("RABBITMQ_HEARTBEAT_EXCHANGE", "sms_gateway_heartbeat_exchange")
         self.heartbeat_queue_name: str = os.getenv("RABBITMQ_HEARTBEAT_QUEUE", "sms_heartbeat_queue")
+        self.event_loop_lag_interval_seconds: float = float(os.getenv("EVENT_LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+        self.debug_profile_enabled: bool = os.getenv("DEBUG_PROFILE_ENABLED", "False").lower() in ("true", "1", "t")
+        self.metrics_cache_seconds: float = float(os.getenv("METRICS_CACHE_SECONDS", "5"))
+        self.metrics_max_client_labels: int = int(os.getenv("METRICS_MAX_CLIENT_LABELS", "100"))
         self.metrics_username: str = os.getenv("METRICS_USERNAME", "")
         self.metrics_password: str = os.getenv("METRICS_PASSWORD", "")
 
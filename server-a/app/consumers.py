@@ -1,17 +1,83 @@
 import asyncio
 import json
 import logging
+import time
+from typing import Dict, Optional
 
 import aio_pika
 
-from app.cache import apply_state, save_state_to_file
+from app.cache import (
+    apply_delta,
+    apply_state,
+    confirm_snapshot,
+    get_state_version,
+    save_snapshot_to_file,
+)
 from app.config import get_settings
+from app.load_stats import INSTANCE_ID
 
 logger = logging.getLogger(__name__)
 
 
+def is_unchanged_snapshot(headers: Optional[Dict]) -> bool:
+    """Return ``True`` for a snapshot whose fingerprint header is already applied."""
+
+    headers = headers or {}
+    if headers.get("type", "snapshot") != "snapshot":
+        return False
+    return confirm_snapshot(headers.get("fingerprint"), headers.get("version"))
+
+
+def handle_config_state(payload: Dict) -> bool:
+    """Apply one configuration broadcast.
+
+    Deltas are applied in place; anything else is a full snapshot that
+    replaces the caches and the local snapshot file. Returns ``False`` when a
+    delta could not be applied because of a version gap.
+    """
+
+    if payload.get("type") == "delta":
+        if not apply_delta(payload):
+            logger.warning(
+                "Configuration delta v%s does not follow local v%s; resync needed.",
+                payload.get("version"),
+                get_state_version(),
+            )
+            return False
+        logger.debug("Configuration delta v%s applied.", payload.get("version"))
+        return True
+
+    apply_state(payload)
+    save_snapshot_to_file()
+    logger.info("Configuration state updated from broadcast (v%s).", payload.get("version"))
+    return True
+
+
+class ResyncRequester:
+    """Ask server-b for a full snapshot, at most once per ``min_interval``."""
+
+    def __init__(self, channel: aio_pika.abc.AbstractChannel, queue_name: str, min_interval: float):
+        self._channel = channel
+        self._queue_name = queue_name
+        self._min_interval = min_interval
+        self._last_requested: Optional[float] = None
+
+    async def request(self, reason: str) -> bool:
+        now = time.monotonic()
+        if self._last_requested is not None and now - self._last_requested < self._min_interval:
+            return False
+        self._last_requested = now
+        body = json.dumps({"reason": reason, "version": get_state_version()}).encode()
+        await self._channel.default_exchange.publish(
+            aio_pika.Message(body=body, content_type="application/json"),
+            routing_key=self._queue_name,
+        )
+        logger.info("Requested configuration resync (%s).", reason)
+        return True
+
+
 async def consume_config_state() -> None:
-    """Background task that listens for full configuration state broadcasts."""
+    """Background task that listens for configuration state broadcasts."""
 
     settings = get_settings()
     connection = await aio_pika.connect_robust(
@@ -21,21 +87,44 @@ async def consume_config_state() -> None:
     async with connection:
         channel = await connection.channel()
         exchange = await channel.declare_exchange(
-            "config_state_exchange", aio_pika.ExchangeType.FANOUT, durable=True
+            settings.config_state_exchange, aio_pika.ExchangeType.FANOUT, durable=True
+        )
+        await channel.declare_queue(settings.config_state_resync_queue, durable=True)
+        direct_exchange = await channel.declare_exchange(
+            settings.config_state_direct_exchange, aio_pika.ExchangeType.DIRECT, durable=True
         )
         queue = await channel.declare_queue(exclusive=True)
         await queue.bind(exchange)
+        # Server-b sends a snapshot to this instance alone when the
+        # fingerprint in its heartbeats drifts.
+        await queue.bind(direct_exchange, routing_key=INSTANCE_ID)
+
+        resync = ResyncRequester(
+            channel,
+            settings.config_state_resync_queue,
+            settings.config_resync_min_interval_seconds,
+        )
+        # Deltas published while this instance was down are not replayed, so
+        # start from a fresh snapshot rather than waiting for the next one.
+        await resync.request("startup")
 
         async with queue.iterator() as queue_iter:
             async for message in queue_iter:
                 async with message.process():
                     try:
+                        if is_unchanged_snapshot(message.headers):
+                            logger.debug("Configuration snapshot unchanged; skipped.")
+                            continue
                         payload = json.loads(message.body.decode())
-                        apply_state(payload)
-                        save_state_to_file(payload)
-                        logger.info("Configuration state updated from broadcast.")
+                        if not handle_config_state(payload):
+                            await resync.request("version gap")
                     except Exception:
                         logger.exception("Failed to process configuration state message")
 
 
-__all__ = ["consume_config_state"]
+__all__ = [
+    "consume_config_state",
+    "handle_config_state",
+    "is_unchanged_snapshot",
+    "ResyncRequester",
+]
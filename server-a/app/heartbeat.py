@@ -1,7 +1,7 @@
 import asyncio
-import hashlib
 import json
 import logging
+import time
 from datetime import datetime
 from typing import Optional
 
@@ -10,6 +10,7 @@ from aio_pika import Message, DeliveryMode
 
 from app import cache
 from app.config import get_settings
+from app.load_stats import INSTANCE_ID, load_stats
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -19,23 +20,11 @@ HEARTBEAT_QUEUE_NAME = settings.heartbeat_queue_name
 
 
 def compute_config_cache_fingerprint() -> Optional[str]:
-    """Return the SHA256 fingerprint of the config cache file if available."""
-    cache_path = cache.CONFIG_CACHE_PATH
-    try:
-        with cache_path.open("r", encoding="utf-8") as cache_file:
-            payload = json.load(cache_file)
-    except FileNotFoundError:
-        logger.debug("Config cache file missing when computing fingerprint.")
-        return None
-    except json.JSONDecodeError as exc:
-        logger.warning("Unable to parse config cache for fingerprint: %s", exc)
-        return None
-    except OSError as exc:
-        logger.warning("Unable to read config cache for fingerprint: %s", exc)
-        return None
-
-    serialized = json.dumps(payload, sort_keys=True, separators=(",", ":"))
-    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+    """Return the fingerprint of the configuration state being served.
+
+    Maintained as changes are applied (see ``app.cache``), so this is free.
+    """
+    return cache.current_snapshot().fingerprint
 
 
 def _refresh_heartbeat_names() -> None:
@@ -45,76 +34,76 @@ def _refresh_heartbeat_names() -> None:
     HEARTBEAT_QUEUE_NAME = settings.heartbeat_queue_name
 
 
-async def send_heartbeat():
+async def declare_heartbeat_topology(channel: aio_pika.abc.AbstractChannel) -> aio_pika.abc.AbstractExchange:
+    """Declare the heartbeat exchange and queue on ``channel``; returns the exchange."""
+
+    _refresh_heartbeat_names()
+    exchange = await channel.declare_exchange(
+        HEARTBEAT_EXCHANGE_NAME,
+        aio_pika.ExchangeType.DIRECT,
+        durable=True,
+    )
+    queue = await channel.declare_queue(HEARTBEAT_QUEUE_NAME, durable=True)
+    await queue.bind(exchange, routing_key=HEARTBEAT_QUEUE_NAME)
+    return exchange
+
+
+def build_heartbeat_payload() -> dict:
+    return {
+        "service": settings.app_name,
+        "instance": INSTANCE_ID,
+        "timestamp": datetime.utcnow().isoformat(),
+        "config_cache_fingerprint": compute_config_cache_fingerprint(),
+        "load": load_stats.as_dict(),
+    }
+
+
+async def send_heartbeat(exchange: aio_pika.abc.AbstractExchange) -> None:
     """
-    Sends a heartbeat message to a dedicated RabbitMQ queue.
-    Includes service name, timestamp, and config fingerprints.
+    Publishes one heartbeat on ``exchange`` and waits for the broker confirm.
+    Includes service name, timestamp, config fingerprint and load stats.
     """
-    connection = None
-    try:
-        connection = await aio_pika.connect_robust(settings.RABBITMQ_URL)
-        async with connection.channel() as channel:
-            _refresh_heartbeat_names()
-
-            exchange = await channel.declare_exchange(
-                HEARTBEAT_EXCHANGE_NAME,
-                aio_pika.ExchangeType.DIRECT,
-                durable=True,
-            )
-
-            queue = await channel.declare_queue(HEARTBEAT_QUEUE_NAME, durable=True)
-
-            await queue.bind(exchange, routing_key=HEARTBEAT_QUEUE_NAME)
-
-            heartbeat_payload = {
-                "service": settings.app_name,
-                "timestamp": datetime.utcnow().isoformat(),
-                "config_cache_fingerprint": compute_config_cache_fingerprint(),
-            }
-
-            message_body = json.dumps(heartbeat_payload).encode('utf-8')
-            message = Message(
-                message_body,
-                content_type="application/json",
-                delivery_mode=DeliveryMode.PERSISTENT
-            )
-            
-            await exchange.publish(message, routing_key=HEARTBEAT_QUEUE_NAME)
-            
-            logger.debug("Heartbeat sent successfully.", extra={"service": settings.app_name})
-    except Exception as e:
-        logger.error(f"Failed to send heartbeat to RabbitMQ: {e}")
-    finally:
-        if connection:
-            await connection.close()
-
-async def start_heartbeat_task():
-    """Run the periodic heartbeat sender until cancelled."""
-
-    async def _cancellable_sleep(delay: float) -> None:
-        try:
-            await asyncio.sleep(delay)
-        except asyncio.CancelledError:
-            raise
-
-    logger.info(
-        "Starting heartbeat task with interval: %s seconds.",
-        settings.heartbeat_interval_seconds,
+    message = Message(
+        json.dumps(build_heartbeat_payload()).encode('utf-8'),
+        content_type="application/json",
+        delivery_mode=DeliveryMode.NOT_PERSISTENT,
+        # Heartbeats are only useful while fresh; without a consumer they
+        # expire instead of piling up in the durable queue.
+        expiration=settings.heartbeat_message_ttl_seconds,
     )
+    started = time.monotonic()
+    await exchange.publish(message, routing_key=HEARTBEAT_QUEUE_NAME)
+    load_stats.record_publish_confirm(time.monotonic() - started)
+    logger.debug("Heartbeat sent successfully.", extra={"service": settings.app_name})
+
+
+async def start_heartbeat_task(connection: aio_pika.abc.AbstractConnection):
+    """Publish heartbeats on a dedicated channel of ``connection`` until cancelled.
+
+    The channel and topology are set up once; the robust connection restores
+    them after a reconnect.
+    """
+
+    interval = settings.heartbeat_interval_seconds
+
+    logger.info("Starting heartbeat task with interval: %s seconds.", interval)
 
     try:
+        channel = await connection.channel(publisher_confirms=True)
+        exchange = await declare_heartbeat_topology(channel)
         while True:
+            delay = interval
             try:
-                await send_heartbeat()
+                await send_heartbeat(exchange)
             except asyncio.CancelledError:
                 raise
             except Exception as e:
                 logger.error(
-                    "Heartbeat task encountered an error: %s. Retrying after backoff.",
+                    "Failed to send heartbeat to RabbitMQ: %s. Retrying after backoff.",
                     e,
                 )
-                await _cancellable_sleep(min(settings.heartbeat_interval_seconds * 2, 300))
-            await _cancellable_sleep(settings.heartbeat_interval_seconds)
+                delay = min(interval * 2, 300)
+            await asyncio.sleep(delay)
     except asyncio.CancelledError:
         logger.info("Heartbeat task cancellation requested; exiting background loop.")
         raise
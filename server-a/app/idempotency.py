@@ -3,8 +3,11 @@ import json
 from typing import Optional
 from redis.asyncio import Redis
 from fastapi import Request, Response, HTTPException, status, Header
+from app.auth import request_key_hash
+from app.cache import key_id
 from app.config import get_settings
 from app.schemas import ErrorResponse
+from app.timing import stage
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -28,16 +31,21 @@ async def idempotency_middleware(request: Request, call_next):
     # The idempotency check is skipped for such invalid requests.
     if not client_api_key:
         return await call_next(request)
-    redis_key = f"idem:{client_api_key}:{idempotency_key}"
+    # Keyed by the full API key hash: the raw key never reaches Redis, and
+    # unlike ``key_id`` the hash does not collide between clients.
+    key_hash = request_key_hash(request, client_api_key)
+    redis_key = f"idem:{key_hash.hex()}:{idempotency_key}"
+    client_key_id = key_id(key_hash)
     redis_client = await get_redis_client()
 
     # Try to get cached response
-    cached_response_str = await redis_client.get(redis_key)
+    with stage("idempotency_lookup"):
+        cached_response_str = await redis_client.get(redis_key)
     if cached_response_str:
         cached_data = json.loads(cached_response_str)
         logger.info(
             "Returning cached response for idempotency key.",
-            extra={"idempotency_key": idempotency_key, "client_api_key": client_api_key, "cached_status_code": cached_data['status_code']}
+            extra={"idempotency_key": idempotency_key, "client_key_id": client_key_id, "cached_status_code": cached_data['status_code']}
         )
         if cached_data['status_code'] >= 400:
             await redis_client.expire(redis_key, settings.idempotency_ttl_seconds)
@@ -77,20 +85,21 @@ async def idempotency_middleware(request: Request, call_next):
     # In a concurrent scenario, the first request to set the key will succeed,
     # and subsequent concurrent requests will find the key and return the cached response.
     # We set the TTL regardless of SETNX result to ensure expiration.
-    await redis_client.set(
-        redis_key,
-        json.dumps(cache_data),
-        ex=settings.idempotency_ttl_seconds,
-        nx=True # Only set if key does not exist
-    )
-    # If the key was already set by a concurrent request, we still want to update its TTL
-    # to ensure it respects the configured IDEMPOTENCY_TTL_SECONDS.
-    # This handles cases where a concurrent request might have set it with a default/short TTL.
-    await redis_client.expire(redis_key, settings.idempotency_ttl_seconds)
+    with stage("idempotency_store"):
+        await redis_client.set(
+            redis_key,
+            json.dumps(cache_data),
+            ex=settings.idempotency_ttl_seconds,
+            nx=True # Only set if key does not exist
+        )
+        # If the key was already set by a concurrent request, we still want to update its TTL
+        # to ensure it respects the configured IDEMPOTENCY_TTL_SECONDS.
+        # This handles cases where a concurrent request might have set it with a default/short TTL.
+        await redis_client.expire(redis_key, settings.idempotency_ttl_seconds)
 
     logger.info(
         "Cached response for idempotency key.",
-        extra={"idempotency_key": idempotency_key, "client_api_key": client_api_key, "status_code": response.status_code}
+        extra={"idempotency_key": idempotency_key, "client_key_id": client_key_id, "status_code": response.status_code}
     )
 
     return response
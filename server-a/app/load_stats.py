@@ -0,0 +1,47 @@
+"""Runtime load figures of this process, reported in heartbeats.
+
+Server B uses them to tell busy replicas from idle ones, so they are cheap
+point-in-time values rather than Prometheus histograms.
+"""
+import os
+import socket
+
+# Weight of the newest sample in the publish-confirm moving average.
+_EWMA_WEIGHT = 0.2
+
+
+class LoadStats:
+    __slots__ = ("in_flight", "event_loop_lag_seconds", "publish_confirm_seconds")
+
+    def __init__(self):
+        self.in_flight = 0
+        self.event_loop_lag_seconds = 0.0
+        self.publish_confirm_seconds = 0.0
+
+    def record_publish_confirm(self, seconds: float) -> None:
+        """Fold one publish round trip (publish until broker confirm) into the average."""
+        if self.publish_confirm_seconds:
+            seconds = (1 - _EWMA_WEIGHT) * self.publish_confirm_seconds + _EWMA_WEIGHT * seconds
+        self.publish_confirm_seconds = seconds
+
+    def as_dict(self) -> dict:
+        return {
+            "in_flight_requests": self.in_flight,
+            "event_loop_lag_seconds": round(self.event_loop_lag_seconds, 6),
+            "publish_confirm_seconds": round(self.publish_confirm_seconds, 6),
+        }
+
+
+load_stats = LoadStats()
+
+# Identifies this worker process among all server-a replicas.
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def track_in_flight(request, call_next):
+    """HTTP middleware counting requests being handled by this process."""
+    load_stats.in_flight += 1
+    try:
+        return await call_next(request)
+    finally:
+        load_stats.in_flight -= 1
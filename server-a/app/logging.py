@@ -1,58 +1,190 @@
+"""JSON logging that keeps log I/O off the request path.
+
+Records are put on a bounded queue by a ``QueueHandler`` and formatted and
+written to stdout by a ``QueueListener`` thread. Before a record is queued it
+can be dropped by two filters:
+
+* ``LogSampler`` keeps a fraction (``LOG_INFO_SAMPLE_RATE``) of INFO and
+  DEBUG records from ``app.*`` loggers. Records of one request share a
+  ``tracking_id`` and are kept or dropped together.
+* ``RateLimitFilter`` caps every logger at ``LOG_RATE_LIMIT_PER_SECOND``
+  records per second (token bucket; 0 disables it). CRITICAL is never
+  limited.
+
+Drops, including records lost because the queue was full, are counted in
+``sms_log_records_dropped_total{reason}``.
+"""
+import atexit
+import json
 import logging
-from pythonjsonlogger import jsonlogger
+import queue
+import random
 import sys
-from typing import Optional
-
-class CustomJsonFormatter(jsonlogger.JsonFormatter):
-    def add_fields(self, log_record, record, message_dict):
-        super().add_fields(log_record, record, message_dict)
-        if not log_record.get('service'):
-            log_record['service'] = 'server-a'
-        if not log_record.get('level'):
-            log_record['level'] = record.levelname
-        if not log_record.get('timestamp'):
-            log_record['timestamp'] = self.formatTime(record, self.datefmt)
-        if 'message' not in log_record:
-            log_record['message'] = record.getMessage()
-
-        # Add tracking_id and client_api_key if available in extra
-        if hasattr(record, 'tracking_id'):
-            log_record['tracking_id'] = record.tracking_id
-        if hasattr(record, 'client_api_key'):
-            log_record['client_api_key'] = record.client_api_key
-
-def setup_logging(level: str = "INFO"):
+import threading
+import time
+import zlib
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional
+
+from app.metrics import LOG_RECORDS_DROPPED_TOTAL
+
+# Attributes every LogRecord has; anything else was passed in ``extra``.
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: fixed fields first, then the ``extra`` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "timestamp": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "service": getattr(record, "service", None) or "server-a",
+            "message": record.getMessage(),
+            "tracking_id": getattr(record, "tracking_id", None),
+            "client_key_id": getattr(record, "client_key_id", None),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and key not in data:
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class LogSampler(logging.Filter):
+    """Keep ``rate`` of the INFO and DEBUG records of loggers under ``prefix``."""
+
+    def __init__(self, rate: float, prefix: str = "app"):
+        super().__init__()
+        self.rate = rate
+        self.prefix = prefix
+        self._threshold = int(rate * 0xFFFFFFFF)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or record.levelno > logging.INFO:
+            return True
+        if record.name != self.prefix and not record.name.startswith(self.prefix + "."):
+            return True
+        tracking_id = getattr(record, "tracking_id", None)
+        if tracking_id:
+            keep = zlib.crc32(str(tracking_id).encode()) <= self._threshold
+        else:
+            keep = random.random() < self.rate
+        if not keep:
+            LOG_RECORDS_DROPPED_TOTAL.labels(reason="sampled").inc()
+        return keep
+
+
+class RateLimitFilter(logging.Filter):
+    """Allow each logger ``per_second`` records per second, with bursts of the same size."""
+
+    def __init__(self, per_second: float):
+        super().__init__()
+        self.per_second = per_second
+        self._buckets: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.per_second <= 0 or record.levelno >= logging.CRITICAL:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(record.name)
+            if bucket is None:
+                bucket = self._buckets[record.name] = [self.per_second, now]
+            tokens = min(self.per_second, bucket[0] + (now - bucket[1]) * self.per_second)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                LOG_RECORDS_DROPPED_TOTAL.labels(reason="rate_limited").inc()
+                return False
+            bucket[0] = tokens - 1
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """``QueueHandler`` that drops records when the queue is full instead of failing.
+
+    ``prepare`` only resolves the message arguments and exception text, so
+    JSON formatting happens on the listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED_TOTAL.labels(reason="queue_full").inc()
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging(
+    level: str = "INFO",
+    queue_size: int = 10000,
+    info_sample_rate: float = 1.0,
+    rate_limit_per_second: float = 0,
+) -> QueueListener:
+    """Route the root and uvicorn loggers through a queue to a stdout writer thread."""
+    global _listener
+
+    stop_logging()
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+    handler.addFilter(LogSampler(info_sample_rate))
+    handler.addFilter(RateLimitFilter(rate_limit_per_second))
+
     logger = logging.getLogger()
     logger.setLevel(level)
 
     # Remove existing handlers to prevent duplicate logs in some environments (e.g., Gunicorn)
-    if logger.handlers:
-        for handler in logger.handlers:
-            logger.removeHandler(handler)
-
-    handler = logging.StreamHandler(sys.stdout)
-    formatter = CustomJsonFormatter(
-        '%(timestamp)s %(level)s %(service)s %(message)s %(tracking_id)s %(client_api_key)s'
-    )
-    handler.setFormatter(formatter)
+    for existing in list(logger.handlers):
+        logger.removeHandler(existing)
     logger.addHandler(handler)
 
-    # Configure uvicorn's access logger to use our JSON formatter
-    uvicorn_access_logger = logging.getLogger("uvicorn.access")
-    uvicorn_access_logger.handlers.clear() # Clear default handlers
-    uvicorn_access_logger.addHandler(handler)
-    uvicorn_access_logger.propagate = False # Prevent logs from going to root logger again
+    # Route uvicorn's access and error logs through the same queue
+    for name in ("uvicorn.access", "uvicorn.error"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear() # Clear default handlers
+        uvicorn_logger.addHandler(handler)
+        uvicorn_logger.propagate = False # Prevent logs from going to root logger again
+
+    _listener = QueueListener(handler.queue, stream_handler)
+    _listener.start()
+    # Flush what is still queued when the worker exits.
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging() -> None:
+    """Write out the queued records and stop the writer thread."""
+    global _listener
+
+    atexit.unregister(stop_logging)
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
 
-    # Configure uvicorn's error logger to use our JSON formatter
-    uvicorn_error_logger = logging.getLogger("uvicorn.error")
-    uvicorn_error_logger.handlers.clear() # Clear default handlers
-    uvicorn_error_logger.addHandler(handler)
-    uvicorn_error_logger.propagate = False # Prevent logs from going to root logger again
 
 # Example usage (can be called from main.py)
 if __name__ == "__main__":
     setup_logging("DEBUG")
     logger = logging.getLogger(__name__)
     logger.info("This is a test log message.")
-    logger.warning("This is a warning with extra fields.", extra={'tracking_id': '123-abc', 'client_api_key': 'test-client'})
-    logger.error("An error occurred.")
\ No newline at end of file
+    logger.warning("This is a warning with extra fields.", extra={'tracking_id': '123-abc', 'client_key_id': 'test-client'})
+    logger.error("An error occurred.")
+    stop_logging()
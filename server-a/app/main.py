@@ -15,7 +15,7 @@ import aio_pika
 from fastapi import FastAPI, Depends, HTTPException, status, Request, Body
 from fastapi.exceptions import RequestValidationError
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from redis.asyncio import Redis
 from prometheus_client import Summary
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
@@ -24,6 +24,7 @@ from app.config import get_settings
 from app.logging import setup_logging
 from app.metrics import (
     metrics_content,
+    refresh_metrics_periodically,
     SMS_SEND_REQUESTS_TOTAL,
     SMS_SEND_REQUEST_LATENCY_SECONDS,
     SMS_SEND_REQUEST_SUCCESS_TOTAL,
@@ -36,13 +37,23 @@ from app.provider_gate import provider_gate
 from app.quota import enforce_daily_quota
 from app.rabbit import publish_sms_message, get_rabbitmq_connection
 from app.consumers import consume_config_state
-from app.cache import load_state_from_file, apply_state, save_state_to_file
+from app.cache import load_state_from_file, apply_state, save_snapshot_to_file
 from app.heartbeat import start_heartbeat_task
+from app.load_stats import track_in_flight
+from app.timing import monitor_event_loop_lag, profile_event_loop, stage
 
+settings = get_settings()
 # Setup logging as early as possible
-setup_logging()
+setup_logging(
+    settings.log_level,
+    queue_size=settings.log_queue_size,
+    info_sample_rate=settings.log_info_sample_rate,
+    rate_limit_per_second=settings.log_rate_limit_per_second,
+)
 logger = logging.getLogger(__name__)
-settings = get_settings()
+
+# Longest sampling window accepted by /debug/profile.
+MAX_PROFILE_SECONDS = 60
 
 # Global Redis and RabbitMQ connections
 redis_client: Optional[Redis] = None
@@ -72,6 +83,12 @@ async def lifespan(app: FastAPI):
 
     logger.info("Starting up Server A application...")
 
+    if not settings.api_key_hash_secret:
+        # Clients are looked up by an HMAC of their API key; with a secret that
+        # differs from server-b's, no broadcast key would ever match.
+        logger.critical("API_KEY_HASH_SECRET is not set; it must match server-b's API_KEY_HASH_SECRET.")
+        raise RuntimeError("API_KEY_HASH_SECRET is not set")
+
     # Initialize Redis
     try:
         redis_client = await get_redis_client()
@@ -86,10 +103,6 @@ async def lifespan(app: FastAPI):
         rabbitmq_connection = await get_rabbitmq_connection()
         rabbitmq_channel = await rabbitmq_connection.channel()
         await rabbitmq_channel.declare_exchange(settings.outbound_sms_exchange, aio_pika.ExchangeType.TOPIC, durable=True)
-        
-
-        await rabbitmq_channel.declare_exchange(settings.heartbeat_exchange_name, aio_pika.ExchangeType.DIRECT, durable=True)
-        await rabbitmq_channel.declare_queue(settings.heartbeat_queue_name, durable=True)
         logger.info("RabbitMQ connection and channel initialized.")
     except Exception as e:
         logger.critical(f"Failed to connect to RabbitMQ on startup: {e}", exc_info=True)
@@ -99,12 +112,28 @@ async def lifespan(app: FastAPI):
 
     # Start background tasks
     heartbeat_task = asyncio.create_task(
-        start_heartbeat_task(),
+        start_heartbeat_task(rabbitmq_connection),
         name="heartbeat-task",
     )
     background_tasks.append(heartbeat_task)
     logger.info("Heartbeat task started.")
 
+    if settings.event_loop_lag_interval_seconds > 0:
+        background_tasks.append(
+            asyncio.create_task(
+                monitor_event_loop_lag(settings.event_loop_lag_interval_seconds),
+                name="event-loop-lag-monitor",
+            )
+        )
+
+    if settings.metrics_cache_seconds > 0:
+        background_tasks.append(
+            asyncio.create_task(
+                refresh_metrics_periodically(settings.metrics_cache_seconds),
+                name="metrics-refresh",
+            )
+        )
+
     # Warm caches from local file OR bootstrap from environment variables
     if load_state_from_file():
         logger.info("Configuration cache warmed from local file.")
@@ -114,9 +143,8 @@ async def lifespan(app: FastAPI):
             client_config = json.loads(settings.CLIENT_CONFIG)
             providers_config = json.loads(settings.PROVIDERS_CONFIG)
             if client_config and providers_config:
-                initial_state = {"users": client_config, "providers": providers_config}
-                apply_state(initial_state)
-                save_state_to_file(initial_state)
+                apply_state({"users": client_config, "providers": providers_config})
+                save_snapshot_to_file()
                 logger.info("Successfully bootstrapped initial config from environment.")
             else:
                 logger.warning("Initial configs in environment are empty. Waiting for state broadcast.")
@@ -172,6 +200,7 @@ app = FastAPI(
 app.json_encoder = custom_json_serializer
 
 app.middleware("http")(idempotency_middleware)
+app.middleware("http")(track_in_flight)
 
 security = HTTPBasic()
 
@@ -227,7 +256,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
         f"HTTP Exception: {exc.status_code} - {error_response.error_code}",
         extra={
             "tracking_id": tracking_id,
-            "client_api_key": getattr(request.state, 'client', None).api_key if hasattr(request.state, 'client') and request.state.client else None,
+            "client_key_id": getattr(request.state, 'client', None).key_id if hasattr(request.state, 'client') and request.state.client else None,
             "error_details": detail_payload
         }
     )
@@ -262,6 +291,7 @@ async def send_sms(
     try:
         sms_request = SendSmsRequest(**payload)
         sms_request.validate_phone()
+        sms_request.validate_priority()
     except (TypeError, ValueError) as e:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
@@ -270,22 +300,26 @@ async def send_sms(
 
     logger.info(
         "Received SMS send request.",
-        extra={"tracking_id": str(tracking_id), "client_api_key": client.api_key, "to": sms_request.to}
+        extra={"tracking_id": str(tracking_id), "client_key_id": client.key_id, "to": sms_request.to}
     )
 
     try:
-        effective_providers = provider_gate.process_providers(request, sms_request.providers)
-        await enforce_daily_quota(request)
-        await publish_sms_message(
-            user_id=client.user_id,
-            client_key=client.api_key,
-            to=sms_request.to,
-            text=sms_request.text,
-            ttl_seconds=sms_request.ttl_seconds,
-            providers_original=sms_request.providers,
-            providers_effective=effective_providers,
-            tracking_id=tracking_id
-        )
+        with stage("provider_gate"):
+            effective_providers = provider_gate.process_providers(request, sms_request.providers)
+        with stage("quota"):
+            await enforce_daily_quota(request)
+        with stage("publish"):
+            await publish_sms_message(
+                user_id=client.user_id,
+                client_key=client.key_id,
+                to=sms_request.to,
+                text=sms_request.text,
+                ttl_seconds=sms_request.ttl_seconds,
+                providers_original=sms_request.providers,
+                providers_effective=effective_providers,
+                tracking_id=tracking_id,
+                priority=sms_request.priority,
+            )
         response_content = SendSmsResponse(
             success=True,
             message="Request accepted for processing.",
@@ -301,7 +335,7 @@ async def send_sms(
         SMS_SEND_REQUEST_ERROR_TOTAL.inc()
         logger.exception(
             "Internal server error during SMS send.",
-            extra={"tracking_id": str(tracking_id), "client_api_key": client.api_key, "error": str(e)}
+            extra={"tracking_id": str(tracking_id), "client_key_id": client.key_id, "error": str(e)}
         )
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -313,7 +347,7 @@ async def send_sms(
         SMS_SEND_REQUEST_LATENCY_SECONDS.observe(latency)
         logger.info(
             "SMS send request processed.",
-            extra={"tracking_id": str(tracking_id), "client_api_key": client.api_key, "latency_seconds": latency}
+            extra={"tracking_id": str(tracking_id), "client_key_id": client.key_id, "latency_seconds": latency}
         )
 
 @app.get("/healthz", status_code=status.HTTP_200_OK)
@@ -340,3 +374,18 @@ async def readyz():
 @app.get("/metrics", status_code=status.HTTP_200_OK)
 async def get_metrics(_: None = Depends(require_metrics_auth)):
     return metrics_content()
+
+@app.get("/debug/profile", status_code=status.HTTP_200_OK)
+async def debug_profile(seconds: float = 10, _: None = Depends(require_metrics_auth)):
+    """Sample the event loop thread for ``seconds`` and return collapsed stacks."""
+    if not settings.debug_profile_enabled:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={"error_code": "NOT_FOUND", "message": "Profiling is disabled."},
+        )
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={"error_code": "INVALID_PAYLOAD", "message": f"seconds must be in (0, {MAX_PROFILE_SECONDS}]."},
+        )
+    return PlainTextResponse(await profile_event_loop(seconds))
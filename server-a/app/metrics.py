@@ -1,10 +1,13 @@
 from prometheus_client import Counter, Gauge, Histogram, generate_latest, REGISTRY
 from prometheus_client.core import CollectorRegistry
 from fastapi import Response
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
+import asyncio
 import logging
+import time
 
-from app.cache import PROVIDER_CONFIG_CACHE
+from app.cache import current_snapshot
+from app.config import ClientConfig, get_settings
 
 logger = logging.getLogger(__name__)
 
@@ -66,6 +69,27 @@ SMS_SEND_REQUEST_LATENCY_SECONDS = Histogram(
     'Latency of SMS send requests in seconds.',
     registry=APP_REGISTRY
 )
+# Breakdown of the send latency (see app.timing); buckets start at 100us
+# because most stages are in-memory lookups or a single Redis round trip.
+SMS_SEND_STAGE_LATENCY_SECONDS = Histogram(
+    'sms_send_stage_latency_seconds',
+    'Latency of each stage of an SMS send request in seconds.',
+    ['stage'],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+    registry=APP_REGISTRY
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    'sms_event_loop_lag_seconds',
+    'Delay between when the event loop should have woken a task and when it did.',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+    registry=APP_REGISTRY
+)
+LOG_RECORDS_DROPPED_TOTAL = Counter(
+    'sms_log_records_dropped_total',
+    'Log records not written, by reason (sampled, rate_limited, queue_full).',
+    ['reason'],
+    registry=APP_REGISTRY
+)
 SMS_SEND_REQUEST_SUCCESS_TOTAL = Counter(
     'sms_send_request_success_total',
     'Total number of successful SMS send requests.',
@@ -79,7 +103,7 @@ SMS_SEND_REQUEST_ERROR_TOTAL = Counter(
 
 def initialize_provider_metrics():
     """Initializes provider-specific gauges based on current cache state."""
-    providers_config = PROVIDER_CONFIG_CACHE
+    providers_config = current_snapshot().providers
     SMS_PROVIDERS_CONFIG_TOTAL.set(len(providers_config))
 
     for provider_name, config in providers_config.items():
@@ -87,9 +111,85 @@ def initialize_provider_metrics():
         SMS_PROVIDER_OPERATIONAL.labels(provider=provider_name).set(1 if config.is_operational else 0)
     logger.info("Provider metrics initialized.")
 
-def metrics_content() -> Response:
-    """Returns Prometheus metrics in the OpenMetrics text exposition format."""
+# ``client`` label of requests without an authenticated client, and of
+# clients beyond ``METRICS_MAX_CLIENT_LABELS``.
+UNKNOWN_CLIENT_LABEL = "unknown"
+OVERFLOW_CLIENT_LABEL = "other"
+
+
+class ClientLabels:
+    """Bounded ``client`` label values and pre-bound children of per-client metrics.
+
+    Clients are labelled by ``user_id``. The first ``max_clients`` clients
+    seen get their own series; later ones share ``OVERFLOW_CLIENT_LABEL`` so
+    the number of series stays bounded however many API keys exist.
+    """
+
+    def __init__(self, max_clients: int):
+        self.max_clients = max_clients
+        self._labels: Dict[int, str] = {}
+        self._children: Dict[Tuple, Any] = {}
+
+    def label(self, client: Optional[ClientConfig]) -> str:
+        if client is None:
+            return UNKNOWN_CLIENT_LABEL
+        label = self._labels.get(client.user_id)
+        if label is None:
+            if len(self._labels) >= self.max_clients:
+                return OVERFLOW_CLIENT_LABEL
+            label = self._labels[client.user_id] = str(client.user_id)
+        return label
+
+    def child(self, metric, client: Optional[ClientConfig], **labels: str):
+        """Return ``metric.labels(client=..., **labels)``, cached."""
+        key = (metric, self.label(client), *labels.values())
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = metric.labels(client=key[1], **labels)
+        return child
+
+
+client_labels = ClientLabels(get_settings().metrics_max_client_labels)
+
+
+class _Exposition:
+    __slots__ = ("payload", "generated_at")
+
+    def __init__(self):
+        self.payload: Optional[bytes] = None
+        self.generated_at = 0.0
+
+
+_exposition = _Exposition()
+
+
+def refresh_metrics_payload() -> bytes:
+    """Render the registry and keep the result for ``metrics_content``."""
     payload = generate_latest(APP_REGISTRY)
+    _exposition.payload = payload
+    _exposition.generated_at = time.monotonic()
+    return payload
+
+
+async def refresh_metrics_periodically(interval: float) -> None:
+    """Re-render the exposition every ``interval`` seconds off the event loop."""
+    while True:
+        await asyncio.to_thread(refresh_metrics_payload)
+        await asyncio.sleep(interval)
+
+
+def metrics_content() -> Response:
+    """Returns Prometheus metrics in the OpenMetrics text exposition format.
+
+    Serves the payload rendered by ``refresh_metrics_periodically`` while it
+    is fresh (up to three refresh intervals old), so a scrape does not render
+    the registry on the event loop. Renders inline when caching is disabled
+    or the refresher is not running.
+    """
+    interval = get_settings().metrics_cache_seconds
+    payload = _exposition.payload
+    if interval <= 0 or payload is None or time.monotonic() - _exposition.generated_at > 3 * interval:
+        payload = refresh_metrics_payload()
     return Response(
         content=payload,
         media_type="text/plain; version=0.0.4; charset=utf-8",
@@ -1,167 +1,231 @@
+import dataclasses
+import functools
 import logging
-from typing import List, Optional, Tuple
+from typing import Callable, List, Optional, Tuple
 from fastapi import HTTPException, status, Request
 
 from app import config
-from app.cache import PROVIDER_ALIAS_MAP_CACHE, PROVIDER_CONFIG_CACHE
+from app.cache import ConfigSnapshot, current_snapshot
 from app.config import ProviderConfig
 from app.metrics import (
     SMS_REQUEST_REJECTED_UNKNOWN_PROVIDER_TOTAL,
     SMS_REQUEST_REJECTED_PROVIDER_DISABLED_TOTAL,
-    SMS_REQUEST_REJECTED_NO_PROVIDER_AVAILABLE_TOTAL
+    SMS_REQUEST_REJECTED_NO_PROVIDER_AVAILABLE_TOTAL,
+    client_labels,
 )
 
 logger = logging.getLogger(__name__)
 
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class GateDecision:
+    """Outcome of the gate for one requested-provider list under one snapshot.
+
+    Holds nothing request-specific, so it is computed once and reused; the
+    per-client metrics and logs are emitted from it on every request.
+    """
+
+    # "bypass" (gate disabled), "smart", "exclusive" or "failover".
+    mode: str
+    # Canonical names the message may be sent through; empty for smart selection.
+    providers: Tuple[str, ...] = ()
+    # Requested names with empty entries dropped.
+    requested: Tuple[str, ...] = ()
+    unknown: Tuple[str, ...] = ()
+    disabled: Tuple[str, ...] = ()
+    error_code: Optional[str] = None
+    status_code: Optional[int] = None
+    message: Optional[str] = None
+
+
 class ProviderGate:
     def __init__(self):
         self.settings = config.get_settings()
-        # Reference global caches so they stay updated when refreshed
-        self.provider_alias_map = PROVIDER_ALIAS_MAP_CACHE
-        self.providers_config = PROVIDER_CONFIG_CACHE
+        # Decisions memoized for ``_decisions_snapshot``; a new snapshot starts
+        # with an empty table, so a config change never serves a stale decision.
+        self._decisions_snapshot: Optional[ConfigSnapshot] = None
+        self._decide_cached: Optional[Callable[..., GateDecision]] = None
 
-    def _get_canonical_provider_name(self, provider_name: str) -> Optional[str]:
+    def _get_canonical_provider_name(self, snapshot: ConfigSnapshot, provider_name: str) -> Optional[str]:
         """Returns the canonical provider name using normalized keys with a lowercase fallback."""
         key = config.normalize_provider_key(provider_name)
-        canonical = self.provider_alias_map.get(key)
+        canonical = snapshot.provider_aliases.get(key)
         if canonical is None:
-            canonical = self.provider_alias_map.get(provider_name.lower())
+            canonical = snapshot.provider_aliases.get(provider_name.lower())
         return canonical
 
-    def _is_provider_active_and_operational(self, canonical_name: str) -> bool:
+    def _is_provider_active_and_operational(self, snapshot: ConfigSnapshot, canonical_name: str) -> bool:
         """Checks if a provider is active and operational."""
-        config = self.providers_config.get(canonical_name)
+        config = snapshot.providers.get(canonical_name)
         return config is not None and config.is_active and config.is_operational
 
-    def process_providers(self, request: Request, requested_providers: Optional[List[str]]) -> List[str]:
-        """
-        Validates and filters the list of requested providers based on configuration and rules.
-        Emits metrics and logs for rejections.
-        """
-        client_api_key = getattr(request.state, 'client', None).api_key if hasattr(request.state, 'client') else "unknown"
-
-        # Normalize requested providers: treat empty/whitespace strings as not provided
-        normalized_requested: Optional[List[str]]
-        if requested_providers is None:
-            normalized_requested = None
-        else:
-            # Keep only non-empty, non-whitespace provider names
-            cleaned = [p.strip() for p in requested_providers if isinstance(p, str) and p.strip()]
-            normalized_requested = cleaned if cleaned else None
+    def _decide(self, snapshot: ConfigSnapshot, enabled: bool, requested_providers: Optional[Tuple]) -> GateDecision:
+        """Evaluates the gate rules for one requested-provider list."""
+        # Treat empty/whitespace strings as not provided
+        requested = tuple(
+            p.strip() for p in requested_providers or () if isinstance(p, str) and p.strip()
+        )
+
+        if not enabled:
+            # Map requested providers to canonical names without further validation
+            canonical = [(p, self._get_canonical_provider_name(snapshot, p)) for p in requested]
+            return GateDecision(
+                mode="bypass",
+                providers=tuple(name for _, name in canonical if name),
+                requested=requested,
+                unknown=tuple(p for p, name in canonical if not name),
+            )
 
-        if not self.settings.PROVIDER_GATE_ENABLED:
-            logger.info("Provider Gate is disabled. Bypassing provider validation.")
-            # If disabled, and providers were requested, map them to canonical names without further validation
-            if normalized_requested:
-                effective_providers = []
-                for p in normalized_requested:
-                    canonical_name = self._get_canonical_provider_name(p)
-                    if canonical_name:
-                        effective_providers.append(canonical_name)
-                    else:
-                        logger.warning(
-                            "Provider Gate disabled, but unknown provider requested.",
-                            extra={"client_api_key": client_api_key, "provider": p}
-                        )
-                return effective_providers
-            return [] # If disabled and no providers requested, return empty list for smart selection
-
-        if not normalized_requested:
+        if not requested:
             # Smart Selection
-            active_operational_providers = [
-                name for name, config in self.providers_config.items()
-                if config.is_active and config.is_operational
-            ]
-            if not active_operational_providers:
-                SMS_REQUEST_REJECTED_NO_PROVIDER_AVAILABLE_TOTAL.labels(client=client_api_key).inc()
-                logger.warning(
-                    "Provider Gate rejected: No active and operational providers available for smart selection.",
-                    extra={"client_api_key": client_api_key, "error_code": "NO_PROVIDER_AVAILABLE"}
-                )
-                raise HTTPException(
+            if not snapshot.active_providers:
+                return GateDecision(
+                    mode="smart",
+                    error_code="NO_PROVIDER_AVAILABLE",
                     status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail={"error_code": "NO_PROVIDER_AVAILABLE", "message": "No SMS providers are currently available."}
+                    message="No SMS providers are currently available.",
                 )
-            logger.info(
-                "Provider Gate: Smart selection will be used.",
-                extra={"client_api_key": client_api_key, "effective_providers": active_operational_providers}
-            )
-            return [] # An empty list signifies smart selection for Server B
+            return GateDecision(mode="smart")
 
-        # Process explicitly requested providers
         effective_providers: List[str] = []
         unknown_providers: List[str] = []
         disabled_providers: List[str] = []
-
-        for provider_alias in normalized_requested:
-            canonical_name = self._get_canonical_provider_name(provider_alias)
+        for provider_alias in requested:
+            canonical_name = self._get_canonical_provider_name(snapshot, provider_alias)
             if not canonical_name:
                 unknown_providers.append(provider_alias)
+            elif self._is_provider_active_and_operational(snapshot, canonical_name):
+                effective_providers.append(canonical_name)
             else:
-                if self._is_provider_active_and_operational(canonical_name):
-                    effective_providers.append(canonical_name)
-                else:
-                    disabled_providers.append(canonical_name)
-
+                disabled_providers.append(canonical_name)
+
+        decision = GateDecision(
+            mode="exclusive" if len(requested) == 1 else "failover",
+            providers=tuple(effective_providers),
+            requested=requested,
+            unknown=tuple(unknown_providers),
+            disabled=tuple(disabled_providers),
+        )
         if unknown_providers:
-            allowed_names = sorted(list(self.providers_config.keys()))
-            SMS_REQUEST_REJECTED_UNKNOWN_PROVIDER_TOTAL.labels(client=client_api_key).inc()
-            logger.warning(
-                "Provider Gate rejected: Unknown provider(s) requested.",
-                extra={"client_api_key": client_api_key, "unknown_providers": unknown_providers, "error_code": "UNKNOWN_PROVIDER"}
-            )
-            raise HTTPException(
+            allowed_names = sorted(snapshot.providers.keys())
+            return dataclasses.replace(
+                decision,
+                error_code="UNKNOWN_PROVIDER",
                 status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-                detail={
-                    "error_code": "UNKNOWN_PROVIDER",
-                    "message": f"Unknown provider(s): {', '.join(unknown_providers)}. Allowed providers are: {', '.join(allowed_names)}."
-                }
+                message=f"Unknown provider(s): {', '.join(unknown_providers)}. Allowed providers are: {', '.join(allowed_names)}.",
+            )
+        if decision.mode == "exclusive" and disabled_providers:
+            return dataclasses.replace(
+                decision,
+                error_code="PROVIDER_DISABLED",
+                status_code=status.HTTP_409_CONFLICT,
+                message=f"Provider '{disabled_providers[0]}' is currently disabled or not operational.",
             )
+        if not effective_providers:
+            return dataclasses.replace(
+                decision,
+                error_code="ALL_PROVIDERS_DISABLED",
+                status_code=status.HTTP_409_CONFLICT,
+                message="All requested providers are currently disabled or not operational.",
+            )
+        return decision
 
-        if len(normalized_requested) == 1:
-            # Exclusive Selection
-            if disabled_providers:
-                provider_name = disabled_providers[0]
-                SMS_REQUEST_REJECTED_PROVIDER_DISABLED_TOTAL.labels(client=client_api_key, provider=provider_name).inc()
+    def decision(self, snapshot: ConfigSnapshot, requested_providers: Optional[List[str]]) -> GateDecision:
+        """Returns the gate decision for ``requested_providers``, memoized per snapshot."""
+        if self._decisions_snapshot is not snapshot:
+            self._decide_cached = functools.lru_cache(maxsize=self.settings.provider_gate_cache_size)(
+                functools.partial(self._decide, snapshot)
+            )
+            self._decisions_snapshot = snapshot
+        enabled = bool(self.settings.PROVIDER_GATE_ENABLED)
+        key = None if requested_providers is None else tuple(requested_providers)
+        try:
+            return self._decide_cached(enabled, key)
+        except TypeError:
+            # Unhashable entries; they are dropped as empty, just not memoized.
+            return self._decide(snapshot, enabled, key)
+
+    def process_providers(self, request: Request, requested_providers: Optional[List[str]]) -> List[str]:
+        """
+        Validates and filters the list of requested providers based on configuration and rules.
+        Emits metrics and logs for rejections.
+        """
+        client = getattr(request.state, 'client', None)
+        client_key_id = client.key_id if client is not None else "unknown"
+        # One snapshot for the whole request, so aliases and provider states
+        # agree even if a broadcast lands midway.
+        snapshot = current_snapshot()
+        decision = self.decision(snapshot, requested_providers)
+
+        if decision.mode == "bypass":
+            logger.info("Provider Gate is disabled. Bypassing provider validation.")
+            for p in decision.unknown:
                 logger.warning(
-                    "Provider Gate rejected: Exclusive provider is disabled or not operational.",
-                    extra={"client_api_key": client_api_key, "provider": provider_name, "error_code": "PROVIDER_DISABLED"}
+                    "Provider Gate disabled, but unknown provider requested.",
+                    extra={"client_key_id": client_key_id, "provider": p}
                 )
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail={"error_code": "PROVIDER_DISABLED", "message": f"Provider '{provider_name}' is currently disabled or not operational."}
-                )
-            # If it reaches here, the single provider is active and operational, so it's in effective_providers
+            return list(decision.providers)
+
+        if decision.mode == "failover" and decision.disabled and not decision.unknown:
+            for p_name in decision.disabled:
+                client_labels.child(SMS_REQUEST_REJECTED_PROVIDER_DISABLED_TOTAL, client, provider=p_name).inc()
+            logger.info(
+                "Provider Gate: Filtering out disabled/non-operational providers from prioritized list.",
+                extra={"client_key_id": client_key_id, "disabled_providers": list(decision.disabled), "effective_providers_before_filter": list(decision.requested)}
+            )
+
+        if decision.error_code is not None:
+            self._reject(decision, client, client_key_id, requested_providers)
+
+        if decision.mode == "smart":
+            logger.info(
+                "Provider Gate: Smart selection will be used.",
+                extra={"client_key_id": client_key_id, "effective_providers": snapshot.active_providers}
+            )
+            return [] # An empty list signifies smart selection for Server B
+        if decision.mode == "exclusive":
             logger.info(
                 "Provider Gate: Exclusive selection successful.",
-                extra={"client_api_key": client_api_key, "effective_providers": effective_providers}
+                extra={"client_key_id": client_key_id, "effective_providers": list(decision.providers)}
             )
-            return effective_providers
         else:
-            # Prioritized Failover (more than one requested)
-            if disabled_providers:
-                for p_name in disabled_providers:
-                    SMS_REQUEST_REJECTED_PROVIDER_DISABLED_TOTAL.labels(client=client_api_key, provider=p_name).inc()
-                logger.info(
-                    "Provider Gate: Filtering out disabled/non-operational providers from prioritized list.",
-                    extra={"client_api_key": client_api_key, "disabled_providers": disabled_providers, "effective_providers_before_filter": normalized_requested}
-                )
-
-            if not effective_providers:
-                SMS_REQUEST_REJECTED_NO_PROVIDER_AVAILABLE_TOTAL.labels(client=client_api_key).inc() # Re-using this metric for "all disabled"
-                logger.warning(
-                    "Provider Gate rejected: All requested providers are disabled or not operational.",
-                    extra={"client_api_key": client_api_key, "requested_providers": requested_providers, "error_code": "ALL_PROVIDERS_DISABLED"}
-                )
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail={"error_code": "ALL_PROVIDERS_DISABLED", "message": "All requested providers are currently disabled or not operational."}
-                )
             logger.info(
                 "Provider Gate: Prioritized failover selection successful.",
-                extra={"client_api_key": client_api_key, "effective_providers": effective_providers}
+                extra={"client_key_id": client_key_id, "effective_providers": list(decision.providers)}
             )
-            return effective_providers
+        return list(decision.providers)
 
-provider_gate = ProviderGate()
+    def _reject(self, decision: GateDecision, client, client_key_id: str, requested_providers: Optional[List[str]]) -> None:
+        """Counts and logs a rejection, then raises it."""
+        error_code = decision.error_code
+        if error_code == "NO_PROVIDER_AVAILABLE":
+            client_labels.child(SMS_REQUEST_REJECTED_NO_PROVIDER_AVAILABLE_TOTAL, client).inc()
+            logger.warning(
+                "Provider Gate rejected: No active and operational providers available for smart selection.",
+                extra={"client_key_id": client_key_id, "error_code": error_code}
+            )
+        elif error_code == "UNKNOWN_PROVIDER":
+            client_labels.child(SMS_REQUEST_REJECTED_UNKNOWN_PROVIDER_TOTAL, client).inc()
+            logger.warning(
+                "Provider Gate rejected: Unknown provider(s) requested.",
+                extra={"client_key_id": client_key_id, "unknown_providers": list(decision.unknown), "error_code": error_code}
+            )
+        elif error_code == "PROVIDER_DISABLED":
+            provider_name = decision.disabled[0]
+            client_labels.child(SMS_REQUEST_REJECTED_PROVIDER_DISABLED_TOTAL, client, provider=provider_name).inc()
+            logger.warning(
+                "Provider Gate rejected: Exclusive provider is disabled or not operational.",
+                extra={"client_key_id": client_key_id, "provider": provider_name, "error_code": error_code}
+            )
+        else:
+            client_labels.child(SMS_REQUEST_REJECTED_NO_PROVIDER_AVAILABLE_TOTAL, client).inc() # Re-using this metric for "all disabled"
+            logger.warning(
+                "Provider Gate rejected: All requested providers are disabled or not operational.",
+                extra={"client_key_id": client_key_id, "requested_providers": requested_providers, "error_code": error_code}
+            )
+        raise HTTPException(
+            status_code=decision.status_code,
+            detail={"error_code": error_code, "message": decision.message}
+        )
 
+provider_gate = ProviderGate()
@@ -19,19 +19,19 @@ async def enforce_daily_quota(request: Request):
     This should be called AFTER Provider Gate to ensure doomed requests do not consume quota.
     """
     client: ClientContext = request.state.client
-    client_api_key = client.api_key
+    client_key_id = client.key_id
     daily_quota = client.daily_quota
 
     if daily_quota <= 0:
         logger.debug(
             "Client has unlimited quota (daily_quota <= 0). Skipping quota enforcement.",
-            extra={"client_api_key": client_api_key}
+            extra={"client_key_id": client_key_id}
         )
         return
 
     redis_client = await get_redis_client()
     today_str = datetime.utcnow().strftime("%Y-%m-%d")
-    quota_key = f"{settings.QUOTA_PREFIX}:{client_api_key}:{today_str}"
+    quota_key = f"{settings.QUOTA_PREFIX}:{client_key_id}:{today_str}"
 
     # Increment the counter and get the new value
     current_usage = await redis_client.incr(quota_key)
@@ -54,7 +54,7 @@ async def enforce_daily_quota(request: Request):
     if current_usage > daily_quota:
         logger.warning(
             "Quota enforcement rejected: Client exceeded daily quota.",
-            extra={"client_api_key": client_api_key, "current_usage": current_usage, "daily_quota": daily_quota, "error_code": "TOO_MANY_REQUESTS"}
+            extra={"client_key_id": client_key_id, "current_usage": current_usage, "daily_quota": daily_quota, "error_code": "TOO_MANY_REQUESTS"}
         )
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
@@ -63,5 +63,5 @@ async def enforce_daily_quota(request: Request):
 
     logger.info(
         "Quota check passed.",
-        extra={"client_api_key": client_api_key, "current_usage": current_usage, "daily_quota": daily_quota}
+        extra={"client_key_id": client_key_id, "current_usage": current_usage, "daily_quota": daily_quota}
     )
@@ -2,14 +2,16 @@
 
 import logging
 import json
+import time
 import uuid
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 
 import aio_pika
 from aio_pika import Message, DeliveryMode
 
-from app.config import get_settings
+from app.config import DEFAULT_MESSAGE_PRIORITY, get_settings
+from app.load_stats import load_stats
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -17,6 +19,22 @@ settings = get_settings()
 RABBITMQ_EXCHANGE_NAME = settings.outbound_sms_exchange
 RABBITMQ_QUEUE_NAME = settings.outbound_sms_queue
 RABBITMQ_ROUTING_KEY = settings.outbound_sms_routing_key
+RABBITMQ_HIGH_PRIORITY_QUEUE_NAME = settings.outbound_sms_high_priority_queue
+RABBITMQ_LOW_PRIORITY_QUEUE_NAME = settings.outbound_sms_low_priority_queue
+
+
+def _resolve_priority_lane(priority: str) -> Tuple[str, str]:
+    """Return the (queue, routing key) pair for a request priority lane.
+
+    The normal lane keeps the historical queue and routing key so existing
+    consumers continue to work. Dedicated lanes are bound on the same topic
+    exchange with their queue name as routing key.
+    """
+    if priority == "high":
+        return RABBITMQ_HIGH_PRIORITY_QUEUE_NAME, RABBITMQ_HIGH_PRIORITY_QUEUE_NAME
+    if priority == "low":
+        return RABBITMQ_LOW_PRIORITY_QUEUE_NAME, RABBITMQ_LOW_PRIORITY_QUEUE_NAME
+    return RABBITMQ_QUEUE_NAME, RABBITMQ_ROUTING_KEY
 
 async def get_rabbitmq_connection() -> aio_pika.Connection:
     """Establishes and returns a RabbitMQ connection."""
@@ -36,11 +54,13 @@ async def publish_sms_message(
     ttl_seconds: int,
     providers_original: Optional[List[str]],
     providers_effective: List[str],
-    tracking_id: uuid.UUID
+    tracking_id: uuid.UUID,
+    priority: str = DEFAULT_MESSAGE_PRIORITY,
 ) -> None:
     """
     Publishes an SMS message envelope to RabbitMQ.
     """
+    queue_name, routing_key = _resolve_priority_lane(priority)
     connection = None
     try:
         connection = await get_rabbitmq_connection()
@@ -49,9 +69,9 @@ async def publish_sms_message(
                 RABBITMQ_EXCHANGE_NAME, aio_pika.ExchangeType.TOPIC, durable=True
             )
 
-            queue = await channel.declare_queue(RABBITMQ_QUEUE_NAME, durable=True)
+            queue = await channel.declare_queue(queue_name, durable=True)
 
-            await queue.bind(RABBITMQ_EXCHANGE_NAME, routing_key=RABBITMQ_ROUTING_KEY)
+            await queue.bind(RABBITMQ_EXCHANGE_NAME, routing_key=routing_key)
             
             envelope = {
                 "tracking_id": str(tracking_id),
@@ -62,25 +82,31 @@ async def publish_sms_message(
                 "ttl_seconds": ttl_seconds,
                 "providers_original": providers_original,
                 "providers_effective": providers_effective,
+                "priority": priority,
                 "created_at": datetime.utcnow().isoformat(),
             }
 
             message_body = json.dumps(envelope).encode('utf-8')
+            # Each priority has its own queue, so no AMQP message priority is
+            # set: the lane queues are not declared with x-max-priority (and
+            # cannot be redeclared with it on a live broker).
             message = Message(
                 message_body,
                 content_type="application/json",
-                delivery_mode=DeliveryMode.PERSISTENT
+                delivery_mode=DeliveryMode.PERSISTENT,
             )
 
-            await exchange.publish(message, routing_key=RABBITMQ_ROUTING_KEY)
+            started = time.monotonic()
+            await exchange.publish(message, routing_key=routing_key)
+            load_stats.record_publish_confirm(time.monotonic() - started)
             logger.info(
                 "SMS message published to RabbitMQ.",
-                extra={"tracking_id": str(tracking_id), "client_api_key": client_key, "to": to}
+                extra={"tracking_id": str(tracking_id), "client_key_id": client_key, "to": to, "priority": priority}
             )
     except Exception as e:
         logger.error(
             f"Failed to publish SMS message to RabbitMQ: {e}",
-            extra={"tracking_id": str(tracking_id), "client_api_key": client_key, "to": to}
+            extra={"tracking_id": str(tracking_id), "client_key_id": client_key, "to": to}
         )
         raise
     finally:
@@ -4,12 +4,15 @@ from typing import Any, Dict, List, Optional
 from uuid import UUID, uuid4
 from dataclasses import dataclass, field
 
+from app.config import DEFAULT_MESSAGE_PRIORITY, MESSAGE_PRIORITY_LEVELS
+
 @dataclass
 class SendSmsRequest:
     to: str
     text: str
     providers: Optional[List[str]] = None
     ttl_seconds: Optional[int] = 3600
+    priority: Optional[str] = DEFAULT_MESSAGE_PRIORITY
 
     def validate_phone(self):
         if not isinstance(self.to, str):
@@ -36,6 +39,19 @@ class SendSmsRequest:
 
         raise ValueError("Phone must be +989xxxxxxxxx, 09xxxxxxxxx, or 9xxxxxxxxx.")
 
+    def validate_priority(self):
+        if self.priority is None:
+            self.priority = DEFAULT_MESSAGE_PRIORITY
+            return
+
+        if not isinstance(self.priority, str):
+            raise ValueError("Priority must be a string.")
+
+        v = self.priority.strip().lower()
+        if v not in MESSAGE_PRIORITY_LEVELS:
+            raise ValueError(f"Priority must be one of: {', '.join(MESSAGE_PRIORITY_LEVELS)}.")
+        self.priority = v
+
 @dataclass
 class SendSmsResponse:
     success: bool
@@ -0,0 +1,305 @@
+"""Binary on-disk format of the configuration snapshot.
+
+The file is written atomically (temp file + ``os.replace``) and read through
+``mmap``: clients are fixed-size records sorted by API key hash, so a warm
+start only checks the header and lookups binary-search the mapped file,
+decoding a record the first time it is used.
+
+Layout (little endian)::
+
+    header    HEADER (magic, format, state version, fingerprint, sizes, crc32)
+    clients   client_count * CLIENT_RECORD, sorted by key hash
+    user ids  index_count * USER_INDEX_RECORD (user id, client index), sorted by user id
+    strings   UTF-8 usernames referenced by offset/length from client records
+    providers JSON list of provider entries (broadcast shape, with ``id``)
+
+The header fingerprint is the state fingerprint (``ConfigSnapshot.fingerprint``)
+at the time the file was written.
+"""
+import bisect
+import json
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+
+from app.config import ClientConfig
+
+MAGIC = b"SMSCFG"
+FORMAT_VERSION = 2
+
+# magic, format, state version (-1: none), fingerprint (ASCII, NUL padded),
+# client count, user index count, strings size, providers size, crc32 of
+# everything after the header.
+HEADER = struct.Struct("<6sHq64sIIIII")
+# key hash, user id (-1: none), daily quota, username offset, username
+# length, is_active.
+CLIENT_RECORD = struct.Struct("<32sqqIHB")
+USER_INDEX_RECORD = struct.Struct("<qI")
+KEY_HASH_SIZE = 32
+
+
+class StoredSnapshot(NamedTuple):
+    clients: Mapping[bytes, ClientConfig]
+    key_hash_by_user_id: Mapping[int, bytes]
+    providers: List[Dict]
+    version: Optional[int]
+    fingerprint: str
+
+
+class _Column:
+    """Sequence view over one field of fixed-size records, for ``bisect``."""
+
+    __slots__ = ("_buf", "_start", "_size", "_count", "_read")
+
+    def __init__(self, buf, start: int, size: int, count: int, read):
+        self._buf = buf
+        self._start = start
+        self._size = size
+        self._count = count
+        self._read = read
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int):
+        return self._read(self._buf, self._start + index * self._size)
+
+
+def _read_key_hash(buf, offset: int) -> bytes:
+    return buf[offset:offset + KEY_HASH_SIZE]
+
+
+def _read_user_id(buf, offset: int) -> int:
+    return USER_INDEX_RECORD.unpack_from(buf, offset)[0]
+
+
+class MappedClients(Mapping):
+    """Read-only ``key hash -> ClientConfig`` map over the mapped client records.
+
+    Records are decoded on first access and kept, so repeated lookups of an
+    active client return the same immutable object.
+    """
+
+    __slots__ = ("_buf", "_offset", "_count", "_strings", "_keys", "_decoded")
+
+    def __init__(self, buf, offset: int, count: int, strings_offset: int):
+        self._buf = buf
+        self._offset = offset
+        self._count = count
+        self._strings = strings_offset
+        self._keys = _Column(buf, offset, CLIENT_RECORD.size, count, _read_key_hash)
+        self._decoded: Dict[bytes, ClientConfig] = {}
+
+    def _index(self, key_hash) -> int:
+        if not isinstance(key_hash, bytes) or len(key_hash) != KEY_HASH_SIZE:
+            return -1
+        index = bisect.bisect_left(self._keys, key_hash)
+        if index < self._count and self._keys[index] == key_hash:
+            return index
+        return -1
+
+    def record(self, index: int) -> ClientConfig:
+        key_hash, user_id, daily_quota, name_offset, name_length, is_active = CLIENT_RECORD.unpack_from(
+            self._buf, self._offset + index * CLIENT_RECORD.size
+        )
+        record = self._decoded.get(key_hash)
+        if record is None:
+            start = self._strings + name_offset
+            record = ClientConfig(
+                user_id=None if user_id < 0 else user_id,
+                username=self._buf[start:start + name_length].decode("utf-8"),
+                is_active=bool(is_active),
+                daily_quota=daily_quota,
+                key_id=key_hash[:8].hex(),
+            )
+            self._decoded[key_hash] = record
+        return record
+
+    def key_hash(self, index: int) -> bytes:
+        return self._keys[index]
+
+    def get(self, key, default=None):
+        record = self._decoded.get(key)
+        if record is not None:
+            return record
+        index = self._index(key)
+        return default if index < 0 else self.record(index)
+
+    def __getitem__(self, key) -> ClientConfig:
+        record = self.get(key)
+        if record is None:
+            raise KeyError(key)
+        return record
+
+    def __contains__(self, key) -> bool:
+        return key in self._decoded or self._index(key) >= 0
+
+    def __iter__(self) -> Iterator[bytes]:
+        for index in range(self._count):
+            yield self._keys[index]
+
+    def items(self):
+        # Sequential decode; the Mapping default would binary-search each key.
+        return [(self._keys[index], self.record(index)) for index in range(self._count)]
+
+    def __len__(self) -> int:
+        return self._count
+
+
+class MappedUserIndex(Mapping):
+    """Read-only ``user id -> key hash`` map over the mapped user index."""
+
+    __slots__ = ("_buf", "_offset", "_count", "_clients", "_ids")
+
+    def __init__(self, buf, offset: int, count: int, clients: MappedClients):
+        self._buf = buf
+        self._offset = offset
+        self._count = count
+        self._clients = clients
+        self._ids = _Column(buf, offset, USER_INDEX_RECORD.size, count, _read_user_id)
+
+    def _find(self, user_id) -> int:
+        if not isinstance(user_id, int):
+            return -1
+        index = bisect.bisect_left(self._ids, user_id)
+        if index < self._count and self._ids[index] == user_id:
+            return index
+        return -1
+
+    def get(self, key, default=None):
+        index = self._find(key)
+        if index < 0:
+            return default
+        _, client_index = USER_INDEX_RECORD.unpack_from(self._buf, self._offset + index * USER_INDEX_RECORD.size)
+        return self._clients.key_hash(client_index)
+
+    def __getitem__(self, key) -> bytes:
+        key_hash = self.get(key)
+        if key_hash is None:
+            raise KeyError(key)
+        return key_hash
+
+    def __contains__(self, key) -> bool:
+        return self._find(key) >= 0
+
+    def __iter__(self) -> Iterator[int]:
+        for index in range(self._count):
+            yield self._ids[index]
+
+    def items(self):
+        records = USER_INDEX_RECORD.iter_unpack(
+            self._buf[self._offset:self._offset + self._count * USER_INDEX_RECORD.size]
+        )
+        return [(user_id, self._clients.key_hash(index)) for user_id, index in records]
+
+    def __len__(self) -> int:
+        return self._count
+
+
+def _encode_body(clients: Mapping[bytes, ClientConfig], providers: List[Dict]) -> Tuple[int, int, int, int, bytes]:
+    records = bytearray()
+    strings = bytearray()
+    user_index: List[Tuple[int, int]] = []
+    for index, key_hash in enumerate(sorted(clients)):
+        client = clients[key_hash]
+        name = (client.username or "").encode("utf-8")
+        records += CLIENT_RECORD.pack(
+            key_hash,
+            -1 if client.user_id is None else client.user_id,
+            client.daily_quota,
+            len(strings),
+            len(name),
+            1 if client.is_active else 0,
+        )
+        strings += name
+        if client.user_id is not None:
+            user_index.append((client.user_id, index))
+
+    index_bytes = b"".join(USER_INDEX_RECORD.pack(user_id, index) for user_id, index in sorted(user_index))
+    provider_bytes = json.dumps(providers, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    body = b"".join((records, index_bytes, strings, provider_bytes))
+    return len(clients), len(user_index), len(strings), len(provider_bytes), body
+
+
+def write_snapshot(
+    path: Path,
+    clients: Mapping[bytes, ClientConfig],
+    providers: List[Dict],
+    version: Optional[int],
+    fingerprint: str,
+) -> None:
+    """Write a snapshot file atomically."""
+
+    client_count, index_count, strings_size, providers_size, body = _encode_body(clients, providers)
+    header = HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        -1 if version is None else version,
+        fingerprint.encode("ascii"),
+        client_count,
+        index_count,
+        strings_size,
+        providers_size,
+        zlib.crc32(body),
+    )
+
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def _unpack_header(data: bytes) -> Tuple:
+    if len(data) < HEADER.size:
+        raise ValueError("Config snapshot file is truncated")
+    magic, file_format, *rest = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a config snapshot file")
+    if file_format != FORMAT_VERSION:
+        raise ValueError(f"Unsupported config snapshot format {file_format}")
+    return tuple(rest)
+
+
+def read_snapshot(path: Path) -> StoredSnapshot:
+    """Map a snapshot file written by ``write_snapshot``.
+
+    Raises:
+        FileNotFoundError: if the file does not exist.
+        ValueError: if the file is not a valid snapshot.
+    """
+
+    with path.open("rb") as f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            raise ValueError("Config snapshot file is truncated")
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    version, fingerprint, client_count, index_count, strings_size, providers_size, crc = _unpack_header(buf)
+    clients_offset = HEADER.size
+    index_offset = clients_offset + client_count * CLIENT_RECORD.size
+    strings_offset = index_offset + index_count * USER_INDEX_RECORD.size
+    providers_offset = strings_offset + strings_size
+    if providers_offset + providers_size != len(buf):
+        raise ValueError("Config snapshot file size does not match its header")
+    with memoryview(buf) as view:
+        if zlib.crc32(view[HEADER.size:]) != crc:
+            raise ValueError("Config snapshot file is corrupt")
+
+    clients = MappedClients(buf, clients_offset, client_count, strings_offset)
+    return StoredSnapshot(
+        clients=clients,
+        key_hash_by_user_id=MappedUserIndex(buf, index_offset, index_count, clients),
+        providers=json.loads(buf[providers_offset:].decode("utf-8")),
+        version=None if version < 0 else version,
+        fingerprint=fingerprint.rstrip(b"\0").decode("ascii"),
+    )
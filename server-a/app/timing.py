@@ -0,0 +1,84 @@
+"""Hot-path latency breakdown, event-loop lag monitor and sampling profiler.
+
+``stage("quota")`` times one stage of ``/api/v1/sms/send`` into
+``sms_send_stage_latency_seconds{stage=...}``. It reads ``perf_counter_ns``
+twice and observes a pre-bound histogram child, so it is cheap enough to
+leave on for every request.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+from app.load_stats import load_stats
+from app.metrics import EVENT_LOOP_LAG_SECONDS, SMS_SEND_STAGE_LATENCY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Stages of a send request, in order.
+STAGES = ("idempotency_lookup", "auth", "provider_gate", "quota", "publish", "idempotency_store")
+
+_stage_histograms: Dict[str, object] = {
+    name: SMS_SEND_STAGE_LATENCY_SECONDS.labels(stage=name) for name in STAGES
+}
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the enclosed block as stage ``name``, including when it raises."""
+
+    histogram = _stage_histograms[name]
+    started = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        histogram.observe((time.perf_counter_ns() - started) / 1e9)
+
+
+async def monitor_event_loop_lag(interval: float) -> None:
+    """Measure how late the event loop wakes a sleeping task, every ``interval`` seconds.
+
+    The overshoot is how long ready callbacks had to wait for the loop, i.e.
+    the delay every request saw at that moment.
+    """
+
+    loop = asyncio.get_running_loop()
+    while True:
+        wake_at = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - wake_at)
+        EVENT_LOOP_LAG_SECONDS.observe(lag)
+        load_stats.event_loop_lag_seconds = lag
+
+
+def sample_stacks(thread_id: int, seconds: float, interval: float = 0.005) -> str:
+    """Sample the stack of thread ``thread_id`` for ``seconds``.
+
+    Returns collapsed stacks (``frame;frame;frame count`` per line, root
+    first), the format of ``py-spy record --format raw`` that flamegraph.pl
+    and speedscope read. Runs in the calling thread, so call it off the event
+    loop being sampled.
+    """
+
+    samples: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+            frame = frame.f_back
+        if stack:
+            samples[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+
+async def profile_event_loop(seconds: float) -> str:
+    """Sample the thread running the current event loop for ``seconds``."""
+    return await asyncio.to_thread(sample_stacks, threading.get_ident(), seconds)
@@ -0,0 +1,63 @@
+"""Measure config cache memory per API key and ``get_client_context`` latency.
+
+Not collected by pytest; run from ``server-a``::
+
+    python -m tests.bench_auth --keys 1000000
+"""
+import argparse
+import asyncio
+import gc
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from app import cache
+from app.auth import get_client_context
+from app.config import ClientConfig
+
+
+def _users(count: int) -> dict:
+    return {
+        f"key-{i:08d}": {"user_id": i, "username": f"user{i}", "daily_quota": 100}
+        for i in range(count)
+    }
+
+
+def measure_memory(count: int) -> float:
+    users = _users(count)
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    hashed = ((cache.hash_api_key(key), fields) for key, fields in users.items())
+    snapshot = cache.ConfigSnapshot.build(
+        clients={h: ClientConfig(key_id=cache.key_id(h), **fields) for h, fields in hashed}
+    )
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    cache.swap_snapshot(snapshot)
+    return (after - before) / count
+
+
+async def measure_auth(count: int, lookups: int) -> float:
+    keys = [f"key-{i % count:08d}" for i in range(lookups)]
+    request = SimpleNamespace(state=SimpleNamespace())
+    start = time.perf_counter()
+    for key in keys:
+        await get_client_context(request, api_key=key)
+    return (time.perf_counter() - start) / lookups
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keys", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    args = parser.parse_args()
+
+    per_key = measure_memory(args.keys)
+    per_call = asyncio.run(measure_auth(args.keys, args.lookups))
+    print(f"keys={args.keys} bytes/key={per_key:.0f} (hashed keys, records and indexes)")
+    print(f"lookups={args.lookups} get_client_context={per_call * 1e6:.2f}us/call")
+
+
+if __name__ == "__main__":
+    main()
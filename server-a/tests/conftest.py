@@ -34,3 +34,18 @@ def pytest_pyfunc_call(pyfuncitem):
         finally:
             loop.close()
         return True
+
+
+def _is_benchmark(item):
+    return "benchmark" in getattr(item, "fixturenames", ())
+
+
+def pytest_collection_modifyitems(config, items):
+    # Micro-benchmarks (tests/test_benchmarks.py) only run with --benchmark-only;
+    # the scaling checks next to them do not use the fixture and always run.
+    if config.getoption("benchmark_only", default=False):
+        return
+    deselected = [item for item in items if _is_benchmark(item)]
+    if deselected:
+        config.hook.pytest_deselected(items=deselected)
+        items[:] = [item for item in items if not _is_benchmark(item)]
@@ -0,0 +1,54 @@
+import dataclasses
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app import cache
+from app.auth import get_client_context
+from app.config import ClientConfig, ProviderConfig
+
+
+@pytest.fixture(autouse=True)
+def client_snapshot():
+    previous = cache.swap_snapshot(
+        cache.ConfigSnapshot.build(
+            clients={
+                cache.hash_api_key("key-a"): ClientConfig(user_id=1, username="alice", key_id="a"),
+                cache.hash_api_key("key-off"): ClientConfig(user_id=2, username="bob", is_active=False, key_id="off"),
+            }
+        )
+    )
+    yield
+    cache.swap_snapshot(previous)
+
+
+async def test_get_client_context_attaches_the_cached_record():
+    request = SimpleNamespace(state=SimpleNamespace())
+
+    client = await get_client_context(request, api_key="key-a")
+
+    assert client is cache.current_snapshot().clients[cache.hash_api_key("key-a")]
+    assert request.state.client is client
+    assert client.key_id == "a"
+
+
+async def test_get_client_context_rejects_inactive_and_unknown_keys():
+    request = SimpleNamespace(state=SimpleNamespace())
+
+    for api_key in ("key-off", "missing", None):
+        with pytest.raises(HTTPException) as exc_info:
+            await get_client_context(request, api_key=api_key)
+        assert exc_info.value.status_code == 401
+    assert not hasattr(request.state, "client")
+
+
+def test_cached_records_are_slotted_and_frozen():
+    client = ClientConfig(user_id=1, username="alice")
+    provider = ProviderConfig(is_active=True, is_operational=True, aliases=["a"])
+
+    assert not hasattr(client, "__dict__")
+    assert not hasattr(provider, "__dict__")
+    assert provider.aliases == ("a",)
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        client.is_active = False
@@ -0,0 +1,229 @@
+"""Micro-benchmarks of the send hot path, and scaling checks.
+
+The ``benchmark`` tests are deselected from the regular test run and only
+run with ``--benchmark-only``. Their regressions are judged against a saved
+baseline, since timings depend on the machine::
+
+    python -m pytest tests/test_benchmarks.py --benchmark-only --benchmark-autosave
+    python -m pytest tests/test_benchmarks.py --benchmark-only --benchmark-compare --benchmark-compare-fail=median:50%
+
+The ``test_*_scales`` checks run with the regular suite. They compare the
+same function on small and large inputs, so they hold on any machine and
+fail when a hot path changes complexity.
+
+``apply_state`` with 10^5 and 10^6 users takes seconds and runs only with
+``RUN_LARGE_BENCHMARKS=1``.
+"""
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import timeit
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from app import cache
+from app.config import ClientConfig, ProviderConfig, normalize_provider_key
+from app.heartbeat import compute_config_cache_fingerprint
+from app.main import custom_json_serializer
+from app.provider_gate import ProviderGate
+from app.schemas import ErrorResponse, SendSmsRequest, SendSmsResponse
+
+pytestmark = pytest.mark.benchmark(max_time=0.2, min_rounds=5)
+
+large = pytest.mark.skipif(
+    os.environ.get("RUN_LARGE_BENCHMARKS") != "1",
+    reason="set RUN_LARGE_BENCHMARKS=1 to run",
+)
+
+
+@pytest.fixture
+def restore_snapshot():
+    previous = cache.current_snapshot()
+    yield
+    cache.swap_snapshot(previous)
+
+
+@pytest.mark.parametrize("number", ["+989121234567", "09121234567", "912 123-4567"])
+def test_validate_phone(benchmark, number):
+    def validate():
+        SendSmsRequest(to=number, text="hello").validate_phone()
+
+    benchmark(validate)
+
+
+@pytest.mark.parametrize("name", ["magfa", "Provider-A", "Kave Negar SMS Gateway (backup)"])
+def test_normalize_provider_key(benchmark, name):
+    benchmark(normalize_provider_key, name)
+
+
+def _providers(count: int) -> dict:
+    # Every third provider is down, so failover has something to filter out.
+    return {
+        f"Provider{i}": ProviderConfig(
+            is_active=True, is_operational=i % 3 != 1, aliases=[f"provider-{i}"]
+        )
+        for i in range(count)
+    }
+
+
+@pytest.fixture
+def quiet_gate():
+    """Keep the gate's INFO lines out of its timings; logging is not what is measured."""
+    gate_logger = logging.getLogger("app.provider_gate")
+    level = gate_logger.level
+    gate_logger.setLevel(logging.WARNING)
+    yield
+    gate_logger.setLevel(level)
+
+
+def _gate_call(mode: str, count: int):
+    """Return ``process_providers`` and its arguments under ``count`` providers."""
+    cache.swap_snapshot(cache.ConfigSnapshot.build(providers=_providers(count)))
+    request = SimpleNamespace(state=SimpleNamespace(client=ClientConfig(user_id=1, username="bench")))
+    requested = {
+        "smart": None,
+        "exclusive": ["provider-0"],
+        "failover": ["Provider1", "provider-2", "PROVIDER3"],
+    }[mode]
+    return ProviderGate().process_providers, request, requested
+
+
+def _best_time(func, *args, number: int = 1, repeat: int = 5) -> float:
+    """Best time per call; the minimum of several runs is the least noisy."""
+    return min(timeit.repeat(lambda: func(*args), number=number, repeat=repeat)) / number
+
+
+@pytest.mark.parametrize("count", [10, 100, 1000])
+@pytest.mark.parametrize("mode", ["smart", "exclusive", "failover"])
+def test_provider_gate(benchmark, restore_snapshot, quiet_gate, mode, count):
+    # Decisions are memoized per snapshot, so the provider count does not
+    # matter; about 2-5us measured.
+    benchmark(*_gate_call(mode, count))
+
+
+@pytest.mark.parametrize("mode", ["smart", "exclusive", "failover"])
+def test_provider_gate_scales(restore_snapshot, quiet_gate, mode):
+    small = _best_time(*_gate_call(mode, 10), number=200)
+    large = _best_time(*_gate_call(mode, 1000), number=200)
+
+    assert large < 3 * small, f"{large * 1e6:.1f}us with 1000 providers, {small * 1e6:.1f}us with 10"
+
+
+def _broadcast(users: int) -> dict:
+    return {
+        "version": 1,
+        "data": {
+            "users": [
+                {
+                    "api_key_hash": hashlib.sha256(str(i).encode()).hexdigest(),
+                    "user_id": i,
+                    "username": f"user{i}",
+                    "daily_quota": 100,
+                    "is_active": True,
+                }
+                for i in range(users)
+            ],
+            "providers": [
+                {"name": name, "is_active": True, "is_operational": True, "aliases": list(config.aliases)}
+                for name, config in _providers(10).items()
+            ],
+        },
+    }
+
+
+@pytest.mark.parametrize(
+    "users",
+    [1_000, 10_000, pytest.param(100_000, marks=large), pytest.param(1_000_000, marks=large)],
+)
+def test_apply_state(benchmark, restore_snapshot, users):
+    state = _broadcast(users)
+
+    benchmark.pedantic(cache.apply_state, args=(state,), rounds=3, iterations=1)
+    # About 12us per user on a developer laptop.
+    assert len(cache.current_snapshot().clients) == users
+
+
+def test_compute_config_cache_fingerprint(benchmark, restore_snapshot):
+    cache.apply_state(_broadcast(1_000))
+
+    benchmark(compute_config_cache_fingerprint)
+
+
+def test_apply_state_scales(restore_snapshot):
+    small = _best_time(cache.apply_state, _broadcast(1_000), repeat=3)
+    large = _best_time(cache.apply_state, _broadcast(10_000), repeat=3)
+
+    # Linear would be 10x; a quadratic step would be about 100x.
+    assert large < 25 * small, f"{large * 1e3:.1f}ms for 10^4 users, {small * 1e3:.1f}ms for 10^3"
+
+
+@pytest.fixture(scope="module")
+def versioned_snapshots():
+    """Snapshots at version 1 with 10^3 and 2 * 10^4 users."""
+    previous = cache.current_snapshot()
+    snapshots = {}
+    for users in (1_000, 20_000):
+        cache.apply_state(_broadcast(users))
+        snapshots[users] = cache.current_snapshot()
+    cache.swap_snapshot(previous)
+    return snapshots
+
+
+def _apply_one_user_delta(snapshot):
+    cache.swap_snapshot(snapshot)
+    entry = {"user_id": 0, "username": "user0", "api_key_hash": "ab" * 32, "daily_quota": 5, "is_active": True}
+    assert cache.apply_delta(
+        {"version": 2, "previous_version": 1, "changes": [{"kind": "user", "id": 0, "entry": entry}]}
+    )
+
+
+def test_apply_delta_scales(restore_snapshot, versioned_snapshots):
+    small = _best_time(_apply_one_user_delta, versioned_snapshots[1_000], number=50)
+    large = _best_time(_apply_one_user_delta, versioned_snapshots[20_000], number=50)
+
+    # A delta rebuilds only the entries it names, whatever the state size.
+    assert large < 3 * small, f"{large * 1e6:.1f}us on 2*10^4 users, {small * 1e6:.1f}us on 10^3"
+
+
+def test_compute_config_cache_fingerprint_scales(restore_snapshot, versioned_snapshots):
+    timings = []
+    for users in (1_000, 20_000):
+        cache.swap_snapshot(versioned_snapshots[users])
+        timings.append(_best_time(compute_config_cache_fingerprint, number=1000))
+
+    # The fingerprint is maintained incrementally, not recomputed per call.
+    assert timings[1] < 3 * timings[0]
+
+
+def _round_trip(value):
+    # The way main.py turns its response dataclasses into JSONResponse content.
+    return json.loads(json.dumps(dataclasses.asdict(value), default=custom_json_serializer))
+
+
+def test_encode_send_response(benchmark):
+    response = SendSmsResponse(success=True, message="Request accepted for processing.", tracking_id=uuid4())
+
+    benchmark(_round_trip, response)
+
+
+def test_encode_error_response(benchmark):
+    error = ErrorResponse(
+        error_code="UNKNOWN_PROVIDER",
+        message="Unknown provider(s): x. Allowed providers are: a, b.",
+        details={"errors": [{"loc": ["body", "to"], "msg": "field required"}]},
+        tracking_id=uuid4(),
+    )
+
+    benchmark(_round_trip, error)
+
+
+def test_decode_send_request(benchmark):
+    body = json.dumps(
+        {"to": "09121234567", "text": "hello " * 20, "providers": ["magfa", "backup"], "priority": "high"}
+    ).encode()
+
+    benchmark(json.loads, body)
@@ -1,25 +1,48 @@
 import json
+import os
 
 import pytest
 
 from app import cache
 from app.config import ClientConfig, ProviderConfig
 
+FINGERPRINT_VECTOR = "f2b0ce7bc76475662e9fb179b4b5a13f6e55a58d16d7adf8e2db787f8cca5fac"
+# HMAC of "api_key_for_service_A" under the API_KEY_HASH_SECRET both services
+# ship in .env.example; server-b's core/tests.py checks the same value.
+SHIPPED_SECRET_VECTOR = "c2e5b6185a916b73a7292f20d0f895af0a78ace7eb1479b43ee897b6ad66dcc1"
+ENV_EXAMPLE = os.path.join(os.path.dirname(__file__), "..", ".env.example")
+
 
 @pytest.fixture(autouse=True)
 def reset_caches():
-    cache.CLIENT_CONFIG_CACHE.clear()
-    cache.PROVIDER_CONFIG_CACHE.clear()
-    cache.PROVIDER_ALIAS_MAP_CACHE.clear()
+    previous = cache.swap_snapshot(cache.ConfigSnapshot())
     yield
-    cache.CLIENT_CONFIG_CACHE.clear()
-    cache.PROVIDER_CONFIG_CACHE.clear()
-    cache.PROVIDER_ALIAS_MAP_CACHE.clear()
+    cache.swap_snapshot(previous)
+
+
+def _h(api_key):
+    return cache.hash_api_key(api_key)
+
+
+def _snapshot(version=7):
+    return {
+        "type": "snapshot",
+        "version": version,
+        "data": {
+            "users": [
+                {"user_id": 1, "username": "alice", "api_key_hash": _h("key-a").hex(), "daily_quota": 5, "is_active": True},
+                {"user_id": 2, "username": "bob", "api_key_hash": _h("key-b").hex(), "daily_quota": 9, "is_active": True},
+            ],
+            "providers": [
+                {"id": 10, "name": "Twilio", "is_active": True, "is_operational": True, "aliases": ["twi"]},
+            ],
+        },
+    }
 
 
 @pytest.fixture
 def temp_cache_file(tmp_path, monkeypatch):
-    config_path = tmp_path / "config_cache.json"
+    config_path = tmp_path / "config_cache.bin"
     monkeypatch.setattr(cache, "CONFIG_CACHE_PATH", config_path, raising=False)
     cache.CONFIG_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
     return config_path
@@ -83,16 +106,16 @@ def test_apply_state_with_canonical_shape_populates_caches():
 
     cache.apply_state(state)
 
-    assert cache.CLIENT_CONFIG_CACHE["api-key-1"] == ClientConfig(
-        user_id=1, username="alice", is_active=False, daily_quota=5
+    assert cache.current_snapshot().clients[_h("api-key-1")] == ClientConfig(
+        user_id=1, username="alice", is_active=False, daily_quota=5, key_id=cache.key_id(_h("api-key-1"))
     )
-    assert cache.PROVIDER_CONFIG_CACHE["Twilio"] == ProviderConfig(
+    assert cache.current_snapshot().providers["Twilio"] == ProviderConfig(
         is_active=True, is_operational=True, aliases=["TWI-LIO"], note="primary"
     )
-    assert cache.PROVIDER_CONFIG_CACHE["Backup"] == ProviderConfig(
+    assert cache.current_snapshot().providers["Backup"] == ProviderConfig(
         is_active=True, is_operational=False, aliases=None, note=None
     )
-    assert cache.PROVIDER_ALIAS_MAP_CACHE == {"twilio": "Twilio", "backup": "Backup"}
+    assert cache.current_snapshot().provider_aliases == {"twilio": "Twilio", "backup": "Backup"}
 
 
 def test_apply_state_with_broadcast_shape_normalizes_entries():
@@ -125,20 +148,25 @@ def test_apply_state_with_broadcast_shape_normalizes_entries():
 
     cache.apply_state(state)
 
-    assert cache.CLIENT_CONFIG_CACHE == {
-        "key1": ClientConfig(user_id=10, username="Alice", is_active=False, daily_quota=15)
+    assert cache.current_snapshot().clients == {
+        _h("key1"): ClientConfig(
+            user_id=10, username="Alice", is_active=False, daily_quota=15, key_id=cache.key_id(_h("key1"))
+        )
     }
-    assert cache.PROVIDER_CONFIG_CACHE == {
+    assert cache.current_snapshot().providers == {
         "Twilio": ProviderConfig(is_active=True, is_operational=True, aliases=["Alpha"], note="primary"),
         "NoName": ProviderConfig(is_active=False, is_operational=True, aliases=[], note=None),
     }
-    assert cache.PROVIDER_ALIAS_MAP_CACHE["alpha"] == "Twilio"
+    assert cache.current_snapshot().provider_aliases["alpha"] == "Twilio"
 
 
 def test_apply_state_raises_and_leaves_caches_on_alias_collision():
-    cache.CLIENT_CONFIG_CACHE["existing"] = ClientConfig(user_id=1, username="existing")
-    cache.PROVIDER_CONFIG_CACHE["Existing"] = ProviderConfig(is_active=True, is_operational=True)
-    cache.PROVIDER_ALIAS_MAP_CACHE["existing"] = "Existing"
+    cache.swap_snapshot(
+        cache.ConfigSnapshot.build(
+            clients={_h("existing"): ClientConfig(user_id=1, username="existing")},
+            providers={"Existing": ProviderConfig(is_active=True, is_operational=True)},
+        )
+    )
 
     state = {
         "providers": {
@@ -150,15 +178,15 @@ def test_apply_state_raises_and_leaves_caches_on_alias_collision():
     with pytest.raises(ValueError):
         cache.apply_state(state)
 
-    assert cache.CLIENT_CONFIG_CACHE == {"existing": ClientConfig(user_id=1, username="existing")}
-    assert cache.PROVIDER_CONFIG_CACHE == {"Existing": ProviderConfig(is_active=True, is_operational=True)}
-    assert cache.PROVIDER_ALIAS_MAP_CACHE == {"existing": "Existing"}
+    assert cache.current_snapshot().clients == {_h("existing"): ClientConfig(user_id=1, username="existing")}
+    assert cache.current_snapshot().providers == {"Existing": ProviderConfig(is_active=True, is_operational=True)}
+    assert cache.current_snapshot().provider_aliases == {"existing": "Existing"}
 
 
 def test_save_and_load_state_round_trip(temp_cache_file):
     state = {
         "users": {
-            "key": {
+            "raw-secret-key": {
                 "user_id": 42,
                 "username": "tester",
                 "is_active": True,
@@ -170,20 +198,20 @@ def test_save_and_load_state_round_trip(temp_cache_file):
         },
     }
 
-    cache.save_state_to_file(state)
+    cache.apply_state(state)
+    cache.save_snapshot_to_file()
 
     assert temp_cache_file.exists()
-    with temp_cache_file.open("r") as f:
-        assert json.load(f) == state
+    assert b"raw-secret-key" not in temp_cache_file.read_bytes()
 
     # Clear caches then load from file
-    cache.CLIENT_CONFIG_CACHE.clear()
-    cache.PROVIDER_CONFIG_CACHE.clear()
-    cache.PROVIDER_ALIAS_MAP_CACHE.clear()
+    cache.swap_snapshot(cache.ConfigSnapshot())
 
     assert cache.load_state_from_file() is True
-    assert cache.CLIENT_CONFIG_CACHE["key"].user_id == 42
-    assert "twilio" in cache.PROVIDER_ALIAS_MAP_CACHE
+    assert cache.current_snapshot().clients[_h("raw-secret-key")] == ClientConfig(
+        user_id=42, username="tester", is_active=True, daily_quota=7, key_id=cache.key_id(_h("raw-secret-key"))
+    )
+    assert "twilio" in cache.current_snapshot().provider_aliases
 
 
 def test_load_state_from_missing_file_returns_false(temp_cache_file):
@@ -192,18 +220,18 @@ def test_load_state_from_missing_file_returns_false(temp_cache_file):
         temp_cache_file.unlink()
 
     assert cache.load_state_from_file() is False
-    assert cache.CLIENT_CONFIG_CACHE == {}
-    assert cache.PROVIDER_CONFIG_CACHE == {}
-    assert cache.PROVIDER_ALIAS_MAP_CACHE == {}
+    assert cache.current_snapshot().clients == {}
+    assert cache.current_snapshot().providers == {}
+    assert cache.current_snapshot().provider_aliases == {}
 
 
 def test_load_state_from_file_with_invalid_json_returns_false(temp_cache_file):
     temp_cache_file.write_text("not valid json")
 
     assert cache.load_state_from_file() is False
-    assert cache.CLIENT_CONFIG_CACHE == {}
-    assert cache.PROVIDER_CONFIG_CACHE == {}
-    assert cache.PROVIDER_ALIAS_MAP_CACHE == {}
+    assert cache.current_snapshot().clients == {}
+    assert cache.current_snapshot().providers == {}
+    assert cache.current_snapshot().provider_aliases == {}
 
 
 def test_load_state_from_file_when_apply_state_raises_returns_false(temp_cache_file):
@@ -215,9 +243,283 @@ def test_load_state_from_file_when_apply_state_raises_returns_false(temp_cache_f
     }
     temp_cache_file.write_text(json.dumps(invalid_state))
 
-    cache.CLIENT_CONFIG_CACHE["existing"] = ClientConfig(user_id=1, username="existing")
+    cache.swap_snapshot(
+        cache.ConfigSnapshot.build(clients={_h("existing"): ClientConfig(user_id=1, username="existing")})
+    )
 
     assert cache.load_state_from_file() is False
-    assert cache.CLIENT_CONFIG_CACHE == {"existing": ClientConfig(user_id=1, username="existing")}
-    assert cache.PROVIDER_CONFIG_CACHE == {}
-    assert cache.PROVIDER_ALIAS_MAP_CACHE == {}
+    assert cache.current_snapshot().clients == {_h("existing"): ClientConfig(user_id=1, username="existing")}
+    assert cache.current_snapshot().providers == {}
+    assert cache.current_snapshot().provider_aliases == {}
+
+
+def test_apply_state_records_snapshot_version():
+    cache.apply_state(_snapshot(version=7))
+
+    assert cache.get_state_version() == 7
+
+
+def test_apply_delta_updates_only_changed_entries_and_rotates_api_keys():
+    cache.apply_state(_snapshot(version=7))
+    bob = cache.current_snapshot().clients[_h("key-b")]
+
+    applied = cache.apply_delta(
+        {
+            "type": "delta",
+            "version": 8,
+            "previous_version": 7,
+            "changes": [
+                {
+                    "kind": "user",
+                    "id": 1,
+                    "entry": {"user_id": 1, "username": "alice", "api_key_hash": _h("key-a2").hex(), "daily_quota": 50, "is_active": True},
+                },
+                {"kind": "user", "id": 3, "entry": {"user_id": 3, "username": "carol", "api_key": "key-c"}},
+            ],
+        }
+    )
+
+    assert applied is True
+    assert cache.get_state_version() == 8
+    assert _h("key-a") not in cache.current_snapshot().clients
+    assert cache.current_snapshot().clients[_h("key-a2")].daily_quota == 50
+    assert cache.current_snapshot().clients[_h("key-c")].username == "carol"
+    assert cache.current_snapshot().clients[_h("key-b")] is bob
+
+
+@pytest.mark.parametrize("order", [1, -1])
+def test_apply_delta_swaps_api_keys_in_any_order(order):
+    cache.apply_state(_snapshot(version=7))
+    changes = [
+        {"kind": "user", "id": 1, "entry": {"user_id": 1, "username": "alice", "api_key_hash": _h("key-b").hex()}},
+        {"kind": "user", "id": 2, "entry": {"user_id": 2, "username": "bob", "api_key_hash": _h("key-a").hex()}},
+        {"kind": "provider", "id": 10, "entry": {"id": 10, "name": "Other", "aliases": ["twi"]}},
+        {"kind": "provider", "id": 11, "entry": {"id": 11, "name": "Twilio"}},
+    ]
+
+    cache.apply_delta({"version": 8, "previous_version": 7, "changes": changes[::order]})
+
+    snapshot = cache.current_snapshot()
+    assert snapshot.clients[_h("key-a")].username == "bob"
+    assert snapshot.clients[_h("key-b")].username == "alice"
+    assert dict(snapshot.key_hash_by_user_id) == {1: _h("key-b"), 2: _h("key-a")}
+    assert sorted(snapshot.providers) == ["Other", "Twilio"]
+    assert dict(snapshot.provider_name_by_id) == {10: "Other", 11: "Twilio"}
+
+
+def test_apply_delta_removes_deleted_users_and_renamed_providers():
+    cache.apply_state(_snapshot(version=7))
+
+    cache.apply_delta(
+        {
+            "version": 8,
+            "previous_version": 7,
+            "changes": [
+                {"kind": "user", "id": 2, "entry": None},
+                {
+                    "kind": "provider",
+                    "id": 10,
+                    "entry": {"id": 10, "name": "Twilio2", "is_active": True, "is_operational": False, "aliases": []},
+                },
+            ],
+        }
+    )
+
+    assert _h("key-b") not in cache.current_snapshot().clients
+    assert set(cache.current_snapshot().providers) == {"Twilio2"}
+    assert cache.current_snapshot().provider_aliases == {"twilio2": "Twilio2"}
+    assert cache.current_snapshot().active_providers == ()
+
+
+def test_apply_delta_reports_version_gap_without_changes():
+    cache.apply_state(_snapshot(version=7))
+
+    applied = cache.apply_delta(
+        {"version": 9, "previous_version": 8, "changes": [{"kind": "user", "id": 2, "entry": None}]}
+    )
+
+    assert applied is False
+    assert cache.get_state_version() == 7
+    assert _h("key-b") in cache.current_snapshot().clients
+
+
+def test_apply_delta_ignores_already_applied_versions():
+    cache.apply_state(_snapshot(version=7))
+
+    applied = cache.apply_delta(
+        {"version": 7, "previous_version": 6, "changes": [{"kind": "user", "id": 2, "entry": None}]}
+    )
+
+    assert applied is True
+    assert _h("key-b") in cache.current_snapshot().clients
+
+
+def test_apply_delta_needs_versioned_state():
+    cache.apply_state({"users": {}, "providers": {}})
+
+    assert cache.apply_delta({"version": 1, "previous_version": 0, "changes": []}) is False
+
+
+def test_reader_keeps_a_consistent_snapshot_across_reloads():
+    cache.apply_state(_snapshot(version=7))
+    held = cache.current_snapshot()
+
+    cache.apply_state({"users": {}, "providers": {}})
+    cache.apply_delta(
+        {"version": 8, "previous_version": 7, "changes": [{"kind": "user", "id": 2, "entry": None}]}
+    )
+
+    assert set(held.clients) == {_h("key-a"), _h("key-b")}
+    assert held.provider_aliases["twi"] == "Twilio"
+    assert held.version == 7
+    assert cache.current_snapshot() is not held
+
+
+def test_delta_shares_unchanged_maps_with_previous_snapshot():
+    cache.apply_state(_snapshot(version=7))
+    before = cache.current_snapshot()
+
+    cache.apply_delta(
+        {
+            "version": 8,
+            "previous_version": 7,
+            "changes": [{"kind": "user", "id": 1, "entry": None}],
+        }
+    )
+
+    after = cache.current_snapshot()
+    assert after.providers is before.providers
+    assert after.provider_aliases is before.provider_aliases
+    assert after.active_providers is before.active_providers
+    assert dict(after.clients) == {_h("key-b"): before.clients[_h("key-b")]}
+    assert len(after.clients) == 1
+    assert set(before.clients) == {_h("key-a"), _h("key-b")}
+
+
+def test_layered_map_folds_large_overlays_into_its_base(monkeypatch):
+    monkeypatch.setattr(cache, "_COMPACT_MIN_OVERLAY", 2)
+    base = cache._LayeredMap({"a": 1, "b": 2})
+
+    layered = base.with_changes({"a": cache._DELETED, "c": 3})
+    assert dict(layered) == {"b": 2, "c": 3}
+    assert len(layered) == 2
+    assert "a" not in layered and layered.get("a") is None
+    assert layered._overlay
+
+    compacted = layered.with_changes({"d": 4, "missing": cache._DELETED})
+    assert dict(compacted) == {"b": 2, "c": 3, "d": 4}
+    assert len(compacted) == 3
+    assert not compacted._overlay
+    assert dict(base) == {"a": 1, "b": 2}
+
+
+def test_loaded_snapshot_keeps_version_fingerprint_and_accepts_deltas(temp_cache_file):
+    cache.apply_state(_snapshot(version=7))
+    fingerprint = cache.current_snapshot().fingerprint
+    cache.save_snapshot_to_file()
+    cache.swap_snapshot(cache.ConfigSnapshot())
+
+    assert cache.load_state_from_file() is True
+    loaded = cache.current_snapshot()
+    assert (loaded.version, loaded.fingerprint) == (7, fingerprint)
+    assert loaded.provider_name_by_id == {10: "Twilio"}
+    assert cache.confirm_snapshot(fingerprint, 8) is True
+
+    cache.apply_delta(
+        {
+            "version": 9,
+            "previous_version": 8,
+            "changes": [
+                {"kind": "user", "id": 1, "entry": {"user_id": 1, "username": "alice", "api_key": "key-a2"}},
+            ],
+        }
+    )
+
+    clients = cache.current_snapshot().clients
+    assert set(clients) == {_h("key-a2"), _h("key-b")}
+    assert clients[_h("key-b")].daily_quota == 9
+
+
+def test_fingerprint_does_not_depend_on_entity_order():
+    state = _snapshot()
+    cache.apply_state(state)
+    forward = cache.current_snapshot().fingerprint
+
+    state["data"]["users"].reverse()
+    cache.apply_state(state)
+
+    assert cache.current_snapshot().fingerprint == forward
+    assert cache.ConfigSnapshot().fingerprint == "0" * 64
+
+
+def test_delta_fingerprint_matches_a_full_rebuild():
+    cache.apply_state(_snapshot(version=7))
+    cache.apply_delta(
+        {
+            "version": 8,
+            "previous_version": 7,
+            "changes": [
+                {"kind": "user", "id": 1, "entry": {"user_id": 1, "username": "alice", "api_key_hash": _h("key-a2").hex(), "daily_quota": 6}},
+                {"kind": "user", "id": 2, "entry": None},
+                {"kind": "user", "id": 3, "entry": {"user_id": 3, "username": "carol", "api_key_hash": _h("key-c").hex()}},
+                {"kind": "provider", "id": 10, "entry": {"id": 10, "name": "Twilio", "is_active": False, "aliases": ["twi"]}},
+            ],
+        }
+    )
+    incremental = cache.current_snapshot().fingerprint
+
+    cache.apply_state(
+        {
+            "version": 8,
+            "data": {
+                "users": [
+                    {"user_id": 3, "username": "carol", "api_key_hash": _h("key-c").hex()},
+                    {"user_id": 1, "username": "alice", "api_key_hash": _h("key-a2").hex(), "daily_quota": 6},
+                ],
+                "providers": [{"id": 10, "name": "Twilio", "is_active": False, "aliases": ["twi"]}],
+            },
+        }
+    )
+
+    assert cache.current_snapshot().fingerprint == incremental
+
+
+def test_fingerprint_matches_server_b():
+    # Same vector as server-b's core/tests.py.
+    cache.apply_state(
+        {
+            "data": {
+                "users": [
+                    {"user_id": 1, "username": "alice", "api_key_hash": "ab" * 32, "daily_quota": 5, "is_active": True},
+                ],
+                "providers": [
+                    {"id": 10, "name": "Twilio", "is_active": True, "is_operational": True, "aliases": ["twi"]},
+                ],
+            },
+        }
+    )
+
+    assert cache.current_snapshot().fingerprint == FINGERPRINT_VECTOR
+
+
+def test_hash_api_key_is_keyed_by_the_configured_secret(monkeypatch):
+    settings = cache.get_settings()
+    unkeyed = _h("key-a")
+
+    monkeypatch.setattr(settings, "api_key_hash_secret", "s3cret")
+
+    assert _h("key-a") != unkeyed
+    # Same vector as server-b's core/tests.py.
+    assert _h("key-1").hex() == "2473ad03580c4627d33b06008f6e95fafe428cce76d19fab5458c6110280e769"
+    assert len(_h("key-a")) == 32
+    assert cache.key_id(_h("key-a")) == _h("key-a")[:8].hex()
+
+
+def test_shipped_secret_hashes_keys_like_server_b(monkeypatch):
+    with open(ENV_EXAMPLE) as f:
+        secrets = [line.split("=", 1)[1].strip() for line in f if line.startswith("API_KEY_HASH_SECRET=")]
+    assert secrets and secrets[0]
+
+    monkeypatch.setattr(cache.get_settings(), "api_key_hash_secret", secrets[0])
+
+    assert _h("api_key_for_service_A").hex() == SHIPPED_SECRET_VECTOR
@@ -1,8 +1,9 @@
 import asyncio
+import json
 
 import pytest
 
-from app import main
+from app import cache, consumers, main, snapshot_store
 
 
 class _DummyConsumer:
@@ -77,3 +78,76 @@ def test_start_consumer_enabled(monkeypatch, caplog, reset_settings):
 
     for coro, _ in created_tasks:
         coro.close()
+
+
+class _DummyExchange:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, message, routing_key):
+        self.published.append((json.loads(message.body), routing_key))
+
+
+@pytest.fixture
+def isolated_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache, "CONFIG_CACHE_PATH", tmp_path / "config_cache.bin")
+    previous = cache.swap_snapshot(cache.ConfigSnapshot())
+    yield
+    cache.swap_snapshot(previous)
+
+
+def test_handle_config_state_applies_snapshot_then_delta(isolated_cache):
+    snapshot = {
+        "type": "snapshot",
+        "version": 3,
+        "data": {"users": [{"user_id": 1, "username": "a", "api_key_hash": cache.hash_api_key("k1").hex()}], "providers": []},
+    }
+
+    assert consumers.handle_config_state(snapshot) is True
+    assert snapshot_store.read_snapshot(cache.CONFIG_CACHE_PATH).version == 3
+
+    delta = {
+        "type": "delta",
+        "version": 4,
+        "previous_version": 3,
+        "changes": [{"kind": "user", "id": 1, "entry": {"user_id": 1, "username": "a", "api_key_hash": cache.hash_api_key("k2").hex()}}],
+    }
+    assert consumers.handle_config_state(delta) is True
+    assert set(cache.current_snapshot().clients) == {cache.hash_api_key("k2")}
+
+
+def test_unchanged_snapshots_are_skipped_until_a_delta_applies(isolated_cache):
+    users = [{"user_id": 1, "username": "a", "api_key_hash": cache.hash_api_key("k1").hex()}]
+    snapshot = {"type": "snapshot", "version": 3, "data": {"users": users, "providers": []}}
+    consumers.handle_config_state(snapshot)
+    fingerprint = cache.current_snapshot().fingerprint
+    headers = {"type": "snapshot", "version": 5, "fingerprint": fingerprint}
+
+    assert consumers.is_unchanged_snapshot({**headers, "fingerprint": "def"}) is False
+    assert consumers.is_unchanged_snapshot(headers) is True
+    assert cache.get_state_version() == 5
+    assert consumers.is_unchanged_snapshot({"type": "delta", "version": 6}) is False
+
+    consumers.handle_config_state({"type": "delta", "version": 6, "previous_version": 5, "changes": []})
+    assert consumers.is_unchanged_snapshot(headers) is True
+
+    consumers.handle_config_state(
+        {"type": "delta", "version": 7, "previous_version": 6, "changes": [{"kind": "user", "id": 1, "entry": None}]}
+    )
+    assert consumers.is_unchanged_snapshot(headers) is False
+
+
+def test_handle_config_state_reports_gap(isolated_cache):
+    delta = {"type": "delta", "version": 4, "previous_version": 3, "changes": []}
+
+    assert consumers.handle_config_state(delta) is False
+
+
+async def test_resync_requests_are_rate_limited(isolated_cache):
+    exchange = _DummyExchange()
+    channel = type("Channel", (), {"default_exchange": exchange})()
+    requester = consumers.ResyncRequester(channel, "resync_queue", min_interval=60)
+
+    assert await requester.request("startup") is True
+    assert await requester.request("version gap") is False
+    assert exchange.published == [({"reason": "startup", "version": None}, "resync_queue")]
@@ -92,7 +92,7 @@ async def test_lifespan_cancels_background_tasks(monkeypatch):
     consumer_started = asyncio.Event()
     consumer_cancelled = asyncio.Event()
 
-    async def heartbeat_stub():
+    async def heartbeat_stub(connection):
         heartbeat_started.set()
         try:
             await asyncio.Event().wait()
@@ -128,6 +128,7 @@ async def test_lifespan_cancels_background_tasks(monkeypatch):
     monkeypatch.setattr(main, "start_heartbeat_task", heartbeat_stub)
     monkeypatch.setattr(main, "consume_config_state", consume_stub)
     monkeypatch.setattr(main.settings, "CONFIG_STATE_SYNC_ENABLED", True, raising=False)
+    monkeypatch.setattr(main.settings, "api_key_hash_secret", "s3cret")
     monkeypatch.setattr(main, "load_state_from_file", MagicMock(return_value=True))
 
     async with app.router.lifespan_context(app):
@@ -138,3 +139,16 @@ async def test_lifespan_cancels_background_tasks(monkeypatch):
     assert consumer_cancelled.is_set()
     mock_rabbitmq_connection.close.assert_awaited_once()
     mock_redis_client.close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_lifespan_refuses_to_start_without_api_key_hash_secret(monkeypatch):
+    get_redis_client = AsyncMock()
+    monkeypatch.setattr(main.settings, "api_key_hash_secret", "")
+    monkeypatch.setattr(main, "get_redis_client", get_redis_client)
+
+    with pytest.raises(RuntimeError, match="API_KEY_HASH_SECRET"):
+        async with app.router.lifespan_context(app):
+            pass
+
+    get_redis_client.assert_not_awaited()
@@ -1,5 +1,4 @@
 import asyncio
-import hashlib
 import json
 from datetime import datetime
 from unittest.mock import AsyncMock, MagicMock, patch
@@ -12,121 +11,106 @@ import app.heartbeat as heartbeat
 from app import cache
 from app.heartbeat import HEARTBEAT_EXCHANGE_NAME, HEARTBEAT_QUEUE_NAME, send_heartbeat
 from app.config import Settings
-
-
-class DummyChannelContext:
-    def __init__(self, channel):
-        self._channel = channel
-
-    async def __aenter__(self):
-        return self._channel
-
-    async def __aexit__(self, exc_type, exc, tb):
-        return False
+from app import load_stats as load_stats_module
+from app.load_stats import LoadStats
 
 
 @pytest.mark.asyncio
-async def test_send_heartbeat_publishes_payload_and_closes_connection():
+async def test_send_heartbeat_publishes_payload_with_ttl_and_load_stats(monkeypatch):
     fixed_time = datetime(2023, 1, 1, 12, 0, 0)
-    mock_settings = Settings(app_name="test-service", heartbeat_interval_seconds=30)
-
-    mock_channel = MagicMock()
-    mock_channel.declare_exchange = AsyncMock()
-    mock_channel.declare_queue = AsyncMock()
+    mock_settings = Settings(app_name="test-service", heartbeat_message_ttl_seconds=90)
     mock_exchange = MagicMock()
-    mock_channel.declare_exchange.return_value = mock_exchange
-    mock_queue = MagicMock()
-    mock_queue.bind = AsyncMock()
-    mock_channel.declare_queue.return_value = mock_queue
+    mock_exchange.publish = AsyncMock()
+    stats = LoadStats()
+    stats.in_flight = 3
+    stats.event_loop_lag_seconds = 0.25
+    monkeypatch.setattr(heartbeat, "load_stats", stats)
 
-    mock_connection = MagicMock()
-    mock_connection.channel.return_value = DummyChannelContext(mock_channel)
-    mock_connection.close = AsyncMock()
-
-    with patch('app.heartbeat.aio_pika.connect_robust', return_value=mock_connection), \
-         patch('app.heartbeat.settings', mock_settings), \
+    with patch('app.heartbeat.settings', mock_settings), \
          patch('app.heartbeat.Message') as mock_message, \
          patch('app.heartbeat.datetime') as mock_datetime, \
          patch('app.heartbeat.compute_config_cache_fingerprint', return_value='abc123'):
         mock_datetime.utcnow.return_value = fixed_time
-        await send_heartbeat()
-
-    mock_channel.declare_exchange.assert_called_once_with(
-        HEARTBEAT_EXCHANGE_NAME, aio_pika.ExchangeType.DIRECT, durable=True
-    )
-    mock_channel.declare_queue.assert_called_once_with(HEARTBEAT_QUEUE_NAME, durable=True)
-    mock_queue.bind.assert_called_once_with(mock_exchange, routing_key=HEARTBEAT_QUEUE_NAME)
+        await send_heartbeat(mock_exchange)
 
     args, kwargs = mock_message.call_args
-    body = args[0]
-    payload = json.loads(body)
+    payload = json.loads(args[0])
     assert payload == {
         "service": mock_settings.app_name,
+        "instance": heartbeat.INSTANCE_ID,
         "timestamp": fixed_time.isoformat(),
         "config_cache_fingerprint": "abc123",
+        "load": {"in_flight_requests": 3, "event_loop_lag_seconds": 0.25, "publish_confirm_seconds": 0.0},
     }
     assert kwargs["content_type"] == "application/json"
-    assert kwargs["delivery_mode"] == aio_pika.DeliveryMode.PERSISTENT
+    assert kwargs["delivery_mode"] == aio_pika.DeliveryMode.NOT_PERSISTENT
+    assert kwargs["expiration"] == 90
 
-    mock_exchange.publish.assert_called_once_with(
+    mock_exchange.publish.assert_awaited_once_with(
         mock_message.return_value, routing_key=HEARTBEAT_QUEUE_NAME
     )
-    mock_connection.close.assert_awaited_once()
-
-
-def test_compute_config_cache_fingerprint_hashes_canonical_json(tmp_path, monkeypatch):
-    cache_file = tmp_path / "config_cache.json"
-    raw_content = """{
-    "users": {
-        "api-1": {
-            "user_id": 1,
-            "username": "Alice",
-            "daily_quota": 5
-        }
-    },
-    "providers": {
-        "beta": {
-            "is_active": true,
-            "aliases": ["b"]
-        },
-        "alpha": {
-            "is_active": false
-        }
-    }
-}
-"""
-    cache_file.write_text(raw_content)
-    monkeypatch.setattr(cache, "CONFIG_CACHE_PATH", cache_file, raising=False)
+    assert stats.publish_confirm_seconds > 0
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_task_declares_topology_once_on_the_shared_connection(monkeypatch):
+    mock_channel = MagicMock()
+    mock_exchange = MagicMock()
+    mock_queue = MagicMock()
+    mock_queue.bind = AsyncMock()
+    mock_channel.declare_exchange = AsyncMock(return_value=mock_exchange)
+    mock_channel.declare_queue = AsyncMock(return_value=mock_queue)
+    mock_connection = MagicMock()
+    mock_connection.channel = AsyncMock(return_value=mock_channel)
+
+    sent = []
 
-    fingerprint = heartbeat.compute_config_cache_fingerprint()
+    async def fake_send(exchange):
+        sent.append(exchange)
+        if len(sent) == 3:
+            raise asyncio.CancelledError
 
-    payload = json.loads(raw_content)
-    expected_serialized = json.dumps(payload, sort_keys=True, separators=(",", ":"))
-    assert fingerprint == hashlib.sha256(expected_serialized.encode("utf-8")).hexdigest()
+    monkeypatch.setattr(heartbeat, "send_heartbeat", fake_send)
+    monkeypatch.setattr(heartbeat.settings, "heartbeat_interval_seconds", 0, raising=False)
 
+    with patch('app.heartbeat.aio_pika.connect_robust') as connect:
+        with pytest.raises(asyncio.CancelledError):
+            await heartbeat.start_heartbeat_task(mock_connection)
 
-def test_compute_config_cache_fingerprint_handles_missing_file(tmp_path, monkeypatch):
-    cache_file = tmp_path / "config_cache.json"
-    if cache_file.exists():
-        cache_file.unlink()
-    monkeypatch.setattr(cache, "CONFIG_CACHE_PATH", cache_file, raising=False)
+    connect.assert_not_called()
+    mock_connection.channel.assert_awaited_once_with(publisher_confirms=True)
+    mock_channel.declare_exchange.assert_awaited_once_with(
+        HEARTBEAT_EXCHANGE_NAME, aio_pika.ExchangeType.DIRECT, durable=True
+    )
+    mock_channel.declare_queue.assert_awaited_once_with(HEARTBEAT_QUEUE_NAME, durable=True)
+    mock_queue.bind.assert_awaited_once_with(mock_exchange, routing_key=HEARTBEAT_QUEUE_NAME)
+    assert sent == [mock_exchange] * 3
 
-    assert heartbeat.compute_config_cache_fingerprint() is None
 
+def test_publish_confirm_latency_is_a_moving_average():
+    stats = LoadStats()
+    stats.record_publish_confirm(1.0)
+    stats.record_publish_confirm(2.0)
 
-def test_compute_config_cache_fingerprint_handles_invalid_json(tmp_path, monkeypatch):
-    cache_file = tmp_path / "config_cache.json"
-    cache_file.write_text("{invalid json}")
-    monkeypatch.setattr(cache, "CONFIG_CACHE_PATH", cache_file, raising=False)
+    assert stats.publish_confirm_seconds == pytest.approx(1.2)
 
-    assert heartbeat.compute_config_cache_fingerprint() is None
+
+def test_compute_config_cache_fingerprint_reads_the_current_snapshot():
+    snapshot = cache.ConfigSnapshot(digest=0xABC)
+    previous = cache.swap_snapshot(snapshot)
+    try:
+        with patch("pathlib.Path.open") as path_open:
+            assert heartbeat.compute_config_cache_fingerprint() == "0" * 61 + "abc"
+        path_open.assert_not_called()
+    finally:
+        cache.swap_snapshot(previous)
 
 
 @pytest.mark.asyncio
 async def test_start_heartbeat_task_respects_cancellation(monkeypatch):
     started = asyncio.Event()
 
-    async def fake_send():
+    async def fake_send(exchange):
         started.set()
         await asyncio.Event().wait()
 
@@ -138,10 +122,33 @@ async def test_start_heartbeat_task_respects_cancellation(monkeypatch):
         raising=False,
     )
 
-    task = asyncio.create_task(heartbeat.start_heartbeat_task())
+    mock_channel = MagicMock()
+    mock_channel.declare_exchange = AsyncMock()
+    mock_channel.declare_queue = AsyncMock()
+    mock_connection = MagicMock()
+    mock_connection.channel = AsyncMock(return_value=mock_channel)
+
+    task = asyncio.create_task(heartbeat.start_heartbeat_task(mock_connection))
 
     await asyncio.wait_for(started.wait(), timeout=1)
 
     task.cancel()
     with pytest.raises(asyncio.CancelledError):
         await task
+
+
+@pytest.mark.asyncio
+async def test_in_flight_requests_are_counted_while_handled(monkeypatch):
+    stats = LoadStats()
+    monkeypatch.setattr(load_stats_module, "load_stats", stats)
+    seen = []
+
+    async def call_next(request):
+        seen.append(stats.in_flight)
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        await load_stats_module.track_in_flight(MagicMock(), call_next)
+
+    assert seen == [1]
+    assert stats.in_flight == 0
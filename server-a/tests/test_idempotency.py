@@ -1,7 +1,7 @@
 import pytest
 import json
 from unittest.mock import AsyncMock, patch, MagicMock
-from fastapi import FastAPI, Request, Response, status, HTTPException
+from fastapi import Depends, FastAPI, Request, Response, status, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.testclient import TestClient
 from httpx import AsyncClient
@@ -11,12 +11,20 @@ import dataclasses
 
 from redis.asyncio import Redis
 
+from app import cache
+from app.auth import get_client_context
+from app.cache import hash_api_key
 from app.idempotency import idempotency_middleware, get_redis_client
-from app.config import Settings
+from app.config import ClientConfig, Settings
 from app.schemas import SendSmsResponse, ErrorResponse
 from app.main import custom_json_serializer
 from datetime import datetime, timedelta
 
+
+def _redis_key(api_key, idempotency_key):
+    return f"idem:{hash_api_key(api_key).hex()}:{idempotency_key}"
+
+
 # Mock settings for testing
 @pytest.fixture
 def mock_settings():
@@ -69,7 +77,7 @@ def test_app(mock_settings, mock_redis_client):
         @app.middleware("http")
         async def add_client_to_state(request: Request, call_next):
             request.state.client = MagicMock()
-            request.state.client.api_key = "client_key_1"
+            request.state.client.key_id = "client_key_1"
             response = await call_next(request)
             return response
 
@@ -88,9 +96,9 @@ async def test_first_request_stores_response(test_app, mock_redis_client, mock_s
         )
 
     assert response.status_code == status.HTTP_200_OK
-    mock_redis_client.get.assert_called_once_with(f"idem:client_key_1:{idempotency_key}")
+    mock_redis_client.get.assert_called_once_with(_redis_key("client_key_1", idempotency_key))
     mock_redis_client.set.assert_called_once()
-    mock_redis_client.expire.assert_called_once_with(f"idem:client_key_1:{idempotency_key}", mock_settings.idempotency_ttl_seconds)
+    mock_redis_client.expire.assert_called_once_with(_redis_key("client_key_1", idempotency_key), mock_settings.idempotency_ttl_seconds)
 
     # Verify the stored content
     stored_data = json.loads(mock_redis_client.set.call_args[0][1])
@@ -118,7 +126,7 @@ async def test_second_request_returns_cached_success_response(test_app, mock_red
 
     assert response.status_code == status.HTTP_200_OK
     assert response.json() == json.loads(cached_body)
-    mock_redis_client.get.assert_called_once_with(f"idem:client_key_1:{idempotency_key}")
+    mock_redis_client.get.assert_called_once_with(_redis_key("client_key_1", idempotency_key))
     mock_redis_client.set.assert_not_called() # Should not call set again
     mock_redis_client.expire.assert_not_called()
 
@@ -148,9 +156,9 @@ async def test_second_request_returns_cached_error_response(test_app, mock_redis
 
     assert response.status_code == status.HTTP_400_BAD_REQUEST
     assert response.json() == json.loads(error_body)
-    mock_redis_client.get.assert_called_once_with(f"idem:client_key_1:{idempotency_key}")
+    mock_redis_client.get.assert_called_once_with(_redis_key("client_key_1", idempotency_key))
     mock_redis_client.set.assert_not_called()
-    mock_redis_client.expire.assert_called_once_with(f"idem:client_key_1:{idempotency_key}", mock_settings.idempotency_ttl_seconds)
+    mock_redis_client.expire.assert_called_once_with(_redis_key("client_key_1", idempotency_key), mock_settings.idempotency_ttl_seconds)
 
 @pytest.mark.asyncio
 async def test_request_without_idempotency_key_is_not_cached(test_app, mock_redis_client):
@@ -179,7 +187,7 @@ async def test_idempotency_key_with_different_client_api_key_is_different_key(te
         )
     assert response1.status_code == status.HTTP_200_OK
     mock_redis_client.set.assert_called_once_with(
-        f"idem:client_key_1:{idempotency_key}",
+        _redis_key("client_key_1", idempotency_key),
         json.dumps(json.loads(mock_redis_client.set.call_args[0][1])), # Re-parse to compare content
         ex=mock_settings.idempotency_ttl_seconds,
         nx=True
@@ -187,7 +195,7 @@ async def test_idempotency_key_with_different_client_api_key_is_different_key(te
     mock_redis_client.set.reset_mock() # Reset mock for next assertion
 
     # Second request with a different client_key (assuming it's valid and set up in mock_settings)
-    # For this test, we'll simulate a different client_key by changing the request.state.client.api_key
+    # For this test, we'll simulate a different client_key by changing the request.state.client.key_id
     # In a real scenario, this would come from a different auth dependency call.
     with patch('app.idempotency.get_settings', return_value=mock_settings):
         with patch('app.idempotency.get_redis_client', return_value=mock_redis_client):
@@ -195,7 +203,7 @@ async def test_idempotency_key_with_different_client_api_key_is_different_key(te
             @app.middleware("http")
             async def add_idempotency_middleware_for_client2(request: Request, call_next):
                 request.state.client = AsyncMock()
-                request.state.client.api_key = "client_key_2" # Different client key
+                request.state.client.key_id = "client_key_2" # Different client key
                 return await idempotency_middleware(request, call_next)
 
             @app.post("/test-endpoint")
@@ -215,8 +223,38 @@ async def test_idempotency_key_with_different_client_api_key_is_different_key(te
     
     assert response2.status_code == status.HTTP_200_OK
     mock_redis_client.set.assert_called_once_with(
-        f"idem:client_key_2:{idempotency_key}", # Key should be different
+        _redis_key("client_key_2", idempotency_key), # Key should be different
         json.dumps(json.loads(mock_redis_client.set.call_args[0][1])),
         ex=mock_settings.idempotency_ttl_seconds,
         nx=True
-    )
\ No newline at end of file
+    )
+
+
+@pytest.mark.asyncio
+async def test_api_key_is_hashed_once_and_never_sent_to_redis(mock_settings, mock_redis_client):
+    app = FastAPI()
+    previous = cache.swap_snapshot(
+        cache.ConfigSnapshot.build(clients={hash_api_key("client_key_1"): ClientConfig(user_id=1, username="c1")})
+    )
+    try:
+        with patch('app.idempotency.settings', mock_settings), \
+             patch('app.idempotency.get_redis_client', return_value=mock_redis_client), \
+             patch('app.auth.hash_api_key', wraps=hash_api_key) as hashed:
+            app.middleware("http")(idempotency_middleware)
+
+            @app.post("/test-endpoint")
+            async def test_endpoint(client=Depends(get_client_context)):
+                return JSONResponse(content={"user": client.username})
+
+            async with AsyncClient(app=app, base_url="http://test") as client:
+                response = await client.post(
+                    "/test-endpoint",
+                    headers={"Idempotency-Key": "k", "API-Key": "client_key_1"},
+                )
+    finally:
+        cache.swap_snapshot(previous)
+
+    assert response.json() == {"user": "c1"}
+    assert hashed.call_count == 1
+    for call_args in mock_redis_client.get.call_args_list + mock_redis_client.set.call_args_list:
+        assert "client_key_1" not in call_args.args[0]
@@ -0,0 +1,75 @@
+import json
+import logging
+import queue
+
+from app.logging import JsonFormatter, LogSampler, NonBlockingQueueHandler, RateLimitFilter
+from app.metrics import APP_REGISTRY
+
+
+def _record(name="app.main", level=logging.INFO, msg="hello %s", args=("world",), **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def _dropped(reason):
+    return APP_REGISTRY.get_sample_value("sms_log_records_dropped_total", {"reason": reason}) or 0
+
+
+def test_json_formatter_keeps_fixed_fields_and_extras():
+    line = JsonFormatter().format(_record(tracking_id="t-1", provider="magfa"))
+
+    data = json.loads(line)
+    assert data["message"] == "hello world"
+    assert data["level"] == "INFO"
+    assert data["service"] == "server-a"
+    assert data["tracking_id"] == "t-1"
+    assert data["client_key_id"] is None
+    assert data["provider"] == "magfa"
+    assert "args" not in data and "msg" not in data
+
+
+def test_sampler_keeps_or_drops_a_request_as_a_whole():
+    sampler = LogSampler(0.5)
+    decisions = {
+        tracking_id: sampler.filter(_record(tracking_id=tracking_id))
+        for tracking_id in (f"req-{i}" for i in range(200))
+    }
+
+    assert 0 < sum(decisions.values()) < 200
+    for tracking_id, kept in decisions.items():
+        assert sampler.filter(_record(msg="second line", args=(), tracking_id=tracking_id)) is kept
+
+
+def test_sampler_never_drops_warnings_or_other_loggers():
+    sampler = LogSampler(0.0)
+
+    assert sampler.filter(_record(level=logging.WARNING))
+    assert sampler.filter(_record(name="uvicorn.access"))
+    assert not sampler.filter(_record())
+
+
+def test_rate_limit_is_per_logger():
+    limiter = RateLimitFilter(3)
+    before = _dropped("rate_limited")
+
+    kept = [limiter.filter(_record()) for _ in range(10)]
+
+    assert kept[:3] == [True] * 3
+    assert sum(kept) == 3
+    assert limiter.filter(_record(name="app.other"))
+    assert limiter.filter(_record(level=logging.CRITICAL))
+    assert _dropped("rate_limited") == before + 7
+
+
+def test_queue_handler_drops_instead_of_blocking_when_full():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    before = _dropped("queue_full")
+
+    handler.handle(_record())
+    handler.handle(_record())
+
+    assert handler.queue.qsize() == 1
+    assert _dropped("queue_full") == before + 1
+    queued = handler.queue.get_nowait()
+    assert queued.msg == "hello world" and queued.args is None
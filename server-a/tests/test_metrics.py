@@ -3,7 +3,16 @@ import base64
 import pytest
 from fastapi.testclient import TestClient
 
+from app import metrics
+from app.config import ClientConfig
 from app.main import app, settings
+from app.metrics import (
+    OVERFLOW_CLIENT_LABEL,
+    SMS_REQUEST_REJECTED_PROVIDER_DISABLED_TOTAL,
+    SMS_SEND_REQUESTS_TOTAL,
+    UNKNOWN_CLIENT_LABEL,
+    ClientLabels,
+)
 
 
 def _encode_basic_auth(username: str, password: str) -> str:
@@ -58,3 +67,43 @@ def test_metrics_endpoint_returns_metrics_for_valid_credentials():
     assert response.status_code == 200
     assert response.headers.get("content-type", "").startswith("text/plain")
     assert "sms_send_requests_total" in response.text
+
+
+def test_client_labels_are_capped():
+    labels = ClientLabels(max_clients=2)
+
+    assert labels.label(ClientConfig(user_id=1, username="a")) == "1"
+    assert labels.label(ClientConfig(user_id=2, username="b")) == "2"
+    assert labels.label(ClientConfig(user_id=3, username="c")) == OVERFLOW_CLIENT_LABEL
+    assert labels.label(ClientConfig(user_id=1, username="a")) == "1"
+    assert labels.label(None) == UNKNOWN_CLIENT_LABEL
+
+
+def test_client_label_children_are_reused():
+    labels = ClientLabels(max_clients=10)
+    client = ClientConfig(user_id=7, username="g")
+
+    first = labels.child(SMS_REQUEST_REJECTED_PROVIDER_DISABLED_TOTAL, client, provider="magfa")
+    second = labels.child(SMS_REQUEST_REJECTED_PROVIDER_DISABLED_TOTAL, client, provider="magfa")
+
+    assert first is second
+    assert first is not labels.child(SMS_REQUEST_REJECTED_PROVIDER_DISABLED_TOTAL, client, provider="other")
+
+
+def test_metrics_content_serves_the_refreshed_payload_while_fresh(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_cache_seconds", 5)
+    cached = metrics.refresh_metrics_payload()
+    SMS_SEND_REQUESTS_TOTAL.inc()
+
+    assert metrics.metrics_content().body == cached
+
+    monkeypatch.setattr(metrics._exposition, "generated_at", metrics._exposition.generated_at - 60)
+    assert metrics.metrics_content().body != cached
+
+
+def test_metrics_content_renders_inline_when_caching_is_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_cache_seconds", 0)
+    cached = metrics.refresh_metrics_payload()
+    SMS_SEND_REQUESTS_TOTAL.inc()
+
+    assert metrics.metrics_content().body != cached
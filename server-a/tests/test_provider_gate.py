@@ -1,10 +1,13 @@
+import dataclasses
+
 import pytest
 from fastapi import HTTPException, Request, status
 from unittest.mock import MagicMock, patch
 
 from app.provider_gate import ProviderGate
-from app.config import Settings, ProviderConfig
-from app.cache import PROVIDER_CONFIG_CACHE, PROVIDER_ALIAS_MAP_CACHE, build_provider_alias_map
+from app.config import Settings, ProviderConfig, normalize_provider_key
+from app.cache import ConfigSnapshot, build_provider_alias_map, swap_snapshot
+from app.metrics import APP_REGISTRY
 
 @pytest.fixture
 def mock_providers_config() -> dict:
@@ -23,30 +26,30 @@ def provider_gate_instance(mock_providers_config: dict) -> ProviderGate:
     Creates a ProviderGate instance with a mocked configuration.
     This fixture allows tests to modify the provider config on the fly.
     """
-    PROVIDER_CONFIG_CACHE.clear()
-    PROVIDER_CONFIG_CACHE.update(mock_providers_config)
-    PROVIDER_ALIAS_MAP_CACHE.clear()
-    PROVIDER_ALIAS_MAP_CACHE.update(build_provider_alias_map(mock_providers_config))
+    previous = swap_snapshot(ConfigSnapshot.build(providers=mock_providers_config))
 
     with patch('app.config.get_settings') as mock_get_settings:
         mock_settings = MagicMock(spec=Settings)
         mock_settings.PROVIDER_GATE_ENABLED = True
+        mock_settings.provider_gate_cache_size = 1024
         mock_get_settings.return_value = mock_settings
         gate = ProviderGate()
-        return gate
+    yield gate
+    swap_snapshot(previous)
 
 @pytest.fixture
 def mock_request() -> Request:
     """Creates a mock FastAPI request with a client context."""
     request = MagicMock(spec=Request)
     request.state.client = MagicMock()
-    request.state.client.api_key = "client_key_1"
+    request.state.client.key_id = "client_key_1"
+    request.state.client.user_id = 1
     return request
 
-def test_smart_selection_no_providers_available(provider_gate_instance: ProviderGate, mock_request: Request):
+def test_smart_selection_no_providers_available(provider_gate_instance: ProviderGate, mock_request: Request, mock_providers_config: dict):
     # Disable all providers for this specific test
-    for config in provider_gate_instance.providers_config.values():
-        config.is_active = False
+    disabled = {name: dataclasses.replace(config, is_active=False) for name, config in mock_providers_config.items()}
+    swap_snapshot(ConfigSnapshot.build(providers=disabled))
 
     with pytest.raises(HTTPException) as exc_info:
         provider_gate_instance.process_providers(mock_request, None)
@@ -67,6 +70,18 @@ def test_unknown_provider_rejection(provider_gate_instance: ProviderGate, mock_r
     assert exc_info.value.detail["error_code"] == "UNKNOWN_PROVIDER"
     assert "UnknownProvider" in exc_info.value.detail["message"]
 
+def test_rejections_are_labelled_by_user_id(provider_gate_instance: ProviderGate, mock_request: Request):
+    def rejected():
+        return APP_REGISTRY.get_sample_value(
+            "sms_request_rejected_provider_disabled_total", {"client": "1", "provider": "ProviderB"}
+        ) or 0
+
+    before = rejected()
+    with pytest.raises(HTTPException):
+        provider_gate_instance.process_providers(mock_request, ["ProviderB"])
+
+    assert rejected() == before + 1
+
 def test_exclusive_provider_disabled_rejection(provider_gate_instance: ProviderGate, mock_request: Request):
     # ProviderB is inactive in the default fixture
     with pytest.raises(HTTPException) as exc_info:
@@ -137,10 +152,10 @@ def test_empty_provider_entries_use_smart_selection(provider_gate_instance: Prov
     result = provider_gate_instance.process_providers(mock_request, ["", "   ", "\t\n"]) 
     assert result == []
 
-def test_empty_provider_entries_with_no_available_providers_raise_503(provider_gate_instance: ProviderGate, mock_request: Request):
+def test_empty_provider_entries_with_no_available_providers_raise_503(provider_gate_instance: ProviderGate, mock_request: Request, mock_providers_config: dict):
     # Disable all providers to simulate unavailability
-    for config in provider_gate_instance.providers_config.values():
-        config.is_active = False
+    disabled = {name: dataclasses.replace(config, is_active=False) for name, config in mock_providers_config.items()}
+    swap_snapshot(ConfigSnapshot.build(providers=disabled))
 
     with pytest.raises(HTTPException) as exc_info:
         provider_gate_instance.process_providers(mock_request, ["", "   "])
@@ -158,3 +173,54 @@ def test_provider_gate_disabled_with_empty_entries(provider_gate_instance: Provi
     # When gate is disabled and only empty providers are sent, treat as no providers requested
     result = provider_gate_instance.process_providers(mock_request, ["", "   "])
     assert result == []
+
+def test_decisions_are_memoized_per_snapshot(provider_gate_instance: ProviderGate, mock_request: Request):
+    with patch('app.config.normalize_provider_key', wraps=normalize_provider_key) as normalize:
+        first = provider_gate_instance.process_providers(mock_request, ["provider-a", "ProviderD"])
+        second = provider_gate_instance.process_providers(mock_request, ["provider-a", "ProviderD"])
+
+    assert first == second == ["ProviderA", "ProviderD"]
+    # Aliases are resolved on the first request only.
+    assert normalize.call_count == 2
+    # Callers get their own list, never the cached one.
+    first.append("ProviderE")
+    assert provider_gate_instance.process_providers(mock_request, ["provider-a", "ProviderD"]) == ["ProviderA", "ProviderD"]
+
+def test_snapshot_swap_invalidates_decisions(provider_gate_instance: ProviderGate, mock_request: Request, mock_providers_config: dict):
+    with pytest.raises(HTTPException):
+        provider_gate_instance.process_providers(mock_request, ["ProviderB"])
+
+    enabled = dict(mock_providers_config, ProviderB=ProviderConfig(is_active=True, is_operational=True))
+    swap_snapshot(ConfigSnapshot.build(providers=enabled))
+
+    assert provider_gate_instance.process_providers(mock_request, ["ProviderB"]) == ["ProviderB"]
+
+def test_cached_rejections_still_count_every_request(provider_gate_instance: ProviderGate, mock_request: Request):
+    def rejected():
+        return APP_REGISTRY.get_sample_value(
+            "sms_request_rejected_unknown_provider_total", {"client": "1"}
+        ) or 0
+
+    before = rejected()
+    for _ in range(3):
+        with pytest.raises(HTTPException) as exc_info:
+            provider_gate_instance.process_providers(mock_request, ["UnknownProvider"])
+        assert exc_info.value.detail["error_code"] == "UNKNOWN_PROVIDER"
+
+    assert rejected() == before + 3
+
+def test_decision_cache_is_bounded(provider_gate_instance: ProviderGate, mock_request: Request):
+    provider_gate_instance.settings.provider_gate_cache_size = 2
+    swap_snapshot(ConfigSnapshot.build(providers={"ProviderA": ProviderConfig(is_active=True, is_operational=True)}))
+
+    for name in ["ProviderA", "providera", "PROVIDERA"]:
+        provider_gate_instance.process_providers(mock_request, [name])
+
+    assert provider_gate_instance._decide_cached.cache_info().currsize == 2
+
+def test_unhashable_entries_are_ignored(provider_gate_instance: ProviderGate, mock_request: Request):
+    assert provider_gate_instance.process_providers(mock_request, [{"name": "ProviderA"}, "ProviderA"]) == ["ProviderA"]
+
+def test_snapshot_lists_active_providers(mock_providers_config: dict):
+    snapshot = ConfigSnapshot.build(providers=mock_providers_config)
+    assert snapshot.active_providers == ("ProviderA", "ProviderD", "ProviderE")
@@ -75,13 +75,55 @@ async def test_publish_sms_message_publishes_and_closes_connection():
         "ttl_seconds": 60,
         "providers_original": ["ProviderA"],
         "providers_effective": ["ProviderA"],
+        "priority": "normal",
         "created_at": fixed_time.isoformat(),
     }
     assert kwargs["content_type"] == "application/json"
     assert kwargs["delivery_mode"] == aio_pika.DeliveryMode.PERSISTENT
+    assert "priority" not in kwargs
 
     mock_exchange.publish.assert_awaited_once_with(
         mock_message.return_value,
         routing_key="test_routing_key",
     )
-    mock_connection.close.assert_awaited_once()
\ No newline at end of file
+    mock_connection.close.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_publish_sms_message_routes_high_priority_to_dedicated_lane():
+    mock_channel = MagicMock()
+    mock_exchange = MagicMock()
+    mock_exchange.publish = AsyncMock()
+    mock_channel.declare_exchange = AsyncMock(return_value=mock_exchange)
+    mock_queue = MagicMock()
+    mock_queue.bind = AsyncMock()
+    mock_channel.declare_queue = AsyncMock(return_value=mock_queue)
+
+    mock_connection = MagicMock()
+    mock_connection.channel.return_value = DummyChannelContext(mock_channel)
+    mock_connection.close = AsyncMock()
+
+    with patch('app.rabbit.get_rabbitmq_connection', new=AsyncMock(return_value=mock_connection)), \
+         patch('app.rabbit.RABBITMQ_EXCHANGE_NAME', new="test_exchange"), \
+         patch('app.rabbit.RABBITMQ_HIGH_PRIORITY_QUEUE_NAME', new="test_high_queue"), \
+         patch('app.rabbit.Message') as mock_message:
+        await publish_sms_message(
+            user_id=1,
+            client_key="client1",
+            to="+989001234567",
+            text="Your code is 1234",
+            ttl_seconds=60,
+            providers_original=None,
+            providers_effective=[],
+            tracking_id=uuid4(),
+            priority="high",
+        )
+
+    mock_channel.declare_queue.assert_called_once_with("test_high_queue", durable=True)
+    mock_queue.bind.assert_called_once_with("test_exchange", routing_key="test_high_queue")
+    _, kwargs = mock_message.call_args
+    assert "priority" not in kwargs
+    assert json.loads(mock_message.call_args[0][0])["priority"] == "high"
+    mock_exchange.publish.assert_awaited_once_with(
+        mock_message.return_value,
+        routing_key="test_high_queue",
+    )
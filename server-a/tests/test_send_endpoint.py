@@ -13,10 +13,15 @@ from typing import Union
 from app.schemas import SendSmsRequest, SendSmsResponse, ErrorResponse
 from app.config import Settings, ClientConfig
 from app.auth import ClientContext, get_client_context
+from app.cache import hash_api_key
 
 # Apply the exception handler to the test app instance
 app.add_exception_handler(HTTPException, http_exception_handler)
 
+
+def _redis_key(api_key, idempotency_key):
+    return f"idem:{hash_api_key(api_key).hex()}:{idempotency_key}"
+
 # Mock settings for testing
 @pytest.fixture
 def mock_settings():
@@ -49,7 +54,7 @@ def mock_dependencies(mock_settings):
 
         async def _mock_get_client_context(request: Request, api_key: Union[str, None] = None):
             get_client_context_tracker()
-            ctx = ClientContext(api_key="client_key_1", user_id=1, username="Test Client 1", is_active=True, daily_quota=100)
+            ctx = ClientContext(key_id="client_key_1", user_id=1, username="Test Client 1", is_active=True, daily_quota=100)
             request.state.client = ctx
             return ctx
         mock_provider_gate_process_providers = MagicMock(return_value=["ProviderA"])
@@ -128,6 +133,7 @@ async def test_send_sms_success(mock_dependencies):
     assert kwargs["providers_original"] == sms_request_payload["providers"]
     assert kwargs["providers_effective"] == ["ProviderA"]
     assert isinstance(kwargs["tracking_id"], UUID)
+    assert kwargs["priority"] == "normal"
 
 @pytest.mark.asyncio
 async def test_send_sms_idempotency_key_stores_response(mock_dependencies, mock_settings):
@@ -151,7 +157,7 @@ async def test_send_sms_idempotency_key_stores_response(mock_dependencies, mock_
     
     # Verify the key and expiration
     set_args, set_kwargs = mock_dependencies["redis_client"].set.call_args
-    assert set_args[0] == f"idem:client_key_1:{idempotency_key}"
+    assert set_args[0] == _redis_key("client_key_1", idempotency_key)
     assert set_kwargs["ex"] == mock_settings.idempotency_ttl_seconds
 
     # Verify the stored content
@@ -193,7 +199,7 @@ async def test_send_sms_idempotency_key_returns_cached_response(mock_dependencie
 
     assert response.status_code == status.HTTP_202_ACCEPTED
     assert response.json()["tracking_id"] == str(cached_tracking_id)
-    mock_dependencies["redis_client"].get.assert_called_once_with(f"idem:client_key_1:{idempotency_key}")
+    mock_dependencies["redis_client"].get.assert_called_once_with(_redis_key("client_key_1", idempotency_key))
     mock_dependencies["publish_sms_message"].assert_not_called() # Should not publish again
     mock_dependencies["enforce_daily_quota"].assert_not_called() # Should not enforce quota again
 
@@ -317,6 +323,47 @@ async def test_send_sms_rejects_long_local_number_without_zero(mock_dependencies
     mock_dependencies["enforce_daily_quota"].assert_not_called()
     mock_dependencies["publish_sms_message"].assert_not_called()
 
+@pytest.mark.asyncio
+async def test_send_sms_forwards_normalized_priority(mock_dependencies):
+    sms_request_payload = {
+        "to": "+989121234567",
+        "text": "Your code is 1234",
+        "priority": " HIGH ",
+    }
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post(
+            "/api/v1/sms/send",
+            headers={"API-Key": "client_key_1"},
+            json=sms_request_payload
+        )
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    _, kwargs = mock_dependencies["publish_sms_message"].call_args
+    assert kwargs["priority"] == "high"
+
+@pytest.mark.asyncio
+async def test_send_sms_rejects_unknown_priority(mock_dependencies):
+    sms_request_payload = {
+        "to": "+989121234567",
+        "text": "Hello, world!",
+        "priority": "urgent",
+    }
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post(
+            "/api/v1/sms/send",
+            headers={"API-Key": "client_key_1"},
+            json=sms_request_payload
+        )
+
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    response_json = response.json()
+    assert response_json["error_code"] == "INVALID_PAYLOAD"
+    assert response_json["message"] == "Priority must be one of: high, normal, low."
+    mock_dependencies["provider_gate_process_providers"].assert_not_called()
+    mock_dependencies["publish_sms_message"].assert_not_called()
+
 @pytest.mark.asyncio
 async def test_send_sms_provider_gate_rejection(mock_dependencies):
     sms_request_payload = {
@@ -0,0 +1,73 @@
+import hashlib
+
+import pytest
+
+from app import snapshot_store
+from app.config import ClientConfig
+
+
+def _key(n):
+    return hashlib.sha256(str(n).encode()).digest()
+
+
+def _clients(count):
+    return {
+        _key(n): ClientConfig(user_id=n, username=f"user{n}", daily_quota=n, key_id=_key(n)[:8].hex())
+        for n in range(count)
+    }
+
+
+def test_round_trip_looks_up_records_in_the_mapped_file(tmp_path):
+    path = tmp_path / "snapshot.bin"
+    clients = _clients(50)
+    clients[_key("orphan")] = ClientConfig(user_id=None, username="ünïcode", is_active=False, key_id="x")
+    providers = [{"id": 3, "name": "Twilio", "aliases": ["twi"]}]
+
+    snapshot_store.write_snapshot(path, clients, providers, version=12, fingerprint="ab" * 32)
+    stored = snapshot_store.read_snapshot(path)
+
+    assert stored.fingerprint == "ab" * 32
+    assert stored.version == 12
+    assert stored.providers == providers
+    assert len(stored.clients) == 51
+    assert stored.clients[_key(7)] == clients[_key(7)]
+    assert stored.clients.get(_key(7)) is stored.clients[_key(7)]
+    assert stored.clients[_key("orphan")].username == "ünïcode"
+    assert stored.clients[_key("orphan")].user_id is None
+    assert stored.clients.get(_key("missing")) is None
+    assert _key("missing") not in stored.clients
+    assert stored.key_hash_by_user_id[7] == _key(7)
+    assert 999 not in stored.key_hash_by_user_id
+    assert dict(stored.key_hash_by_user_id.items()) == {n: _key(n) for n in range(50)}
+    assert dict(stored.clients.items()) == {
+        key: clients[key] if key != _key("orphan") else stored.clients[key] for key in clients
+    }
+
+
+def test_write_is_atomic_and_leaves_no_temp_files(tmp_path):
+    path = tmp_path / "snapshot.bin"
+    snapshot_store.write_snapshot(path, _clients(3), [], version=1, fingerprint="a" * 64)
+    held = snapshot_store.read_snapshot(path)
+
+    snapshot_store.write_snapshot(path, _clients(5), [], version=2, fingerprint="b" * 64)
+
+    assert [p.name for p in tmp_path.iterdir()] == ["snapshot.bin"]
+    assert len(held.clients) == 3
+    assert snapshot_store.read_snapshot(path).version == 2
+
+
+@pytest.mark.parametrize("damage", ["truncate", "flip", "magic"])
+def test_damaged_files_are_rejected(tmp_path, damage):
+    path = tmp_path / "snapshot.bin"
+    snapshot_store.write_snapshot(path, _clients(5), [], version=1, fingerprint="0" * 64)
+    data = bytearray(path.read_bytes())
+    if damage == "truncate":
+        data = data[:-3]
+    elif damage == "flip":
+        data[-10] ^= 0xFF
+    else:
+        data[:6] = b"NOTCFG"
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(ValueError):
+        snapshot_store.read_snapshot(path)
@@ -0,0 +1,93 @@
+import asyncio
+import base64
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import timing
+from app.load_stats import LoadStats
+from app.main import app, settings
+from app.metrics import APP_REGISTRY
+
+
+def _stage_count(name):
+    return APP_REGISTRY.get_sample_value("sms_send_stage_latency_seconds_count", {"stage": name}) or 0
+
+
+def test_stage_is_recorded_when_the_block_raises():
+    before = _stage_count("quota")
+
+    with pytest.raises(RuntimeError):
+        with timing.stage("quota"):
+            raise RuntimeError("redis down")
+
+    assert _stage_count("quota") == before + 1
+
+
+@pytest.mark.asyncio
+async def test_event_loop_lag_monitor_reports_blocked_loop(monkeypatch):
+    stats = LoadStats()
+    monkeypatch.setattr(timing, "load_stats", stats)
+    before = APP_REGISTRY.get_sample_value("sms_event_loop_lag_seconds_count") or 0
+
+    task = asyncio.create_task(timing.monitor_event_loop_lag(0.01))
+    await asyncio.sleep(0)
+    time.sleep(0.05)  # Block the loop past the monitor's wake-up time.
+    await asyncio.sleep(0.02)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert APP_REGISTRY.get_sample_value("sms_event_loop_lag_seconds_sum") >= 0.03
+    assert APP_REGISTRY.get_sample_value("sms_event_loop_lag_seconds_count") > before
+
+
+def test_sample_stacks_returns_collapsed_stacks_of_the_thread():
+    stop = threading.Event()
+
+    def busy_marker():
+        while not stop.is_set():
+            time.sleep(0.001)
+
+    thread = threading.Thread(target=busy_marker)
+    thread.start()
+    try:
+        output = timing.sample_stacks(thread.ident, 0.05, interval=0.001)
+    finally:
+        stop.set()
+        thread.join()
+
+    stack, count = output.splitlines()[0].rsplit(" ", 1)
+    assert "busy_marker" in stack
+    assert stack.index("run") < stack.index("busy_marker")
+    assert int(count) > 0
+
+
+@pytest.fixture
+def metrics_auth(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_username", "user")
+    monkeypatch.setattr(settings, "metrics_password", "pass")
+    token = base64.b64encode(b"user:pass").decode()
+    return {"Authorization": f"Basic {token}"}
+
+
+def test_debug_profile_is_disabled_by_default(metrics_auth, monkeypatch):
+    monkeypatch.setattr(settings, "debug_profile_enabled", False)
+    client = TestClient(app)
+
+    assert client.get("/debug/profile?seconds=0.01").status_code == 401
+    assert client.get("/debug/profile?seconds=0.01", headers=metrics_auth).status_code == 404
+
+
+def test_debug_profile_returns_samples_when_enabled(metrics_auth, monkeypatch):
+    monkeypatch.setattr(settings, "debug_profile_enabled", True)
+    client = TestClient(app)
+
+    response = client.get("/debug/profile?seconds=0.05", headers=metrics_auth)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert response.text.strip()
+
+    assert client.get("/debug/profile?seconds=600", headers=metrics_auth).status_code == 422
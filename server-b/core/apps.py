@@ -5,3 +5,5 @@ class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
 
+    def ready(self):
+        from core import checks, signals  # noqa: F401  (registers the checks and receivers)
@@ -0,0 +1,20 @@
+"""System checks for settings that Server A depends on."""
+from django.conf import settings
+from django.core import checks
+
+
+@checks.register(checks.Tags.security, deploy=True)
+def check_api_key_hash_secret(app_configs, **kwargs):
+    """Server A looks clients up by the HMAC keyed with this secret."""
+    if getattr(settings, "API_KEY_HASH_SECRET", ""):
+        return []
+    return [
+        checks.Error(
+            "API_KEY_HASH_SECRET is not set.",
+            hint=(
+                "Set it to the value of server-a's API_KEY_HASH_SECRET; otherwise "
+                "no broadcast API key matches and every request gets a 401."
+            ),
+            id="core.E001",
+        )
+    ]
@@ -0,0 +1,241 @@
+"""Server A configuration state: snapshot payloads and change recording.
+
+Server A keeps an in-memory copy of every user's API key settings and every
+provider. Server B broadcasts that state as versioned messages on the
+``CONFIG_STATE_EXCHANGE`` fanout exchange:
+
+* ``{"type": "delta", "version": V, "previous_version": V - 1, "changes": [...]}``
+  carries the changes published since version ``V - 1``. Each change is
+  ``{"kind", "id", "entry"}`` where ``entry`` is the full state of the user or
+  provider (``None`` when it was deleted).
+* ``{"type": "snapshot", "version": V, "fingerprint": F, "data": {"users": [...], "providers": [...]}}``
+  is a full checkpoint, published when the state changed, as a low-frequency
+  keepalive and on resync requests. ``F`` is also sent in the ``fingerprint``
+  message header so consumers can drop unchanged snapshots unparsed.
+
+A consumer holding version ``N`` applies the delta with ``previous_version ==
+N``, ignores deltas it already has and asks for a resync when
+``previous_version > N`` (it missed a delta).
+
+User entries identify the API key by ``api_key_hash`` (see ``api_key_hash``),
+never by the raw key.
+
+The fingerprint of a state is the sum, modulo 2**256, of one SHA-256 digest
+per user and provider (``entity_digest``). It does not depend on order, and a
+change is re-fingerprinted by swapping one entity's digest, so both services
+keep it current as changes are applied instead of hashing the whole state.
+"""
+import hashlib
+import hmac
+import json
+
+from django.conf import settings
+from django.db.models import Max
+
+from core.models import ConfigChange, ConfigChangeKind
+
+
+def api_key_hash(api_key: str) -> str:
+    """HMAC-SHA256 of ``api_key`` keyed with ``API_KEY_HASH_SECRET``, as hex.
+
+    Server A indexes clients by the same hash, so the secret must match.
+    """
+    if not api_key:
+        return ""
+    secret = getattr(settings, "API_KEY_HASH_SECRET", "").encode()
+    return hmac.new(secret, api_key.encode(), hashlib.sha256).hexdigest()
+
+
+def user_entry(user) -> dict:
+    profile = getattr(user, "profile", None)
+    return {
+        "user_id": user.id,
+        "username": user.username,
+        "api_key_hash": api_key_hash(str(getattr(profile, "api_key", "") or "")),
+        "daily_quota": getattr(profile, "daily_quota", 0) or 0,
+        "is_active": user.is_active,
+    }
+
+
+def provider_entry(provider) -> dict:
+    return {
+        "id": provider.id,
+        "name": provider.name,
+        "slug": provider.slug,
+        "is_active": provider.is_active,
+        "is_operational": getattr(provider, "is_operational", True),
+        "aliases": getattr(provider, "aliases", []),
+    }
+
+
+def record_user_change(user, deleted: bool = False) -> ConfigChange:
+    return ConfigChange.objects.create(
+        kind=ConfigChangeKind.USER,
+        object_id=user.pk,
+        entry=None if deleted else user_entry(user),
+    )
+
+
+def record_provider_change(provider, deleted: bool = False) -> ConfigChange:
+    return ConfigChange.objects.create(
+        kind=ConfigChangeKind.PROVIDER,
+        object_id=provider.pk,
+        entry=None if deleted else provider_entry(provider),
+    )
+
+
+def current_version() -> int:
+    """Return the version of the last published delta."""
+    return ConfigChange.objects.aggregate(version=Max("version"))["version"] or 0
+
+
+def build_snapshot() -> dict:
+    """Return the full state and the version it includes."""
+    from django.contrib.auth.models import User
+    from providers.models import SmsProvider
+
+    # Read the version before the data: a delta published in between is then
+    # both in the snapshot and re-sent, which is harmless, rather than claimed
+    # by the version but missing from the data.
+    version = current_version()
+    users = [user_entry(user) for user in User.objects.select_related("profile")]
+    providers = [provider_entry(provider) for provider in SmsProvider.objects.all()]
+    return {"version": version, "users": users, "providers": providers}
+
+
+_DIGEST_MODULUS = 1 << 256
+
+
+def entity_digest(kind: str, entry: dict | None) -> int:
+    """Return the digest of a user or provider entry as Server A stores it.
+
+    Entries Server A does not keep (deleted objects, users without an API
+    key, providers without a name) count as 0. The digested fields must match
+    ``client_digest`` and ``provider_digest`` in Server A's ``app.cache``.
+    """
+    if not entry:
+        return 0
+    if kind == ConfigChangeKind.USER:
+        if not entry.get("api_key_hash"):
+            return 0
+        fields = [
+            "user",
+            entry["api_key_hash"],
+            entry.get("user_id"),
+            entry.get("username", ""),
+            int(entry.get("daily_quota", 0)),
+            bool(entry.get("is_active", True)),
+        ]
+    else:
+        name = entry.get("name") or entry.get("slug")
+        if not name:
+            return 0
+        fields = [
+            "provider",
+            name,
+            bool(entry.get("is_active", True)),
+            bool(entry.get("is_operational", True)),
+            list(entry.get("aliases") or []),
+        ]
+    data = json.dumps(fields, separators=(",", ":")).encode("utf-8")
+    return int.from_bytes(hashlib.sha256(data).digest(), "big")
+
+
+class StateFingerprint:
+    """Fingerprint of the state at ``version``, updated one change at a time."""
+
+    def __init__(self, version: int = 0):
+        self.version = version
+        self._digests: dict[tuple[str, int], int] = {}
+        self._total = 0
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict) -> "StateFingerprint":
+        fingerprint = cls(snapshot["version"])
+        for entry in snapshot["users"]:
+            fingerprint.apply(ConfigChangeKind.USER, entry["user_id"], entry)
+        for entry in snapshot["providers"]:
+            fingerprint.apply(ConfigChangeKind.PROVIDER, entry["id"], entry)
+        return fingerprint
+
+    def apply(self, kind: str, object_id: int, entry: dict | None) -> None:
+        digest = entity_digest(kind, entry)
+        previous = self._digests.pop((kind, object_id), 0)
+        if digest:
+            self._digests[(kind, object_id)] = digest
+        self._total = (self._total - previous + digest) % _DIGEST_MODULUS
+
+    def hexdigest(self) -> str:
+        return f"{self._total:064x}"
+
+
+def fingerprint_snapshot(snapshot: dict) -> str:
+    """Return the fingerprint of a snapshot's users and providers."""
+    return StateFingerprint.from_snapshot(snapshot).hexdigest()
+
+
+# Fingerprint of the last published version, kept per process.
+_state_fingerprint: StateFingerprint | None = None
+
+
+def remember_snapshot(snapshot: dict) -> str:
+    """Fingerprint a freshly built snapshot and keep it as the current state."""
+    global _state_fingerprint
+    _state_fingerprint = StateFingerprint.from_snapshot(snapshot)
+    return _state_fingerprint.hexdigest()
+
+
+def advance_fingerprint(version: int, changes: list[dict]) -> None:
+    """Apply the changes of delta ``version`` if the fingerprint is at ``version - 1``."""
+    fingerprint = _state_fingerprint
+    if fingerprint is None or fingerprint.version != version - 1:
+        return
+    for change in changes:
+        fingerprint.apply(change["kind"], change["id"], change["entry"])
+    fingerprint.version = version
+
+
+def state_fingerprint() -> str:
+    """Return the fingerprint of the last published version.
+
+    Catches up with deltas published by other processes from the change
+    outbox; the state is only rebuilt from the database on first use or when
+    the outbox was pruned past this process's version.
+    """
+    global _state_fingerprint
+    version = current_version()
+    fingerprint = _state_fingerprint
+    if fingerprint is not None and fingerprint.version < version:
+        changes = list(
+            ConfigChange.objects.filter(version__gt=fingerprint.version, version__lte=version)
+            .order_by("version", "id")
+        )
+        if {change.version for change in changes} == set(range(fingerprint.version + 1, version + 1)):
+            for change in changes:
+                fingerprint.apply(change.kind, change.object_id, change.entry)
+            fingerprint.version = version
+        else:
+            fingerprint = None
+    if fingerprint is None or fingerprint.version != version:
+        return remember_snapshot(build_snapshot())
+    return fingerprint.hexdigest()
+
+
+def build_delta(changes: list[ConfigChange], version: int) -> dict:
+    """Return the delta payload for ``changes`` (in recording order).
+
+    Only the latest change per object is sent.
+    """
+    latest: dict[tuple[str, int], ConfigChange] = {}
+    for change in changes:
+        latest.pop((change.kind, change.object_id), None)
+        latest[(change.kind, change.object_id)] = change
+    return {
+        "type": "delta",
+        "version": version,
+        "previous_version": version - 1,
+        "changes": [
+            {"kind": change.kind, "id": change.object_id, "entry": change.entry}
+            for change in latest.values()
+        ],
+    }
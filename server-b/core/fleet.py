@@ -0,0 +1,115 @@
+"""Registry of the Server A instances seen through their heartbeats.
+
+Each Server A worker publishes a heartbeat with its instance id, its
+configuration fingerprint and load stats (see server-a ``app.heartbeat``).
+``consume_heartbeats`` feeds them into a ``FleetRegistry``, which tracks the
+last heartbeat of every instance, exports staleness and fingerprint-match
+metrics and decides when an instance's configuration drifted for long enough
+to need a targeted resync.
+"""
+from __future__ import annotations
+
+import time
+from contextlib import suppress
+from dataclasses import dataclass, field
+
+from sms_gateway_project.metrics import (
+    SERVER_A_CONFIG_FINGERPRINT_MATCH,
+    SERVER_A_HEARTBEAT_AGE_SECONDS,
+)
+
+
+@dataclass
+class InstanceState:
+    instance: str
+    service: str = ""
+    # ``time.time()`` of the last heartbeat received from the instance.
+    last_seen: float = 0.0
+    fingerprint: str | None = None
+    load: dict = field(default_factory=dict)
+    # When the instance was first seen with a fingerprint other than the
+    # expected one; ``None`` while it matches.
+    drifting_since: float | None = None
+    last_resync: float | None = None
+
+
+class FleetRegistry:
+    """In-memory state of the Server A fleet, owned by one consumer process."""
+
+    def __init__(
+        self,
+        stale_after: float = 180,
+        forget_after: float = 3600,
+        drift_grace: float = 120,
+        resync_cooldown: float = 600,
+    ):
+        self.stale_after = stale_after
+        self.forget_after = forget_after
+        self.drift_grace = drift_grace
+        self.resync_cooldown = resync_cooldown
+        self.instances: dict[str, InstanceState] = {}
+
+    def record(self, heartbeat: dict, received_at: float | None = None) -> InstanceState | None:
+        """Store one heartbeat; returns ``None`` for heartbeats without an instance id."""
+        instance = heartbeat.get("instance")
+        if not instance:
+            return None
+        state = self.instances.get(instance)
+        if state is None:
+            state = self.instances[instance] = InstanceState(instance=instance)
+        state.service = heartbeat.get("service") or state.service
+        state.last_seen = received_at if received_at is not None else time.time()
+        state.fingerprint = heartbeat.get("config_cache_fingerprint")
+        state.load = heartbeat.get("load") or {}
+        return state
+
+    def check_drift(self, expected: str | None, now: float | None = None) -> list[str]:
+        """Update fingerprint-match gauges and return the instances to resync.
+
+        An instance is resynced once its fingerprint has differed from
+        ``expected`` for ``drift_grace`` seconds (deltas reach instances a few
+        seconds apart, so a short mismatch is normal), and then at most once
+        per ``resync_cooldown``. Stale instances are left alone.
+        """
+        if expected is None:
+            return []
+        now = time.time() if now is None else now
+        to_resync = []
+        for state in self.instances.values():
+            matches = state.fingerprint == expected
+            SERVER_A_CONFIG_FINGERPRINT_MATCH.labels(instance=state.instance).set(1 if matches else 0)
+            if matches:
+                state.drifting_since = None
+                continue
+            if state.drifting_since is None:
+                state.drifting_since = now
+            if now - state.last_seen > self.stale_after:
+                continue
+            if now - state.drifting_since < self.drift_grace:
+                continue
+            if state.last_resync is not None and now - state.last_resync < self.resync_cooldown:
+                continue
+            state.last_resync = now
+            to_resync.append(state.instance)
+        return to_resync
+
+    def refresh_staleness(self, now: float | None = None) -> None:
+        """Export the heartbeat age of every instance and forget long-gone ones."""
+        now = time.time() if now is None else now
+        for instance, state in list(self.instances.items()):
+            age = now - state.last_seen
+            if age > self.forget_after:
+                del self.instances[instance]
+                for gauge in (SERVER_A_HEARTBEAT_AGE_SECONDS, SERVER_A_CONFIG_FINGERPRINT_MATCH):
+                    with suppress(KeyError):
+                        gauge.remove(instance)
+                continue
+            SERVER_A_HEARTBEAT_AGE_SECONDS.labels(instance=instance).set(age)
+
+    def stale_instances(self, now: float | None = None) -> list[str]:
+        now = time.time() if now is None else now
+        return [
+            instance
+            for instance, state in self.instances.items()
+            if now - state.last_seen > self.stale_after
+        ]
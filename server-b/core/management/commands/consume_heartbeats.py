@@ -0,0 +1,105 @@
+import json
+import logging
+import time
+
+import pika
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.fleet import FleetRegistry
+
+logger = logging.getLogger(__name__)
+
+# Longest time a partial batch waits before it is processed; also how often
+# staleness gauges are refreshed when no heartbeats arrive.
+FLUSH_INTERVAL_SECONDS = 5
+
+
+def expected_fingerprint() -> str | None:
+    """Fingerprint Server A instances should report, or ``None`` without state sync."""
+    if not getattr(settings, "CONFIG_STATE_SYNC_ENABLED", False):
+        return None
+    from core.config_state import state_fingerprint
+
+    return state_fingerprint()
+
+
+def process_heartbeats(channel, registry: FleetRegistry, deliveries: list[tuple[int, bytes]]) -> list[str]:
+    """Record a batch of heartbeats, ack them at once and resync drifting instances.
+
+    Returns the instances a resync was requested for.
+    """
+    now = time.time()
+    for _tag, body in deliveries:
+        try:
+            heartbeat = json.loads(body.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            logger.warning("Invalid heartbeat discarded: %r", body)
+            continue
+        if registry.record(heartbeat, received_at=now) is None:
+            logger.debug("Heartbeat without instance id ignored: %r", heartbeat)
+    if deliveries:
+        channel.basic_ack(delivery_tag=deliveries[-1][0], multiple=True)
+
+    registry.refresh_staleness(now)
+    to_resync = registry.check_drift(expected_fingerprint(), now)
+    if to_resync:
+        from core.state_broadcaster import publish_instance_resync
+        from sms_gateway_project.metrics import SERVER_A_CONFIG_RESYNCS_TOTAL
+
+        for instance in to_resync:
+            logger.warning("Configuration of %s drifted; requesting a resync.", instance)
+            publish_instance_resync.delay(instance)
+            SERVER_A_CONFIG_RESYNCS_TOTAL.inc()
+    return to_resync
+
+
+class Command(BaseCommand):
+    """Consume Server A heartbeats and keep the fleet registry current."""
+
+    def handle(self, *args, **options):  # pragma: no cover - mostly I/O
+        credentials = pika.PlainCredentials(settings.RABBITMQ_USER, settings.RABBITMQ_PASS)
+        params = pika.ConnectionParameters(
+            host=settings.RABBITMQ_HOST,
+            credentials=credentials,
+            virtual_host=settings.RABBITMQ_VHOST,
+        )
+        connection = pika.BlockingConnection(params)
+        channel = connection.channel()
+
+        exchange = settings.RABBITMQ_HEARTBEAT_EXCHANGE
+        queue_name = settings.RABBITMQ_HEARTBEAT_QUEUE
+        batch_size = settings.HEARTBEAT_BATCH_SIZE
+        # Same topology as Server A declares (app.heartbeat).
+        channel.exchange_declare(exchange=exchange, exchange_type="direct", durable=True)
+        channel.queue_declare(queue=queue_name, durable=True)
+        channel.queue_bind(queue=queue_name, exchange=exchange, routing_key=queue_name)
+        channel.basic_qos(prefetch_count=batch_size)
+
+        registry = FleetRegistry(
+            stale_after=settings.HEARTBEAT_STALE_AFTER_SECONDS,
+            forget_after=settings.HEARTBEAT_FORGET_AFTER_SECONDS,
+            drift_grace=settings.CONFIG_DRIFT_GRACE_SECONDS,
+            resync_cooldown=settings.CONFIG_DRIFT_RESYNC_COOLDOWN_SECONDS,
+        )
+        self.stdout.write(f"Listening for heartbeats on queue '{queue_name}'. Press CTRL+C to exit.")
+
+        batch: list[tuple[int, bytes]] = []
+        flush_at = time.monotonic() + FLUSH_INTERVAL_SECONDS
+        try:
+            for method, _properties, body in channel.consume(
+                queue_name, inactivity_timeout=FLUSH_INTERVAL_SECONDS
+            ):
+                if method is not None:
+                    batch.append((method.delivery_tag, body))
+                    if len(batch) < batch_size and time.monotonic() < flush_at:
+                        continue
+                process_heartbeats(channel, registry, batch)
+                batch = []
+                flush_at = time.monotonic() + FLUSH_INTERVAL_SECONDS
+        except KeyboardInterrupt:
+            if batch:
+                process_heartbeats(channel, registry, batch)
+            channel.cancel()
+        finally:
+            connection.close()
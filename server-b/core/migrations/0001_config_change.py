@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConfigChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user', 'User'), ('provider', 'Provider')], max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('entry', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('version', models.BigIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('version__isnull', True)), fields=['id'], name='configchange_unpublished_idx'), models.Index(fields=['version'], name='configchange_version_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,37 @@
 from django.db import models
 
-# Create your models here.
+
+class ConfigChangeKind(models.TextChoices):
+    USER = 'user', 'User'
+    PROVIDER = 'provider', 'Provider'
+
+
+class ConfigChange(models.Model):
+    """Outbox of configuration changes broadcast to Server A as deltas.
+
+    Rows are written in the same transaction as the change itself.
+    ``core.state_broadcaster.publish_config_deltas`` publishes unpublished
+    rows in batches and stamps each batch with the next configuration state
+    version, so versions increase by exactly one per delta message.
+    """
+
+    kind = models.CharField(max_length=16, choices=ConfigChangeKind.choices)
+    object_id = models.BigIntegerField()
+    # Server A's view of the object after the change; ``None`` removes it.
+    entry = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Version of the delta that carried this change; ``None`` until published.
+    version = models.BigIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['id'],
+                name='configchange_unpublished_idx',
+                condition=models.Q(version__isnull=True),
+            ),
+            models.Index(fields=['version'], name='configchange_version_idx'),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover - for admin/debug only
+        return f"{self.kind}:{self.object_id} v{self.version}"
@@ -0,0 +1,50 @@
+"""Record configuration changes that Server A needs to hear about."""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.config_state import record_provider_change, record_user_change
+from providers.models import SmsProvider
+from user_management.models import Profile
+
+
+# User fields Server A does not care about; saves touching only these (e.g.
+# the ``last_login`` update on every login) are not broadcast.
+IGNORED_USER_FIELDS = frozenset({"last_login", "password"})
+
+
+def _sync_enabled() -> bool:
+    return getattr(settings, "CONFIG_STATE_SYNC_ENABLED", False)
+
+
+@receiver(post_save, sender=User, dispatch_uid="config_state_user_saved")
+def user_config_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= IGNORED_USER_FIELDS:
+        return
+    if _sync_enabled():
+        record_user_change(instance)
+
+
+@receiver(post_save, sender=Profile, dispatch_uid="config_state_profile_saved")
+def profile_config_saved(sender, instance, **kwargs):
+    if _sync_enabled():
+        record_user_change(instance.user)
+
+
+@receiver(post_delete, sender=User, dispatch_uid="config_state_user_deleted")
+def user_config_deleted(sender, instance, **kwargs):
+    if _sync_enabled():
+        record_user_change(instance, deleted=True)
+
+
+@receiver(post_save, sender=SmsProvider, dispatch_uid="config_state_provider_saved")
+def provider_config_saved(sender, instance, **kwargs):
+    if _sync_enabled():
+        record_provider_change(instance)
+
+
+@receiver(post_delete, sender=SmsProvider, dispatch_uid="config_state_provider_deleted")
+def provider_config_deleted(sender, instance, **kwargs):
+    if _sync_enabled():
+        record_provider_change(instance, deleted=True)
@@ -1,10 +1,25 @@
+"""Broadcast Server A configuration state (see ``core.config_state``).
+
+``publish_config_deltas`` runs every few seconds and publishes the changes
+recorded by ``core.signals``. ``publish_full_state`` runs periodically and
+publishes the full state as a checkpoint only when its fingerprint changed,
+when ``CONFIG_STATE_KEEPALIVE_SECONDS`` have passed, or when a Server A
+instance asked for a resync via ``CONFIG_STATE_RESYNC_QUEUE``. The fingerprint
+is maintained incrementally from the published deltas, so an unchanged state
+is not read from the database. ``publish_instance_resync`` sends a snapshot to
+a single instance through ``CONFIG_STATE_DIRECT_EXCHANGE``, where every
+instance binds its queue with its instance id.
+"""
+import functools
 import json
 import logging
+import time
 from datetime import datetime
 
 import pika
 from celery import shared_task
 from django.conf import settings
+from django.db import transaction
 
 
 def _get_connection():
@@ -20,60 +35,170 @@ def _get_connection():
 
 logger = logging.getLogger(__name__)
 
+# (fingerprint, monotonic time) of the last snapshot this process published.
+_last_published: tuple[str, float] | None = None
+
+
+def _publish_state(payload: dict, headers: dict | None = None, instance: str | None = None) -> None:
+    """Publish to every Server A instance, or only to ``instance``."""
+    if instance is None:
+        exchange, exchange_type = settings.CONFIG_STATE_EXCHANGE, "fanout"
+    else:
+        exchange, exchange_type = settings.CONFIG_STATE_DIRECT_EXCHANGE, "direct"
+    connection = _get_connection()
+    try:
+        channel = connection.channel()
+        channel.exchange_declare(
+            exchange=exchange,
+            exchange_type=exchange_type,
+            durable=True,
+        )
+        channel.basic_publish(
+            exchange=exchange,
+            routing_key=instance or "",
+            body=json.dumps(payload),
+            properties=pika.BasicProperties(
+                content_type="application/json",
+                delivery_mode=2,
+                headers=headers,
+            ),
+        )
+    finally:
+        connection.close()
+
+
+def _snapshot_unchanged(fingerprint: str) -> bool:
+    if _last_published is None or _last_published[0] != fingerprint:
+        return False
+    keepalive = getattr(settings, "CONFIG_STATE_KEEPALIVE_SECONDS", 900)
+    return time.monotonic() - _last_published[1] < keepalive
+
 
 @shared_task
-def publish_full_state():
+def publish_full_state(force: bool = False):
+    global _last_published
+
     if not getattr(settings, "CONFIG_STATE_SYNC_ENABLED", False):
         logger.info("Configuration state sync disabled; skipping broadcast.")
         return
 
-    from django.contrib.auth.models import User  # Imported lazily for testability
-    from providers.models import SmsProvider  # Imported lazily for testability
+    # Imported lazily for testability
+    from core.config_state import build_snapshot, remember_snapshot, state_fingerprint
+    from core.models import ConfigChange
+    from user_management.tasks import set_expected_config_fingerprint
 
-    connection = _get_connection()
-    channel = connection.channel()
-    channel.exchange_declare(
-        exchange=settings.CONFIG_STATE_EXCHANGE,
-        exchange_type="fanout",
-        durable=True,
-    )
+    fingerprint = state_fingerprint()
+    set_expected_config_fingerprint(fingerprint)
+    if not force and _snapshot_unchanged(fingerprint):
+        logger.debug("Configuration state unchanged (%s); skipping broadcast.", fingerprint)
+        return
 
-    users_qs = User.objects.select_related("profile").all()
-    users = [
-        {
-            "user_id": user.id,
-            "username": user.username,
-            "api_key": str(user.profile.api_key),
-            "daily_quota": user.profile.daily_quota,
-            "is_active": user.is_active,
-        }
-        for user in users_qs
-    ]
-
-    providers = []
-    for provider in SmsProvider.objects.all():
-        providers.append(
-            {
-                "name": provider.name,
-                "slug": provider.slug,
-                "is_active": provider.is_active,
-                "is_operational": getattr(provider, "is_operational", True),
-                "aliases": getattr(provider, "aliases", []),
-            }
-        )
+    # The snapshot may include changes not yet published as a delta, so it
+    # is fingerprinted again.
+    snapshot = build_snapshot()
+    fingerprint = remember_snapshot(snapshot)
+    set_expected_config_fingerprint(fingerprint)
+
+    _publish_snapshot(snapshot, fingerprint)
+    _last_published = (fingerprint, time.monotonic())
 
+    # Changes older than the checkpoint are no longer needed; the latest
+    # published row is kept because it carries the current version.
+    ConfigChange.objects.filter(version__lt=snapshot["version"]).delete()
+
+
+def _publish_snapshot(snapshot: dict, fingerprint: str, instance: str | None = None) -> None:
     payload = {
+        "type": "snapshot",
+        "version": snapshot["version"],
+        "fingerprint": fingerprint,
         "timestamp": datetime.utcnow().isoformat(),
-        "data": {"users": users, "providers": providers},
+        "data": {"users": snapshot["users"], "providers": snapshot["providers"]},
     }
-
-    channel.basic_publish(
-        exchange=settings.CONFIG_STATE_EXCHANGE,
-        routing_key="",
-        body=json.dumps(payload),
-        properties=pika.BasicProperties(
-            content_type="application/json",
-            delivery_mode=2,
-        ),
+    _publish_state(
+        payload,
+        headers={"type": "snapshot", "version": snapshot["version"], "fingerprint": fingerprint},
+        instance=instance,
     )
-    connection.close()
+
+
+@shared_task
+def publish_instance_resync(instance: str):
+    """Send the full state to one Server A instance whose fingerprint drifted."""
+    if not getattr(settings, "CONFIG_STATE_SYNC_ENABLED", False):
+        return
+
+    from core.config_state import build_snapshot, remember_snapshot
+
+    snapshot = build_snapshot()
+    _publish_snapshot(snapshot, remember_snapshot(snapshot), instance=instance)
+    logger.info("Published configuration snapshot v%d to %s.", snapshot["version"], instance)
+
+
+@shared_task
+def publish_config_deltas(batch_size: int = 500):
+    """Publish unpublished configuration changes as the next versioned delta."""
+    if not getattr(settings, "CONFIG_STATE_SYNC_ENABLED", False):
+        return
+
+    from core.config_state import build_delta, current_version
+    from core.models import ConfigChange
+
+    with transaction.atomic():
+        # Locking the pending rows serialises concurrent publishers, so each
+        # version is used exactly once.
+        changes = list(
+            ConfigChange.objects.select_for_update()
+            .filter(version__isnull=True)
+            .order_by("id")[:batch_size]
+        )
+        if not changes:
+            return
+        version = current_version() + 1
+        payload = build_delta(changes, version)
+        payload["timestamp"] = datetime.utcnow().isoformat()
+        ConfigChange.objects.filter(pk__in=[change.pk for change in changes]).update(
+            version=version
+        )
+        # Publish once the version is committed, so the broker is never
+        # called while the outbox rows are locked and a rolled-back batch is
+        # never broadcast. A delta that is lost (failed publish) or overtaken
+        # by a concurrent publisher shows up in Server A as a version gap and
+        # triggers a resync; the changed fingerprint also makes the next
+        # ``publish_full_state`` broadcast the state.
+        transaction.on_commit(functools.partial(_publish_delta, payload, len(changes)))
+
+
+def _publish_delta(payload: dict, change_count: int) -> None:
+    from core.config_state import advance_fingerprint
+
+    version = payload["version"]
+    _publish_state(payload, headers={"type": "delta", "version": version})
+    advance_fingerprint(version, payload["changes"])
+    logger.info("Published configuration delta v%d (%d changes).", version, change_count)
+
+
+@shared_task
+def process_config_resync_requests():
+    """Publish one full snapshot if any Server A instance asked for a resync."""
+    if not getattr(settings, "CONFIG_STATE_SYNC_ENABLED", False):
+        return
+
+    connection = _get_connection()
+    requests = 0
+    try:
+        channel = connection.channel()
+        channel.queue_declare(queue=settings.CONFIG_STATE_RESYNC_QUEUE, durable=True)
+        while True:
+            method, _properties, _body = channel.basic_get(
+                queue=settings.CONFIG_STATE_RESYNC_QUEUE, auto_ack=True
+            )
+            if method is None:
+                break
+            requests += 1
+    finally:
+        connection.close()
+
+    if requests:
+        logger.info("Publishing full configuration state for %d resync requests.", requests)
+        publish_full_state(force=True)
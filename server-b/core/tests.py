@@ -1,8 +1,22 @@
+import json
+from unittest.mock import MagicMock, patch
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.shortcuts import resolve_url
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
+
+from core import config_state
+from core.checks import check_api_key_hash_secret
+from core.config_state import api_key_hash, fingerprint_snapshot
+from core.fleet import FleetRegistry
+from core.management.commands.consume_heartbeats import process_heartbeats
+from core.models import ConfigChange, ConfigChangeKind
+from core import state_broadcaster
+from core.state_broadcaster import publish_config_deltas, publish_full_state, publish_instance_resync
+from providers.models import AuthType, SmsProvider
 
 
 class ProfilePageTests(TestCase):
@@ -103,3 +117,264 @@ class ServerAUserGuideTests(TestCase):
         self.assertContains(response, 'data-tab-target="server-a"')
         self.assertContains(response, 'data-tab-panel="server-a"')
 
+
+
+@override_settings(CONFIG_STATE_SYNC_ENABLED=True)
+class ConfigStateBroadcastTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='syncer', password='pass')
+        self.user.profile.api_key = 'key-1'
+        self.user.profile.save()
+        state_broadcaster._last_published = None
+        config_state._state_fingerprint = None
+
+    def _publish_deltas(self):
+        with patch('core.state_broadcaster._publish_state') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                publish_config_deltas.run()
+        return [c.args[0] for c in publish.call_args_list]
+
+    def test_profile_changes_are_recorded_with_full_user_entry(self):
+        change = ConfigChange.objects.order_by('-id').first()
+        self.assertEqual(change.kind, ConfigChangeKind.USER)
+        self.assertEqual(change.object_id, self.user.id)
+        self.assertEqual(change.entry['api_key_hash'], api_key_hash('key-1'))
+        self.assertNotIn('api_key', change.entry)
+        self.assertIsNone(change.version)
+
+    @override_settings(API_KEY_HASH_SECRET='s3cret')
+    def test_api_key_hash_matches_server_a(self):
+        # Same vector as server-a's tests/test_cache.py.
+        self.assertEqual(
+            api_key_hash('key-1'),
+            '2473ad03580c4627d33b06008f6e95fafe428cce76d19fab5458c6110280e769',
+        )
+        self.assertEqual(api_key_hash(''), '')
+
+    def test_shipped_secret_hashes_keys_like_server_a(self):
+        with open(settings.BASE_DIR / '.env.example') as f:
+            secrets = [line.split('=', 1)[1].strip() for line in f if line.startswith('API_KEY_HASH_SECRET=')]
+        self.assertTrue(secrets and secrets[0])
+
+        # Same vector as server-a's tests/test_cache.py, under the same secret.
+        with override_settings(API_KEY_HASH_SECRET=secrets[0]):
+            self.assertEqual(
+                api_key_hash('api_key_for_service_A'),
+                'c2e5b6185a916b73a7292f20d0f895af0a78ace7eb1479b43ee897b6ad66dcc1',
+            )
+
+    def test_empty_api_key_hash_secret_fails_the_deploy_check(self):
+        with override_settings(API_KEY_HASH_SECRET=''):
+            self.assertEqual([e.id for e in check_api_key_hash_secret(None)], ['core.E001'])
+        with override_settings(API_KEY_HASH_SECRET='s3cret'):
+            self.assertEqual(check_api_key_hash_secret(None), [])
+
+    def test_login_timestamp_updates_are_not_recorded(self):
+        count = ConfigChange.objects.count()
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=['last_login'])
+        self.assertEqual(ConfigChange.objects.count(), count)
+
+    def test_deltas_are_versioned_and_coalesced_per_object(self):
+        (delta,) = self._publish_deltas()
+
+        self.assertEqual(delta['type'], 'delta')
+        self.assertEqual((delta['version'], delta['previous_version']), (1, 0))
+        self.assertEqual(
+            delta['changes'],
+            [
+                {
+                    'kind': 'user',
+                    'id': self.user.id,
+                    'entry': {
+                        'user_id': self.user.id,
+                        'username': 'syncer',
+                        'api_key_hash': api_key_hash('key-1'),
+                        'daily_quota': 0,
+                        'is_active': True,
+                    },
+                }
+            ],
+        )
+        self.assertFalse(ConfigChange.objects.filter(version__isnull=True).exists())
+        self.assertEqual(self._publish_deltas(), [])
+
+        provider = SmsProvider.objects.create(
+            name='Provider',
+            slug='provider',
+            send_url='http://example.com/send',
+            balance_url='http://example.com/bal',
+            auth_type=AuthType.NONE,
+        )
+        provider_id = provider.id
+        provider.delete()
+        (delta,) = self._publish_deltas()
+        self.assertEqual((delta['version'], delta['previous_version']), (2, 1))
+        self.assertEqual(
+            delta['changes'], [{'kind': 'provider', 'id': provider_id, 'entry': None}]
+        )
+
+    def test_deltas_are_published_after_the_version_is_committed(self):
+        with patch('core.state_broadcaster._publish_state') as publish:
+            with self.captureOnCommitCallbacks() as callbacks:
+                publish_config_deltas.run()
+            publish.assert_not_called()
+            self.assertFalse(ConfigChange.objects.filter(version__isnull=True).exists())
+
+            callbacks[0]()
+        self.assertEqual(publish.call_args.kwargs['headers'], {'type': 'delta', 'version': 1})
+
+    def test_full_state_is_a_versioned_checkpoint(self):
+        self._publish_deltas()
+        self.user.profile.daily_quota = 10
+        self.user.profile.save()
+        self._publish_deltas()
+
+        with patch('core.state_broadcaster._publish_state') as publish:
+            publish_full_state.run()
+
+        snapshot = publish.call_args.args[0]
+        headers = publish.call_args.kwargs['headers']
+        self.assertEqual(headers['fingerprint'], snapshot['fingerprint'])
+        self.assertEqual(headers['version'], 2)
+        self.assertEqual(snapshot['type'], 'snapshot')
+        self.assertEqual(snapshot['version'], 2)
+        self.assertEqual(snapshot['data']['users'][0]['daily_quota'], 10)
+        # Changes behind the checkpoint are pruned; the latest version is kept.
+        self.assertEqual(
+            list(ConfigChange.objects.values_list('version', flat=True).distinct()), [2]
+        )
+
+    def test_full_state_is_only_republished_when_it_changes(self):
+        with patch('core.state_broadcaster._publish_state') as publish:
+            publish_full_state.run()
+            publish_full_state.run()
+            self.assertEqual(publish.call_count, 1)
+
+            publish_full_state.run(force=True)
+            self.assertEqual(publish.call_count, 2)
+
+            self.user.profile.daily_quota = 99
+            self.user.profile.save()
+            publish_full_state.run()
+            self.assertEqual(publish.call_count, 2)
+            with patch('core.state_broadcaster._publish_state'), self.captureOnCommitCallbacks(execute=True):
+                publish_config_deltas.run()
+            with patch('core.config_state.build_snapshot', wraps=config_state.build_snapshot) as build:
+                publish_full_state.run()
+            self.assertEqual(publish.call_count, 3)
+            # The delta was applied to the fingerprint; only the broadcast
+            # needed the full state.
+            self.assertEqual(build.call_count, 1)
+
+            with override_settings(CONFIG_STATE_KEEPALIVE_SECONDS=0):
+                publish_full_state.run()
+            self.assertEqual(publish.call_count, 4)
+
+    def test_fingerprint_matches_server_a(self):
+        # Same vector as server-a's tests/test_cache.py.
+        snapshot = {
+            'version': 0,
+            'users': [
+                {'user_id': 1, 'username': 'alice', 'api_key_hash': 'ab' * 32, 'daily_quota': 5, 'is_active': True},
+                {'user_id': 2, 'username': 'nokey', 'api_key_hash': '', 'daily_quota': 1, 'is_active': True},
+            ],
+            'providers': [
+                {'id': 10, 'name': 'Twilio', 'slug': 'twilio', 'is_active': True, 'is_operational': True, 'aliases': ['twi']},
+            ],
+        }
+        self.assertEqual(
+            fingerprint_snapshot(snapshot),
+            'f2b0ce7bc76475662e9fb179b4b5a13f6e55a58d16d7adf8e2db787f8cca5fac',
+        )
+        reordered = {**snapshot, 'users': snapshot['users'][::-1]}
+        self.assertEqual(fingerprint_snapshot(reordered), fingerprint_snapshot(snapshot))
+
+    def test_fingerprint_catches_up_with_deltas_from_other_processes(self):
+        self._publish_deltas()
+        config_state.state_fingerprint()
+        self.user.profile.daily_quota = 7
+        self.user.profile.save()
+        with patch('core.config_state.advance_fingerprint'):
+            self._publish_deltas()
+
+        with patch('core.config_state.build_snapshot') as build:
+            caught_up = config_state.state_fingerprint()
+        build.assert_not_called()
+        self.assertEqual(caught_up, fingerprint_snapshot(config_state.build_snapshot()))
+
+    @override_settings(CONFIG_STATE_SYNC_ENABLED=False)
+    def test_changes_are_not_recorded_when_sync_is_disabled(self):
+        count = ConfigChange.objects.count()
+        self.user.profile.save()
+        self.assertEqual(ConfigChange.objects.count(), count)
+
+
+class FleetRegistryTests(TestCase):
+    def setUp(self):
+        self.registry = FleetRegistry(stale_after=180, forget_after=3600, drift_grace=120, resync_cooldown=600)
+
+    def _heartbeat(self, instance='a-1', fingerprint='f1', **extra):
+        return {
+            'service': 'server-a',
+            'instance': instance,
+            'config_cache_fingerprint': fingerprint,
+            'load': {'in_flight_requests': 2},
+            **extra,
+        }
+
+    def test_records_last_seen_fingerprint_and_load(self):
+        self.registry.record(self._heartbeat(), received_at=100)
+        self.assertIsNone(self.registry.record({'service': 'legacy'}, received_at=100))
+
+        (state,) = self.registry.instances.values()
+        self.assertEqual((state.instance, state.last_seen, state.fingerprint), ('a-1', 100, 'f1'))
+        self.assertEqual(state.load, {'in_flight_requests': 2})
+        self.assertEqual(self.registry.stale_instances(now=281), ['a-1'])
+
+    def test_drift_is_resynced_after_the_grace_period_and_cooldown(self):
+        self.registry.record(self._heartbeat(fingerprint='old'), received_at=0)
+        self.assertEqual(self.registry.check_drift('new', now=0), [])
+        self.assertEqual(self.registry.check_drift('new', now=119), [])
+
+        self.registry.record(self._heartbeat(fingerprint='old'), received_at=120)
+        self.assertEqual(self.registry.check_drift('new', now=120), ['a-1'])
+        self.assertEqual(self.registry.check_drift('new', now=300), [])
+
+        self.registry.record(self._heartbeat(fingerprint='new'), received_at=310)
+        self.assertEqual(self.registry.check_drift('new', now=310), [])
+        self.assertIsNone(self.registry.instances['a-1'].drifting_since)
+        self.assertEqual(self.registry.check_drift(None, now=310), [])
+
+    def test_stale_instances_are_not_resynced_and_are_forgotten(self):
+        self.registry.record(self._heartbeat(fingerprint='old'), received_at=0)
+        self.registry.check_drift('new', now=0)
+        self.assertEqual(self.registry.check_drift('new', now=200), [])
+
+        self.registry.refresh_staleness(now=3601)
+        self.assertEqual(self.registry.instances, {})
+
+    def test_heartbeats_are_acked_in_bulk_and_drifting_instances_resynced(self):
+        channel = MagicMock()
+        self.registry.drift_grace = 0
+        deliveries = [
+            (1, json.dumps(self._heartbeat('a-1', fingerprint='stale')).encode()),
+            (2, b'not json'),
+            (3, json.dumps(self._heartbeat('a-2', fingerprint='current')).encode()),
+        ]
+
+        with patch('core.management.commands.consume_heartbeats.expected_fingerprint', return_value='current'), \
+                patch('core.state_broadcaster.publish_instance_resync.delay') as resync:
+            resynced = process_heartbeats(channel, self.registry, deliveries)
+
+        channel.basic_ack.assert_called_once_with(delivery_tag=3, multiple=True)
+        self.assertEqual(resynced, ['a-1'])
+        resync.assert_called_once_with('a-1')
+        self.assertEqual(set(self.registry.instances), {'a-1', 'a-2'})
+
+    def test_instance_resync_is_published_to_that_instance_only(self):
+        with patch('core.state_broadcaster._publish_state') as publish:
+            publish_instance_resync.run('host:42')
+
+        self.assertEqual(publish.call_args.kwargs['instance'], 'host:42')
+        self.assertEqual(publish.call_args.args[0]['type'], 'snapshot')
@@ -0,0 +1,17 @@
+"""Gunicorn settings, loaded from the working directory by ``gunicorn``."""
+
+import os
+
+
+def child_exit(server, worker):
+    """Drop live gauge samples of an exited worker and archive the rest."""
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        return
+
+    from prometheus_client import multiprocess
+
+    from sms_gateway_project.multiprocess_metrics import archive_process
+
+    multiprocess.mark_process_dead(worker.pid)
+    archive_process(path, worker.pid)
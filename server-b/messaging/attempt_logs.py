@@ -0,0 +1,179 @@
+"""In-process buffer that batches ``MessageAttemptLog`` inserts.
+
+Attempt logs are audit data; the delivery-critical message state is written
+synchronously by ``send_sms_with_failover``. Logs are queued here and written
+with ``bulk_create`` once ``ATTEMPT_LOG_BATCH_SIZE`` rows are pending or the
+oldest pending row is ``ATTEMPT_LOG_FLUSH_INTERVAL_SECONDS`` old. Pending rows
+are flushed when the worker process shuts down.
+
+A batch the database rejects (``IntegrityError``/``DataError``) is retried
+row by row and the rows that still fail are dropped, so one bad row cannot
+block later flushes. While the database is unreachable rows are kept for the
+next flush, up to ``ATTEMPT_LOG_MAX_PENDING``; beyond that the oldest are
+dropped. Dropped rows are counted in ``sms_attempt_logs_dropped_total``.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+from celery.signals import worker_process_shutdown, worker_shutdown
+from django.conf import settings
+from django.db import DataError, DatabaseError, IntegrityError, connections, transaction
+
+from messaging.models import MessageAttemptLog
+from sms_gateway_project.metrics import SMS_ATTEMPT_LOGS_DROPPED_TOTAL
+
+logger = logging.getLogger(__name__)
+
+
+class AttemptLogBuffer:
+    """Thread-safe queue of unsaved attempt logs flushed in batches."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending: list[MessageAttemptLog] = []
+        self._oldest_at: float | None = None
+        self._flusher: threading.Thread | None = None
+
+    @property
+    def batch_size(self) -> int:
+        return max(1, int(getattr(settings, "ATTEMPT_LOG_BATCH_SIZE", 200)))
+
+    @property
+    def flush_interval(self) -> float:
+        return float(getattr(settings, "ATTEMPT_LOG_FLUSH_INTERVAL_SECONDS", 2.0))
+
+    @property
+    def max_pending(self) -> int:
+        return max(self.batch_size, int(getattr(settings, "ATTEMPT_LOG_MAX_PENDING", 10000)))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def add(self, logs: list[MessageAttemptLog]) -> None:
+        """Queue ``logs`` and flush right away if the batch is full."""
+        if not logs:
+            return
+        with self._lock:
+            self._pending.extend(logs)
+            if self._oldest_at is None:
+                self._oldest_at = time.monotonic()
+            batch_full = len(self._pending) >= self.batch_size
+            dropped = self._trim()
+        self._log_overflow(dropped)
+        if batch_full:
+            self.flush()
+        else:
+            self._ensure_flusher()
+
+    def flush(self) -> int:
+        """Insert every pending log and return how many rows were written."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._oldest_at = None
+        if not batch:
+            return 0
+        try:
+            # A savepoint, so a rejected batch leaves an outer transaction usable.
+            with transaction.atomic():
+                MessageAttemptLog.objects.bulk_create(batch, batch_size=self.batch_size)
+        except (IntegrityError, DataError):
+            logger.warning("Database rejected a batch of %d attempt logs; inserting them one by one", len(batch))
+            return self._insert_one_by_one(batch)
+        except DatabaseError:
+            logger.exception("Failed to flush %d attempt logs; will retry", len(batch))
+            self._requeue(batch)
+            return 0
+        return len(batch)
+
+    def _insert_one_by_one(self, batch: list[MessageAttemptLog]) -> int:
+        written = 0
+        for index, log in enumerate(batch):
+            try:
+                with transaction.atomic():
+                    log.save(force_insert=True)
+            except (IntegrityError, DataError):
+                SMS_ATTEMPT_LOGS_DROPPED_TOTAL.labels(reason="rejected").inc()
+                logger.exception(
+                    "Dropping attempt log of message %s rejected by the database", log.message_id
+                )
+            except DatabaseError:
+                logger.exception("Failed to flush %d attempt logs; will retry", len(batch) - index)
+                self._requeue(batch[index:])
+                break
+            else:
+                written += 1
+        return written
+
+    def _requeue(self, batch: list[MessageAttemptLog]) -> None:
+        with self._lock:
+            self._pending[:0] = batch
+            self._oldest_at = self._oldest_at or time.monotonic()
+            dropped = self._trim()
+        self._log_overflow(dropped)
+
+    def _trim(self) -> int:
+        """Drop the oldest rows beyond ``max_pending``; the caller holds the lock."""
+        overflow = len(self._pending) - self.max_pending
+        if overflow <= 0:
+            return 0
+        del self._pending[:overflow]
+        return overflow
+
+    def _log_overflow(self, dropped: int) -> None:
+        if dropped:
+            SMS_ATTEMPT_LOGS_DROPPED_TOTAL.labels(reason="overflow").inc(dropped)
+            logger.error("Attempt log buffer is full; dropped the %d oldest logs", dropped)
+
+    def _due(self) -> bool:
+        with self._lock:
+            return (
+                self._oldest_at is not None
+                and time.monotonic() - self._oldest_at >= self.flush_interval
+            )
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(
+                target=self._run, name="attempt-log-flusher", daemon=True
+            )
+            self._flusher.start()
+
+    def _run(self) -> None:
+        while not self._wakeup.wait(self.flush_interval / 2):
+            if self._due():
+                self.flush()
+                # The flusher thread owns its own DB connection; do not keep it
+                # open between flushes.
+                connections.close_all()
+
+    def _reset_after_fork(self) -> None:
+        # Prefork children must not inherit the parent's lock, rows or thread.
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = []
+        self._oldest_at = None
+        self._flusher = None
+
+
+attempt_log_buffer = AttemptLogBuffer()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=attempt_log_buffer._reset_after_fork)
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _flush_on_worker_shutdown(**kwargs):
+    attempt_log_buffer.flush()
+
+
+atexit.register(attempt_log_buffer.flush)
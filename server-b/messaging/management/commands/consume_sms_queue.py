@@ -8,15 +8,41 @@ from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand
 from django.db import transaction
 
-from messaging.models import Message, MessageStatus
+from messaging.models import Message, MessagePriority, MessageStatus
+from messaging.usage import record_usage_change
 
 logger = logging.getLogger(__name__)
 
 
+LANES = ("high", "normal", "low")
+
+
+def get_lane_queues(lane: str) -> tuple[str, str]:
+    """Return the (queue, retry wait queue) names consumed for a priority lane."""
+    if lane == "high":
+        queue_name = settings.RABBITMQ_SMS_HIGH_PRIORITY_QUEUE
+    elif lane == "low":
+        queue_name = settings.RABBITMQ_SMS_LOW_PRIORITY_QUEUE
+    else:
+        return settings.RABBITMQ_SMS_QUEUE, settings.RABBITMQ_SMS_RETRY_WAIT_QUEUE
+    # Each lane needs its own wait queue because the wait queue dead-letters
+    # back into a single, fixed routing key.
+    return queue_name, f"{settings.RABBITMQ_SMS_RETRY_WAIT_QUEUE}_{lane}"
+
+
 class Command(BaseCommand):
     """Consume RabbitMQ queue and persist messages reliably to the database."""
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lane",
+            choices=LANES,
+            default="normal",
+            help="Priority lane to consume (default: normal).",
+        )
+
     def handle(self, *args, **options):  # pragma: no cover - mostly I/O
+        lane = options.get("lane") or "normal"
         credentials = pika.PlainCredentials(
             settings.RABBITMQ_USER, settings.RABBITMQ_PASS
         )
@@ -30,9 +56,8 @@ class Command(BaseCommand):
         connection = pika.BlockingConnection(params)
         channel = connection.channel()
         
-        queue_name = settings.RABBITMQ_SMS_QUEUE
+        queue_name, wait_queue_name = get_lane_queues(lane)
         dlq_name = settings.RABBITMQ_SMS_DLQ_USER_NOT_FOUND
-        wait_queue_name = settings.RABBITMQ_SMS_RETRY_WAIT_QUEUE
         wait_queue_ttl = settings.RABBITMQ_SMS_RETRY_WAIT_TTL_MS
 
         channel.queue_declare(queue=queue_name, durable=True)
@@ -47,7 +72,7 @@ class Command(BaseCommand):
             },
         )
 
-        channel.basic_qos(prefetch_count=1)
+        channel.basic_qos(prefetch_count=settings.RABBITMQ_SMS_PREFETCH_COUNTS.get(lane, 1))
 
         def callback(ch, method, properties, body):
             try:
@@ -71,14 +96,18 @@ class Command(BaseCommand):
                         logger.info("Duplicate message %s ignored", tracking_id)
                     else:
                         user = User.objects.get(pk=envelope["user_id"])
-                        Message.objects.create(
+                        message = Message.objects.create(
                             user=user,
                             tracking_id=tracking_id,
                             recipient=envelope.get("to"),
                             text=envelope.get("text"),
                             status=MessageStatus.PENDING,
+                            priority=MessagePriority.from_label(
+                                envelope.get("priority", lane)
+                            ),
                             initial_envelope=envelope,
                         )
+                        record_usage_change(message)
             except User.DoesNotExist:
                 logger.error(
                     "User %s not found; routing message to DLQ",
@@ -138,7 +167,7 @@ class Command(BaseCommand):
                 ch.basic_ack(delivery_tag=method.delivery_tag)
 
         channel.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=False)
-        self.stdout.write(f"Listening on queue '{queue_name}' in vhost '{settings.RABBITMQ_VHOST}'. Press CTRL+C to exit.")
+        self.stdout.write(f"Listening on queue '{queue_name}' ({lane} lane) in vhost '{settings.RABBITMQ_VHOST}'. Press CTRL+C to exit.")
         
         try:
             channel.start_consuming()
@@ -0,0 +1,100 @@
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from messaging.models import Message
+from messaging.partitioning import (
+    PARTITIONED_TABLES,
+    archive_partition,
+    archive_rows_before,
+    ensure_partition,
+    is_partitioned,
+    list_partitions,
+    partition_month,
+    upcoming_months,
+)
+
+
+class Command(BaseCommand):
+    """Create upcoming message partitions and archive data past retention."""
+
+    help = (
+        "Create monthly partitions ahead of time and archive messages older "
+        "than the retention window to compressed JSON Lines files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=settings.MESSAGE_PARTITION_MONTHS_AHEAD,
+            help="Number of future monthly partitions to keep ready.",
+        )
+        parser.add_argument(
+            "--retention-days",
+            type=int,
+            default=settings.MESSAGE_RETENTION_DAYS,
+            help="Archive data older than this many days (0 disables archival).",
+        )
+        parser.add_argument(
+            "--archive-dir",
+            default=settings.MESSAGE_ARCHIVE_DIR,
+            help="Directory that receives the .jsonl.gz archives.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would be done without changing anything.",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        archive_dir = Path(options["archive_dir"])
+        now = timezone.now()
+        partitioned = {table: is_partitioned(table) for table in PARTITIONED_TABLES}
+
+        for table, is_native in partitioned.items():
+            if not is_native:
+                continue
+            for month in upcoming_months(now.date(), options["months_ahead"]):
+                name = month.partition_name(table)
+                if dry_run:
+                    self.stdout.write(f"Would ensure partition {name}")
+                elif ensure_partition(table, month):
+                    self.stdout.write(f"Created partition {name}")
+
+        retention_days = options["retention_days"]
+        if retention_days <= 0:
+            self.stdout.write("Retention disabled; nothing archived.")
+            return
+
+        cutoff = now - timedelta(days=retention_days)
+        if all(partitioned.values()):
+            self._archive_partitions(cutoff, archive_dir, dry_run)
+        else:
+            self._archive_rows(cutoff, archive_dir, dry_run)
+
+    def _archive_partitions(self, cutoff, archive_dir: Path, dry_run: bool) -> None:
+        # Only whole months that ended before the cutoff are dropped.
+        for table in PARTITIONED_TABLES:
+            for name in list_partitions(table):
+                month = partition_month(table, name)
+                if month is None or month.end > cutoff.date():
+                    continue
+                if dry_run:
+                    self.stdout.write(f"Would archive and drop partition {name}")
+                    continue
+                count = archive_partition(table, name, archive_dir)
+                self.stdout.write(f"Archived partition {name} ({count} rows)")
+
+    def _archive_rows(self, cutoff, archive_dir: Path, dry_run: bool) -> None:
+        if dry_run:
+            count = Message.objects.filter(created_at__lt=cutoff).count()
+            self.stdout.write(f"Would archive {count} messages created before {cutoff:%Y-%m-%d}")
+            return
+        counts = archive_rows_before(cutoff, archive_dir)
+        for table, count in counts.items():
+            self.stdout.write(f"Archived {count} rows from {table}")
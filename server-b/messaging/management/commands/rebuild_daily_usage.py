@@ -0,0 +1,50 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from messaging.usage import find_usage_drift, rebuild_daily_usage
+
+
+def _parse_day(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError as exc:
+        raise CommandError(f"Invalid date {value!r}; expected YYYY-MM-DD") from exc
+
+
+class Command(BaseCommand):
+    """Backfill or reconcile the ``DailyUserUsage`` rollup from ``Message``."""
+
+    help = (
+        "Recompute per-user daily usage from the messages table. With --check, "
+        "only report buckets that are out of sync."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            type=_parse_day,
+            help="First day (YYYY-MM-DD) to recompute; defaults to the oldest message.",
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Report drift without changing anything; exits non-zero on drift.",
+        )
+
+    def handle(self, *args, **options):
+        since = options["since"]
+        if options["check"]:
+            drift = find_usage_drift(since)
+            for key, (stored, expected) in sorted(drift.items(), key=lambda item: str(item[0])):
+                self.stdout.write(
+                    f"user={key.user_id} day={key.day} status={key.status} "
+                    f"provider={key.provider_id}: stored={stored} expected={expected}"
+                )
+            if drift:
+                raise CommandError(f"{len(drift)} usage buckets are out of sync")
+            self.stdout.write("Daily usage is in sync.")
+            return
+
+        count = rebuild_daily_usage(since)
+        self.stdout.write(f"Rebuilt {count} daily usage buckets.")
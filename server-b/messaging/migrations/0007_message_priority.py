@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messaging", "0006_message_cost"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="priority",
+            field=models.PositiveSmallIntegerField(
+                choices=[(9, "High"), (5, "Normal"), (1, "Low")],
+                default=5,
+                help_text="Delivery priority requested by the client; higher values are dispatched first",
+            ),
+        ),
+    ]
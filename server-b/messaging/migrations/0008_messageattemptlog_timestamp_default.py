@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0007_message_priority'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='messageattemptlog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0008_messageattemptlog_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('status', 'PENDING')), fields=['-priority', 'created_at'], name='msg_pending_dispatch_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('provider_message_id__gt', ''), ('status', 'SENT')), fields=['updated_at'], name='msg_awaiting_dlr_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0009_message_partial_status_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['-created_at', '-id'], name='msg_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='msg_user_created_id_idx'),
+        ),
+    ]
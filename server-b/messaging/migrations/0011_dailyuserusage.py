@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0010_message_keyset_pagination_indexes'),
+        ('providers', '0004_alter_smsprovider_options_smsprovider_provider_type_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUserUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='Day the messages were created (in TIME_ZONE)')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('AWAITING_RETRY', 'Awaiting Retry'), ('SENT', 'Sent to Provider'), ('DELIVERED', 'Delivered'), ('FAILED', 'Failed'), ('REJECTED', 'Rejected internally')], max_length=20)),
+                ('message_count', models.IntegerField(default=0)),
+                ('total_cost', models.DecimalField(blank=True, decimal_places=2, help_text='Sum of known message costs in Iranian rials (IRR)', max_digits=14, null=True)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('provider', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='daily_usage', to='providers.smsprovider')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_usage', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'user'], name='daily_usage_day_user_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('provider__isnull', False)), fields=('user', 'day', 'status', 'provider'), name='daily_usage_unique_bucket'), models.UniqueConstraint(condition=models.Q(('provider__isnull', True)), fields=('user', 'day', 'status'), name='daily_usage_unique_bucket_no_provider')],
+            },
+        ),
+    ]
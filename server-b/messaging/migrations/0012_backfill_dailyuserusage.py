@@ -0,0 +1,59 @@
+from datetime import datetime, time, timedelta
+
+from django.db import migrations, transaction
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min), timezone.get_current_timezone())
+
+
+def backfill_daily_usage(apps, schema_editor):
+    """Build the usage rollup for existing messages, one day per transaction.
+
+    Mirrors ``messaging.usage.rebuild_daily_usage`` with the historical
+    models. Each day's buckets are replaced, so messages already counted
+    incrementally since 0011 are not counted twice, and days without
+    messages are skipped through the ``created_at`` index.
+    """
+    Message = apps.get_model('messaging', 'Message')
+    DailyUserUsage = apps.get_model('messaging', 'DailyUserUsage')
+
+    first = Message.objects.order_by('created_at').values_list('created_at', flat=True).first()
+    while first is not None:
+        day = timezone.localdate(first)
+        start, end = _day_start(day), _day_start(day + timedelta(days=1))
+        rows = (
+            Message.objects.filter(created_at__gte=start, created_at__lt=end)
+            .values('user_id', 'status', 'provider_id')
+            .annotate(message_count=Count('id'), total_cost=Sum('cost'), last_message_at=Max('created_at'))
+            .order_by()
+        )
+        with transaction.atomic():
+            DailyUserUsage.objects.filter(day=day).delete()
+            DailyUserUsage.objects.bulk_create(
+                [DailyUserUsage(day=day, **row) for row in rows],
+                batch_size=1000,
+            )
+        first = (
+            Message.objects.filter(created_at__gte=end)
+            .order_by('created_at')
+            .values_list('created_at', flat=True)
+            .first()
+        )
+
+
+class Migration(migrations.Migration):
+
+    # Every day commits on its own, so a large table is not backfilled in
+    # one long transaction.
+    atomic = False
+
+    dependencies = [
+        ('messaging', '0011_dailyuserusage'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_daily_usage, migrations.RunPython.noop),
+    ]
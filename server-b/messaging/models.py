@@ -1,5 +1,6 @@
 # server-b/messaging/models.py
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 from providers.models import SmsProvider
 import uuid
@@ -13,6 +14,29 @@ class MessageStatus(models.TextChoices):
     FAILED = 'FAILED', 'Failed'
     REJECTED = 'REJECTED', 'Rejected internally'
 
+class MessagePriority(models.IntegerChoices):
+    """Delivery priority, shared with RabbitMQ message and Celery task priorities."""
+
+    HIGH = 9, 'High'
+    NORMAL = 5, 'Normal'
+    LOW = 1, 'Low'
+
+    @classmethod
+    def from_label(cls, value) -> "MessagePriority":
+        """Map an envelope priority lane (``high``/``normal``/``low``) to a priority."""
+        lookup = {choice.label.lower(): choice for choice in cls}
+        return lookup.get(str(value or "").strip().lower(), cls.NORMAL)
+
+
+# Predicates of the hot background queries (dispatch sweeper and delivery
+# status poller). The partial indexes on ``Message`` use exactly these
+# conditions so the planner can prove a query matches them; keep both in sync.
+PENDING_DISPATCH_CONDITION = models.Q(status=MessageStatus.PENDING)
+AWAITING_DELIVERY_REPORT_CONDITION = models.Q(
+    status=MessageStatus.SENT_TO_PROVIDER, provider_message_id__gt=""
+)
+
+
 class Message(models.Model):
     STATUS_PILL_CLASSES = {
         MessageStatus.PENDING: "pill--pending",
@@ -58,6 +82,11 @@ class Message(models.Model):
         default=0,
         help_text="Number of failed attempts to send"
     )
+    priority = models.PositiveSmallIntegerField(
+        choices=MessagePriority.choices,
+        default=MessagePriority.NORMAL,
+        help_text="Delivery priority requested by the client; higher values are dispatched first"
+    )
 
     # --- Original envelope ---
     initial_envelope = models.JSONField(
@@ -117,6 +146,19 @@ class Message(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['status', 'created_at']),
+            # Keyset pagination of the message lists (messaging.pagination).
+            models.Index(fields=['-created_at', '-id'], name='msg_created_id_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='msg_user_created_id_idx'),
+            models.Index(
+                fields=['-priority', 'created_at'],
+                name='msg_pending_dispatch_idx',
+                condition=PENDING_DISPATCH_CONDITION,
+            ),
+            models.Index(
+                fields=['updated_at'],
+                name='msg_awaiting_dlr_idx',
+                condition=AWAITING_DELIVERY_REPORT_CONDITION,
+            ),
         ]
 
 
@@ -139,7 +181,7 @@ class MessageAttemptLog(models.Model):
         related_name="attempt_logs",
         help_text="The provider used for this attempt",
     )
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
     status = models.CharField(max_length=10, choices=AttemptStatus.choices)
     provider_response = models.JSONField(null=True, blank=True)
 
@@ -201,3 +243,52 @@ class MessageAttemptLog(models.Model):
             return status_map[status_code](message_info)
 
         return f"Failed with provider code: {status_code}"
+
+
+class DailyUserUsage(models.Model):
+    """Per-user daily message counts, maintained incrementally.
+
+    One row per (user, day, status, provider) bucket. ``messaging.usage``
+    moves messages between buckets as their status changes, so dashboards
+    aggregate a few rows per user instead of scanning ``Message``.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_usage')
+    day = models.DateField(help_text="Day the messages were created (in TIME_ZONE)")
+    status = models.CharField(max_length=20, choices=MessageStatus.choices)
+    provider = models.ForeignKey(
+        SmsProvider,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='daily_usage',
+    )
+    message_count = models.IntegerField(default=0)
+    total_cost = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        help_text="Sum of known message costs in Iranian rials (IRR)",
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'day', 'status', 'provider'],
+                condition=models.Q(provider__isnull=False),
+                name='daily_usage_unique_bucket',
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'day', 'status'],
+                condition=models.Q(provider__isnull=True),
+                name='daily_usage_unique_bucket_no_provider',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'user'], name='daily_usage_day_user_idx'),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover - for admin/debug only
+        return f"{self.user_id} {self.day} {self.status}: {self.message_count}"
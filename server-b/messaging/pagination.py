@@ -0,0 +1,142 @@
+"""Keyset (cursor) pagination and cheap result counts for message lists.
+
+OFFSET pagination and exact ``COUNT(*)`` both scan the whole matching range,
+which gets slower as ``messaging_message`` grows. Pages here are addressed by
+the ``(created_at, id)`` of their boundary rows instead, so every page is an
+index range scan on ``msg_created_id_idx`` no matter how deep it is.
+"""
+import base64
+import binascii
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.db import connection
+from django.db.models import Q, QuerySet
+
+AFTER_PARAM = "after"
+BEFORE_PARAM = "before"
+COUNT_CAP = 1000
+
+
+def encode_cursor(created_at: datetime, pk: int) -> str:
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(value: str) -> tuple[datetime, int] | None:
+    """Return ``(created_at, id)`` for ``value`` or ``None`` if it is invalid."""
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode()
+        created_at, pk = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+@dataclass
+class CursorPage:
+    """One page of a keyset-paginated queryset, newest first."""
+
+    object_list: list
+    has_next: bool = False
+    has_previous: bool = False
+    next_cursor: str = ""
+    previous_cursor: str = ""
+    is_first: bool = True
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self) -> bool:
+        return self.has_next or self.has_previous
+
+
+def paginate_by_cursor(queryset: QuerySet, params, page_size: int) -> CursorPage:
+    """Return the page of ``queryset`` selected by the ``after``/``before`` params.
+
+    ``after`` walks towards older messages, ``before`` back towards newer
+    ones; an invalid or missing cursor yields the first (newest) page.
+    """
+    after = decode_cursor(params.get(AFTER_PARAM, ""))
+    before = None if after else decode_cursor(params.get(BEFORE_PARAM, ""))
+
+    if before:
+        created_at, pk = before
+        rows = list(
+            queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+            .order_by("created_at", "id")[: page_size + 1]
+        )
+        has_more = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        page = CursorPage(rows, has_next=True, has_previous=has_more, is_first=not has_more)
+    else:
+        page_qs = queryset.order_by("-created_at", "-id")
+        if after:
+            created_at, pk = after
+            page_qs = page_qs.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+            )
+        rows = list(page_qs[: page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        page = CursorPage(
+            rows, has_next=has_more, has_previous=bool(after), is_first=not after
+        )
+
+    if rows:
+        page.next_cursor = encode_cursor(rows[-1].created_at, rows[-1].pk)
+        page.previous_cursor = encode_cursor(rows[0].created_at, rows[0].pk)
+    return page
+
+
+@dataclass(frozen=True)
+class ResultCount:
+    """A row count that may be estimated or capped; renders as ``~N`` or ``N+``."""
+
+    value: int
+    estimated: bool = False
+    capped: bool = False
+
+    def __str__(self) -> str:
+        if self.capped:
+            return f"{self.value:,}+"
+        if self.estimated:
+            return f"~{self.value:,}"
+        return f"{self.value:,}"
+
+
+def estimate_count(queryset: QuerySet, cap: int = COUNT_CAP) -> ResultCount:
+    """Count ``queryset`` without scanning more than ``cap`` rows.
+
+    An unfiltered queryset on PostgreSQL uses the planner's ``reltuples``
+    statistic; everything else is counted up to ``cap`` rows.
+    """
+    if connection.vendor == "postgresql" and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] > cap:
+            return ResultCount(int(row[0]), estimated=True)
+
+    counted = queryset.order_by()[: cap + 1].count()
+    if counted > cap:
+        return ResultCount(cap, capped=True)
+    return ResultCount(counted)
+
+
+class KeysetPaginationMixin:
+    """``ListView`` mixin that swaps the OFFSET paginator for cursor pages."""
+
+    paginate_by = 10
+
+    def paginate_queryset(self, queryset, page_size):
+        page = paginate_by_cursor(queryset, self.request.GET, page_size)
+        return None, page, page.object_list, page.has_other_pages()
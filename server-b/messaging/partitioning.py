@@ -0,0 +1,193 @@
+"""Monthly range partitions and archival for the messaging tables.
+
+The helpers work in two modes:
+
+* PostgreSQL with natively partitioned tables (see ``docs/PARTITIONING.md``):
+  monthly partitions are created ahead of time and whole partitions older than
+  the retention window are exported, detached and dropped.
+* Any other database, or unpartitioned tables: rows older than the retention
+  window are exported and deleted in batches.
+
+Archives are gzip-compressed JSON Lines files, one per table and period.
+"""
+import gzip
+import json
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime
+from pathlib import Path
+
+from django.db import connection, transaction
+
+from messaging.models import Message, MessageAttemptLog
+
+logger = logging.getLogger(__name__)
+
+# Partitioned tables and the column their ranges are defined on. Attempt logs
+# have no ``created_at``; their ``timestamp`` plays the same role.
+PARTITIONED_TABLES = {
+    Message._meta.db_table: "created_at",
+    MessageAttemptLog._meta.db_table: "timestamp",
+}
+EXPORT_CHUNK_SIZE = 2000
+DELETE_BATCH_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class MonthRange:
+    """Half-open ``[start, end)`` range covering one calendar month."""
+
+    start: date
+    end: date
+
+    @classmethod
+    def containing(cls, day: date) -> "MonthRange":
+        start = day.replace(day=1)
+        return cls(start, add_months(start, 1))
+
+    def partition_name(self, table: str) -> str:
+        return f"{table}_p{self.start:%Y_%m}"
+
+
+def add_months(day: date, months: int) -> date:
+    """Return the first day of the month ``months`` after ``day``'s month."""
+    index = day.year * 12 + (day.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def upcoming_months(today: date, months_ahead: int) -> list[MonthRange]:
+    """Return the current month followed by ``months_ahead`` future months."""
+    first = MonthRange.containing(today)
+    return [
+        MonthRange.containing(add_months(first.start, offset))
+        for offset in range(months_ahead + 1)
+    ]
+
+
+def is_partitioned(table: str) -> bool:
+    """Return ``True`` if ``table`` is a native PostgreSQL partitioned table."""
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = %s",
+            [table],
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions(table: str) -> list[str]:
+    """Return the names of the partitions attached to ``table``."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s ORDER BY child.relname",
+            [table],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def ensure_partition(table: str, month: MonthRange) -> bool:
+    """Create the partition of ``table`` for ``month``; return ``True`` if new."""
+    name = month.partition_name(table)
+    if name in list_partitions(table):
+        return False
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {qn(name)} PARTITION OF {qn(table)} "
+            "FOR VALUES FROM (%s) TO (%s)",
+            [month.start.isoformat(), month.end.isoformat()],
+        )
+    logger.info("Created partition %s", name)
+    return True
+
+
+def partition_month(table: str, name: str) -> MonthRange | None:
+    """Parse the month out of a partition created by :func:`ensure_partition`."""
+    prefix = f"{table}_p"
+    if not name.startswith(prefix):
+        return None
+    try:
+        start = datetime.strptime(name[len(prefix):], "%Y_%m").date()
+    except ValueError:
+        return None
+    return MonthRange.containing(start)
+
+
+def export_rows(sql: str, params: list, path: Path) -> int:
+    """Stream the rows of ``sql`` into a gzip JSON Lines file at ``path``.
+
+    Uses a server-side cursor where the backend supports one so large
+    partitions are never loaded into memory at once. Empty exports leave no
+    file behind.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    with connection.chunked_cursor() as cursor, gzip.open(path, "wt", encoding="utf-8") as fh:
+        cursor.execute(sql, params)
+        columns = [col[0] for col in cursor.description]
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                fh.write(json.dumps(dict(zip(columns, row)), default=str))
+                fh.write("\n")
+            written += len(rows)
+    if not written:
+        path.unlink()
+    return written
+
+
+def archive_partition(table: str, name: str, archive_dir: Path) -> int:
+    """Export partition ``name`` of ``table``, then detach and drop it."""
+    qn = connection.ops.quote_name
+    count = export_rows(
+        f"SELECT * FROM {qn(name)}", [], archive_dir / table / f"{name}.jsonl.gz"
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}")
+        cursor.execute(f"DROP TABLE {qn(name)}")
+    logger.info("Archived and dropped partition %s (%d rows)", name, count)
+    return count
+
+
+def archive_rows_before(cutoff: datetime, archive_dir: Path) -> dict[str, int]:
+    """Export and delete messages (and their attempt logs) older than ``cutoff``."""
+    qn = connection.ops.quote_name
+    message_table = Message._meta.db_table
+    log_table = MessageAttemptLog._meta.db_table
+    suffix = f"before_{cutoff:%Y%m%dT%H%M%S}"
+    old_ids_sql = f"SELECT id FROM {qn(message_table)} WHERE created_at < %s"
+    cutoff_param = connection.ops.adapt_datetimefield_value(cutoff)
+
+    counts = {
+        log_table: export_rows(
+            f"SELECT * FROM {qn(log_table)} WHERE message_id IN ({old_ids_sql}) "
+            "ORDER BY id",
+            [cutoff_param],
+            archive_dir / log_table / f"{log_table}_{suffix}.jsonl.gz",
+        ),
+        message_table: export_rows(
+            f"SELECT * FROM {qn(message_table)} WHERE created_at < %s ORDER BY id",
+            [cutoff_param],
+            archive_dir / message_table / f"{message_table}_{suffix}.jsonl.gz",
+        ),
+    }
+
+    while True:
+        batch = list(
+            Message.objects.filter(created_at__lt=cutoff)
+            .order_by("id")
+            .values_list("id", flat=True)[:DELETE_BATCH_SIZE]
+        )
+        if not batch:
+            break
+        with transaction.atomic():
+            MessageAttemptLog.objects.filter(message_id__in=batch).delete()
+            Message.objects.filter(id__in=batch).delete()
+    return counts
@@ -16,15 +16,19 @@ except ImportError:  # pragma: no cover - fallback for limited environments
 from celery import shared_task
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
 
+from messaging.attempt_logs import attempt_log_buffer
 from messaging.models import (
     Message,
     MessageStatus,
     MessageAttemptLog,
     AttemptStatus,
 )
+from messaging.usage import UsageState, record_usage_change, record_usage_changes, usage_state
 from providers.models import SmsProvider
 from providers.adapters import get_provider_adapter
 from sms_gateway_project.metrics import (
@@ -87,6 +91,129 @@ def _record_final_metrics(message: Message, finalized_at=None) -> None:
         SMS_PROCESSING_DURATION_SECONDS.observe(duration)
 
 
+# Statuses a message only reaches after its send task finished with it.
+_ALREADY_SENT_STATUSES = frozenset(
+    {
+        MessageStatus.SENT_TO_PROVIDER,
+        MessageStatus.DELIVERED,
+        MessageStatus.FAILED,
+        MessageStatus.REJECTED,
+    }
+)
+
+
+def _active_window_start():
+    """Return the oldest ``created_at`` the hot-path queries look at.
+
+    Bounding ``created_at`` lets PostgreSQL prune old partitions of
+    ``messaging_message`` (see ``docs/PARTITIONING.md``).
+    """
+    return timezone.now() - timedelta(days=settings.MESSAGE_ACTIVE_WINDOW_DAYS)
+
+
+def _pending_for_dispatch(window_start, batch_size: int):
+    """Return the next PENDING messages to claim, highest priority first.
+
+    The filter mirrors ``PENDING_DISPATCH_CONDITION`` so the partial
+    ``msg_pending_dispatch_idx`` index serves it.
+    """
+    return (
+        Message.objects.select_for_update(skip_locked=True)
+        .filter(status=MessageStatus.PENDING, created_at__gte=window_start)
+        .order_by("-priority", "created_at")[:batch_size]
+    )
+
+
+def _awaiting_delivery_report(cutoff):
+    """Return sent messages updated since ``cutoff`` that still need a DLR.
+
+    The filter mirrors ``AWAITING_DELIVERY_REPORT_CONDITION`` so the partial
+    ``msg_awaiting_dlr_idx`` index serves it. Messages are sent within the
+    active window of their creation (older pending ones are failed by
+    ``_expire_stale_pending``), so the ``created_at`` bound drops no message
+    updated since ``cutoff``.
+    """
+    return Message.objects.filter(
+        status=MessageStatus.SENT_TO_PROVIDER,
+        provider_message_id__gt="",
+        updated_at__gte=cutoff,
+        created_at__gte=cutoff - timedelta(days=settings.MESSAGE_ACTIVE_WINDOW_DAYS),
+        provider__isnull=False,
+    )
+
+
+def _expire_stale_pending(window_start, limit: int = 1000) -> int:
+    """Fail PENDING messages created before ``window_start``.
+
+    Dispatch only looks inside the active window, so these would otherwise
+    stay PENDING forever and silently drop out of the pending gauge.
+    """
+    reason = (
+        f"Not dispatched within MESSAGE_ACTIVE_WINDOW_DAYS "
+        f"({settings.MESSAGE_ACTIVE_WINDOW_DAYS} days)."
+    )
+    with transaction.atomic():
+        stale = list(
+            Message.objects.select_for_update(skip_locked=True)
+            .filter(status=MessageStatus.PENDING, created_at__lt=window_start)
+            .order_by("created_at")[:limit]
+        )
+        if not stale:
+            return 0
+        finalized_at = timezone.now()
+        Message.objects.filter(id__in=[m.id for m in stale]).update(
+            status=MessageStatus.FAILED, error_message=reason, updated_at=finalized_at
+        )
+        usage_changes = []
+        for message in stale:
+            previous_usage = usage_state(message)
+            message.status = MessageStatus.FAILED
+            message.error_message = reason
+            usage_changes.append((previous_usage, message))
+        record_usage_changes(usage_changes)
+
+    for message in stale:
+        _record_final_metrics(message, finalized_at=finalized_at)
+    logger.warning(
+        "Failed %d pending messages older than the active window.",
+        len(stale),
+        extra={"window_start": window_start.isoformat(), "reason": reason},
+    )
+    return len(stale)
+
+
+def _commit_send_outcome(
+    message: Message,
+    attempt_logs: list[MessageAttemptLog],
+    update_fields: list[str],
+    previous: UsageState,
+) -> None:
+    """Persist the attempt counter and message state, then queue attempt logs.
+
+    The message row and its daily usage bucket (moved from ``previous``) are
+    written together in one transaction; attempt logs are audit data and go
+    to :data:`attempt_log_buffer`, which inserts them in batches off the send
+    path. No row lock is held across the provider HTTP
+    calls; ``send_attempts`` is incremented with ``F()`` so concurrent
+    redeliveries are still counted.
+    """
+    values = {field: getattr(message, field) for field in update_fields}
+    values["send_attempts"] = F("send_attempts") + 1
+    values["updated_at"] = timezone.now()
+    with transaction.atomic():
+        Message.objects.filter(pk=message.id).update(**values)
+        record_usage_change(message, previous)
+    attempt_log_buffer.add(attempt_logs)
+
+
+def _commit_attempt(message: Message, attempt_logs: list[MessageAttemptLog]) -> None:
+    """Count an attempt and queue its logs without changing the message state."""
+    Message.objects.filter(pk=message.id).update(
+        send_attempts=F("send_attempts") + 1, updated_at=timezone.now()
+    )
+    attempt_log_buffer.add(attempt_logs)
+
+
 def _parse_provider_timestamp(value):
     if not value:
         return None
@@ -106,16 +233,7 @@ def _parse_provider_timestamp(value):
 @shared_task
 def update_delivery_statuses():
     cutoff = timezone.now() - timedelta(hours=72)
-    messages = (
-        Message.objects.select_related("provider")
-        .filter(
-            status=MessageStatus.SENT_TO_PROVIDER,
-            updated_at__gte=cutoff,
-            provider__isnull=False,
-        )
-        .exclude(provider_message_id__isnull=True)
-        .exclude(provider_message_id__exact="")
-    )
+    messages = _awaiting_delivery_report(cutoff).select_related("provider")
 
     grouped_messages = defaultdict(list)
     provider_map = {}
@@ -145,6 +263,7 @@ def update_delivery_statuses():
         if not status_payload:
             continue
 
+        usage_changes = []
         for message in provider_messages:
             status_info = None
             for key in (message.provider_message_id, str(message.provider_message_id)):
@@ -159,6 +278,7 @@ def update_delivery_statuses():
             if target_status not in (MessageStatus.DELIVERED, MessageStatus.FAILED):
                 continue
 
+            previous_usage = usage_state(message)
             message.status = target_status
             update_fields = ["status"]
             finalized_at = timezone.now()
@@ -187,8 +307,11 @@ def update_delivery_statuses():
                     update_fields.append("error_message")
 
             message.save(update_fields=list(dict.fromkeys(update_fields)))
+            usage_changes.append((previous_usage, message))
             _record_final_metrics(message, finalized_at=finalized_at)
 
+        record_usage_changes(usage_changes)
+
 
 @shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, retry_kwargs={"max_retries": 3})
 def process_outbound_sms(self, envelope: dict):
@@ -216,6 +339,8 @@ def process_outbound_sms(self, envelope: dict):
         status=MessageStatus.PROCESSING,
         initial_envelope=envelope,
     )
+    record_usage_change(message)
+    created_usage = usage_state(message)
 
     SMS_MESSAGES_PROCESSED_TOTAL.inc()
 
@@ -229,6 +354,7 @@ def process_outbound_sms(self, envelope: dict):
         message.status = MessageStatus.FAILED
         message.error_message = "No provider specified"
         message.save(update_fields=["status", "error_message"])
+        record_usage_change(message, created_usage)
         _record_final_metrics(message, finalized_at=finalized_at)
         logger.error("No provider specified for message %s", message.tracking_id)
         return
@@ -242,6 +368,7 @@ def process_outbound_sms(self, envelope: dict):
         message.status = MessageStatus.FAILED
         message.error_message = f"Provider {provider_name} not found"
         message.save(update_fields=["status", "error_message"])
+        record_usage_change(message, created_usage)
         _record_final_metrics(message, finalized_at=finalized_at)
         logger.error("Provider %s not found for message %s", provider_name, message.tracking_id)
         return
@@ -269,34 +396,53 @@ def process_outbound_sms(self, envelope: dict):
         message.error_message = result.get("reason")
         message.provider_response = result.get("raw_response")
     message.save()
+    record_usage_change(message, created_usage)
     _record_final_metrics(message, finalized_at=finalized_at)
 
 
 @shared_task
 def dispatch_pending_messages(batch_size: int = 50):
     """Periodically dispatch pending messages for sending."""
-    message_ids = []
+    claimed = []
+    window_start = _active_window_start()
+    _expire_stale_pending(window_start)
     with transaction.atomic():
-        pending = (
-            Message.objects.select_for_update(skip_locked=True)
-            .filter(status=MessageStatus.PENDING)[:batch_size]
-        )
-        ids = [m.id for m in pending]
-        if ids:
-            Message.objects.filter(id__in=ids).update(status=MessageStatus.PROCESSING)
-            message_ids = ids
-
-    pending_count = Message.objects.filter(status=MessageStatus.PENDING).count()
+        pending = list(_pending_for_dispatch(window_start, batch_size))
+        claimed = [(m.id, m.priority) for m in pending]
+        if claimed:
+            Message.objects.filter(id__in=[mid for mid, _ in claimed]).update(
+                status=MessageStatus.PROCESSING
+            )
+            usage_changes = []
+            for message in pending:
+                previous_usage = usage_state(message)
+                message.status = MessageStatus.PROCESSING
+                usage_changes.append((previous_usage, message))
+            record_usage_changes(usage_changes)
+
+    pending_count = Message.objects.filter(
+        status=MessageStatus.PENDING, created_at__gte=window_start
+    ).count()
     SMS_MESSAGES_PENDING_GAUGE.set(pending_count)
 
-    for mid in message_ids:
-        send_sms_with_failover.delay(mid)
+    for mid, priority in claimed:
+        send_sms_with_failover.apply_async(args=[mid], priority=priority)
 
 
 @shared_task(bind=True, max_retries=5)
 def send_sms_with_failover(self, message_id: int):
     """Send an SMS using available providers with retry and intelligent failover."""
     message = Message.objects.get(pk=message_id)
+    if message.status in _ALREADY_SENT_STATUSES:
+        # Tasks are acknowledged late, so a worker that died mid-task leaves
+        # them to be redelivered; never send the message twice.
+        logger.info(
+            "Skipping send for message already in status %s.",
+            message.status,
+            extra={"message_id": message_id},
+        )
+        return
+    previous_usage = usage_state(message)
     envelope = message.initial_envelope or {}
 
     # Determine provider list
@@ -315,116 +461,145 @@ def send_sms_with_failover(self, message_id: int):
         )
 
     message.send_attempts = message.send_attempts + 1
-    message.save(update_fields=["send_attempts"])
 
     sent_successfully = False
     all_failures_were_permanent = True
     error_logs: list[str] = []
+    attempt_logs: list[MessageAttemptLog] = []
 
-    for index, provider in enumerate(providers):
-        adapter = get_provider_adapter(provider)
-        start_time = time.perf_counter()
-        try:
-            result = adapter.send_sms(message.recipient, message.text)
-        except Exception as exc:  # pragma: no cover - defensive
-            result = {
-                "status": "failure",
-                "type": "transient",
-                "reason": str(exc),
-                "raw_response": None,
-            }
-        elapsed = time.perf_counter() - start_time
-        _observe_provider_attempt(provider, result, elapsed)
-
-        status = (
-            AttemptStatus.SUCCESS
-            if result.get("status") == "success"
-            else AttemptStatus.FAILURE
-        )
-
-        MessageAttemptLog.objects.create(
-            message=message,
-            provider=provider,
-            status=status,
-            provider_response=result.get("raw_response"),
-        )
+    committed = False
+    try:
+        for index, provider in enumerate(providers):
+            adapter = get_provider_adapter(provider)
+            start_time = time.perf_counter()
+            try:
+                result = adapter.send_sms(message.recipient, message.text)
+            except Exception as exc:  # pragma: no cover - defensive
+                result = {
+                    "status": "failure",
+                    "type": "transient",
+                    "reason": str(exc),
+                    "raw_response": None,
+                }
+            elapsed = time.perf_counter() - start_time
+            _observe_provider_attempt(provider, result, elapsed)
+
+            status = (
+                AttemptStatus.SUCCESS
+                if result.get("status") == "success"
+                else AttemptStatus.FAILURE
+            )
+
+            attempt_logs.append(
+                MessageAttemptLog(
+                    message=message,
+                    provider=provider,
+                    status=status,
+                    provider_response=result.get("raw_response"),
+                    timestamp=timezone.now(),
+                )
+            )
+
+            if result.get("status") == "success":
+                sent_successfully = True
+                finalized_at = timezone.now()
+                message.status = MessageStatus.SENT_TO_PROVIDER
+                message.provider = provider
+                message.provider_message_id = result.get("message_id")
+                message.provider_response = result.get("raw_response")
+                message.sent_at = finalized_at
+                message.error_message = ""
+                update_fields = [
+                    "status",
+                    "provider",
+                    "provider_message_id",
+                    "provider_response",
+                    "sent_at",
+                    "error_message",
+                ]
+                if "cost" in result:
+                    # Provider adapters normalise costs to Iranian rials (IRR) before persisting.
+                    message.cost = result.get("cost")
+                    update_fields.append("cost")
+                _commit_send_outcome(message, attempt_logs, update_fields, previous_usage)
+                committed = True
+                _record_final_metrics(message, finalized_at=finalized_at)
+                break
+
+            # Failure case
+            reason = result.get("reason") or "Unknown error"
+            error_logs.append(reason)
+            if result.get("type") == "transient":
+                all_failures_were_permanent = False
+                if index + 1 < len(providers):
+                    next_provider = providers[index + 1]
+                    SMS_PROVIDER_FAILOVERS_TOTAL.labels(
+                        from_provider=_provider_label(provider),
+                        to_provider=_provider_label(next_provider),
+                    ).inc()
+                continue
 
-        if result.get("status") == "success":
-            sent_successfully = True
+            # Permanent failure - fail fast
             finalized_at = timezone.now()
-            message.status = MessageStatus.SENT_TO_PROVIDER
-            message.provider = provider
-            message.provider_message_id = result.get("message_id")
-            message.provider_response = result.get("raw_response")
-            message.sent_at = finalized_at
-            message.error_message = ""
-            update_fields = [
-                "status",
-                "provider",
-                "provider_message_id",
-                "provider_response",
-                "sent_at",
-                "error_message",
-            ]
-            if "cost" in result:
-                # Provider adapters normalise costs to Iranian rials (IRR) before persisting.
-                message.cost = result.get("cost")
-                update_fields.append("cost")
-            message.save(update_fields=update_fields)
+            message.status = MessageStatus.FAILED
+            message.error_message = reason
+            _commit_send_outcome(
+                message, attempt_logs, ["status", "error_message"], previous_usage
+            )
+            committed = True
             _record_final_metrics(message, finalized_at=finalized_at)
-            break
-
-        # Failure case
-        reason = result.get("reason") or "Unknown error"
-        error_logs.append(reason)
-        if result.get("type") == "transient":
-            all_failures_were_permanent = False
-            if index + 1 < len(providers):
-                next_provider = providers[index + 1]
-                SMS_PROVIDER_FAILOVERS_TOTAL.labels(
-                    from_provider=_provider_label(provider),
-                    to_provider=_provider_label(next_provider),
-                ).inc()
-            continue
+            publish_to_dlq(message)
+            return
 
-        # Permanent failure - fail fast
-        finalized_at = timezone.now()
-        message.status = MessageStatus.FAILED
-        message.error_message = reason
-        message.save(update_fields=["status", "error_message"])
-        _record_final_metrics(message, finalized_at=finalized_at)
-        publish_to_dlq(message)
-        return
-
-    if sent_successfully:
-        return
+        if sent_successfully:
+            return
 
-    if all_failures_were_permanent:
+        if all_failures_were_permanent:
+            finalized_at = timezone.now()
+            message.status = MessageStatus.FAILED
+            message.error_message = "; ".join(error_logs)
+            _commit_send_outcome(
+                message, attempt_logs, ["status", "error_message"], previous_usage
+            )
+            committed = True
+            _record_final_metrics(message, finalized_at=finalized_at)
+            publish_to_dlq(message)
+            return
+
+        # At least one transient failure
+        message.status = MessageStatus.AWAITING_RETRY
+        message.error_message = error_logs[-1] if error_logs else "Transient failure"
+
+        if self.request.retries < self.max_retries:
+            _commit_send_outcome(
+                message, attempt_logs, ["status", "error_message"], previous_usage
+            )
+            committed = True
+            delay = 60 * (2 ** self.request.retries)
+            SMS_CELERY_TASK_RETRIES_TOTAL.inc()
+            raise self.retry(countdown=delay)
+
+        # Retry limit exceeded
         finalized_at = timezone.now()
         message.status = MessageStatus.FAILED
         message.error_message = "; ".join(error_logs)
-        message.save(update_fields=["status", "error_message"])
+        _commit_send_outcome(
+            message, attempt_logs, ["status", "error_message"], previous_usage
+        )
+        committed = True
         _record_final_metrics(message, finalized_at=finalized_at)
         publish_to_dlq(message)
-        return
+    finally:
+        if not committed:
+            # Something raised before the outcome was written; the providers
+            # already called still count as an attempt and keep their logs.
+            _commit_attempt(message, attempt_logs)
 
-    # At least one transient failure
-    message.status = MessageStatus.AWAITING_RETRY
-    message.error_message = error_logs[-1] if error_logs else "Transient failure"
-    message.save(update_fields=["status", "error_message"])
-
-    if self.request.retries < self.max_retries:
-        delay = 60 * (2 ** self.request.retries)
-        SMS_CELERY_TASK_RETRIES_TOTAL.inc()
-        raise self.retry(countdown=delay)
-
-    # Retry limit exceeded
-    finalized_at = timezone.now()
-    message.status = MessageStatus.FAILED
-    message.error_message = "; ".join(error_logs)
-    message.save(update_fields=["status", "error_message"])
-    _record_final_metrics(message, finalized_at=finalized_at)
-    publish_to_dlq(message)
+
+@shared_task
+def maintain_message_partitions():
+    """Create upcoming message partitions and archive data past retention."""
+    call_command("maintain_message_partitions")
 
 
 def publish_to_dlq(message: Message) -> None:
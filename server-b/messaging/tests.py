@@ -1,12 +1,18 @@
+import gzip
 import json
+import shutil
+import tempfile
 import uuid
 import os
-from datetime import timedelta
+from datetime import date, timedelta
 from decimal import Decimal
+from io import StringIO
+from pathlib import Path
 from urllib.parse import parse_qs, urlparse
 
 import django
 import pika
+from unittest import skipUnless
 from unittest.mock import MagicMock, patch, call, ANY
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sms_gateway_project.settings")
@@ -15,20 +21,40 @@ django.setup()
 from celery.exceptions import Retry
 from django.contrib.auth.models import User
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.db.migrations.loader import MigrationLoader
 from django.http import HttpRequest, QueryDict
 from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
+from messaging.attempt_logs import AttemptLogBuffer
 from messaging.forms import MessageFilterForm
-from messaging.models import Message, MessageStatus, MessageAttemptLog, AttemptStatus
+from messaging.pagination import estimate_count
+from messaging.partitioning import MonthRange, partition_month, upcoming_months
+from messaging.models import (
+    AWAITING_DELIVERY_REPORT_CONDITION,
+    PENDING_DISPATCH_CONDITION,
+    DailyUserUsage,
+    Message,
+    MessageStatus,
+    MessageAttemptLog,
+    MessagePriority,
+    AttemptStatus,
+)
 from messaging.tasks import (
+    _awaiting_delivery_report,
+    _pending_for_dispatch,
     process_outbound_sms,
     dispatch_pending_messages,
     send_sms_with_failover,
 )
 from messaging.templatetags.messaging_currency import rial_to_toman
+from messaging.usage import record_usage_change, usage_state
 from providers.models import AuthType, SmsProvider
+from sms_gateway_project.metrics import SMS_ATTEMPT_LOGS_DROPPED_TOTAL
 
 
 class MessageModelTests(TestCase):
@@ -198,15 +224,40 @@ class UserMessageListViewTests(TestCase):
 
         self.assertTrue(response.context["is_paginated"])
         self.assertEqual(len(response.context["message_list"]), 10)
-        self.assertContains(response, "?page=2")
+        page_1 = response.context["page_obj"]
+        self.assertFalse(page_1.has_previous)
+        self.assertContains(response, f"?after={page_1.next_cursor}")
+
+        response_page_2 = self.client.get(url, {"after": page_1.next_cursor})
+        page_2 = response_page_2.context["page_obj"]
+        self.assertEqual(len(page_2), 10)
+        self.assertContains(response_page_2, f"?before={page_2.previous_cursor}")
+
+        response_page_3 = self.client.get(url, {"after": page_2.next_cursor})
+        page_3 = response_page_3.context["page_obj"]
+        self.assertEqual(len(page_3), 10)
+        self.assertFalse(page_3.has_next)
+
+        walked = [m.pk for page in (page_1, page_2, page_3) for m in page]
+        expected = list(
+            Message.objects.order_by("-created_at", "-id").values_list("pk", flat=True)
+        )
+        self.assertEqual(walked, expected)
 
-        response_page_2 = self.client.get(url, {"page": 2})
-        self.assertEqual(len(response_page_2.context["message_list"]), 10)
-        self.assertContains(response_page_2, "?page=1")
+        response_back = self.client.get(url, {"before": page_3.previous_cursor})
+        self.assertEqual(
+            [m.pk for m in response_back.context["message_list"]],
+            [m.pk for m in page_2],
+        )
 
-        response_page_3 = self.client.get(url, {"page": 3})
-        self.assertEqual(len(response_page_3.context["message_list"]), 10)
-        self.assertContains(response_page_3, "?page=2")
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        self.client.login(username="user", password="pass")
+        url = reverse("messaging:my_messages_list")
+        response = self.client.get(url, {"after": "not-a-cursor"})
+        self.assertEqual(
+            [m.pk for m in response.context["message_list"]],
+            [self.msg2.pk, self.msg1.pk],
+        )
 
     def test_replace_query_preserves_existing_parameters(self):
         request = HttpRequest()
@@ -240,6 +291,7 @@ class AdminMessageListViewTests(TestCase):
             balance_url="http://example.com/balance-b",
             default_sender="200",
             auth_type=AuthType.NONE,
+            priority=1,
         )
 
     def test_admin_list_requires_staff(self):
@@ -266,15 +318,49 @@ class AdminMessageListViewTests(TestCase):
         response = self.client.get(url)
 
         self.assertTrue(response.context["is_paginated"])
-        self.assertContains(response, "?page=2")
+        self.assertEqual(str(response.context["result_count"]), "30")
+        next_cursor = response.context["page_obj"].next_cursor
+        self.assertContains(response, f"?after={next_cursor}")
 
-        response_page_2 = self.client.get(url, {"page": 2})
+        response_page_2 = self.client.get(url, {"after": next_cursor})
         self.assertEqual(len(response_page_2.context["message_list"]), 10)
-        self.assertContains(response_page_2, "?page=1")
+        previous_cursor = response_page_2.context["page_obj"].previous_cursor
+        self.assertContains(response_page_2, f"?before={previous_cursor}")
 
-        response_page_3 = self.client.get(url, {"page": 3})
+        response_page_3 = self.client.get(
+            url, {"after": response_page_2.context["page_obj"].next_cursor}
+        )
         self.assertEqual(len(response_page_3.context["message_list"]), 10)
-        self.assertContains(response_page_3, "?page=2")
+        self.assertFalse(response_page_3.context["page_obj"].has_next)
+
+    def test_admin_pagination_keeps_filters(self):
+        self.client.login(username="admin", password="pass")
+        Message.objects.bulk_create(
+            [
+                Message(
+                    user=self.staff,
+                    tracking_id=uuid.uuid4(),
+                    recipient=f"+5555{i}",
+                    text=f"hello {i}",
+                    provider=self.provider if i % 2 else self.other_provider,
+                )
+                for i in range(30)
+            ]
+        )
+
+        url = reverse("messaging:admin_messages_list")
+        response = self.client.get(url, {"provider": self.provider.pk})
+        next_cursor = response.context["page_obj"].next_cursor
+        self.assertContains(
+            response, f"?provider={self.provider.pk}&amp;after={next_cursor}"
+        )
+
+        response_page_2 = self.client.get(
+            url, {"provider": self.provider.pk, "after": next_cursor}
+        )
+        page_2 = response_page_2.context["message_list"]
+        self.assertEqual(len(page_2), 5)
+        self.assertTrue(all(m.provider_id == self.provider.pk for m in page_2))
 
     def test_filter_form_in_context(self):
         self.client.login(username="admin", password="pass")
@@ -407,7 +493,7 @@ class AdminMessageListViewTests(TestCase):
             "provider": str(self.provider.pk),
             "date_from": "2024-01-01",
             "date_to": "2024-01-31",
-            "page": 1,
+            "after": "cursor",
         }
         response = self.client.get(url, params)
 
@@ -423,7 +509,7 @@ class AdminMessageListViewTests(TestCase):
         self.assertEqual(user_query.get("provider"), [str(self.provider.pk)])
         self.assertEqual(user_query.get("date_from"), ["2024-01-01"])
         self.assertEqual(user_query.get("date_to"), ["2024-01-31"])
-        self.assertNotIn("page", user_query)
+        self.assertNotIn("after", user_query)
 
         status_chip = chips["status"]
         parsed_status = urlparse(status_chip["remove_url"])
@@ -554,6 +640,50 @@ class ConsumeSmsQueueCommandTests(TestCase):
         channel.basic_publish.assert_not_called()
         mock_conn.return_value.close.assert_called_once()
 
+    @patch("messaging.management.commands.consume_sms_queue.pika.BlockingConnection")
+    def test_high_priority_lane_uses_dedicated_queues(self, mock_conn):
+        channel = MagicMock()
+        callback_holder = {}
+
+        def basic_consume(queue, on_message_callback, auto_ack=False):
+            callback_holder["cb"] = on_message_callback
+
+        def start_consuming():
+            envelope = {
+                "tracking_id": str(uuid.uuid4()),
+                "user_id": self.user.id,
+                "to": "+123",
+                "text": "code 1234",
+                "priority": "high",
+            }
+            method = MagicMock()
+            method.delivery_tag = 1
+            callback_holder["cb"](channel, method, None, json.dumps(envelope).encode())
+            raise KeyboardInterrupt
+
+        channel.basic_consume.side_effect = basic_consume
+        channel.start_consuming.side_effect = start_consuming
+        mock_conn.return_value.channel.return_value = channel
+
+        call_command("consume_sms_queue", lane="high")
+
+        self.assertEqual(Message.objects.get().priority, MessagePriority.HIGH)
+        channel.queue_declare.assert_any_call(queue="sms_outbound_high_queue", durable=True)
+        channel.queue_declare.assert_any_call(
+            queue="sms_retry_wait_queue_high",
+            durable=True,
+            arguments={
+                "x-message-ttl": 5000,
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": "sms_outbound_high_queue",
+            },
+        )
+        channel.basic_qos.assert_called_once_with(prefetch_count=1)
+        channel.basic_consume.assert_called_once_with(
+            queue="sms_outbound_high_queue", on_message_callback=ANY, auto_ack=False
+        )
+        channel.basic_ack.assert_called_once_with(delivery_tag=1)
+
     @patch("messaging.management.commands.consume_sms_queue.pika.BlockingConnection")
     def test_duplicate_message_is_acked(self, mock_conn):
         tracking = uuid.uuid4()
@@ -770,19 +900,223 @@ class DispatchPendingMessagesTests(TestCase):
             text="hi2",
         )
 
-    @patch("messaging.tasks.send_sms_with_failover.delay")
-    def test_dispatch_claims_and_enqueues(self, mock_delay):
+    @patch("messaging.tasks.send_sms_with_failover.apply_async")
+    def test_dispatch_claims_and_enqueues(self, mock_apply_async):
         dispatch_pending_messages.run(batch_size=10)
 
         self.msg1.refresh_from_db()
         self.msg2.refresh_from_db()
         self.assertEqual(self.msg1.status, MessageStatus.PROCESSING)
         self.assertEqual(self.msg2.status, MessageStatus.PROCESSING)
-        mock_delay.assert_has_calls(
-            [call(self.msg1.id), call(self.msg2.id)], any_order=True
+        mock_apply_async.assert_has_calls(
+            [
+                call(args=[self.msg1.id], priority=MessagePriority.NORMAL),
+                call(args=[self.msg2.id], priority=MessagePriority.NORMAL),
+            ],
+            any_order=True,
+        )
+
+    @patch("messaging.tasks.send_sms_with_failover.apply_async")
+    def test_dispatch_claims_high_priority_messages_first(self, mock_apply_async):
+        otp = Message.objects.create(
+            user=self.user,
+            tracking_id=uuid.uuid4(),
+            recipient="333",
+            text="code 1234",
+            priority=MessagePriority.HIGH,
+        )
+
+        dispatch_pending_messages.run(batch_size=1)
+
+        otp.refresh_from_db()
+        self.msg1.refresh_from_db()
+        self.assertEqual(otp.status, MessageStatus.PROCESSING)
+        self.assertEqual(self.msg1.status, MessageStatus.PENDING)
+        mock_apply_async.assert_called_once_with(
+            args=[otp.id], priority=MessagePriority.HIGH
+        )
+
+    @override_settings(MESSAGE_ACTIVE_WINDOW_DAYS=7)
+    def test_delivery_poll_keeps_messages_sent_late_in_active_window(self):
+        provider = SmsProvider.objects.create(
+            name="Provider",
+            slug="provider",
+            send_url="http://example.com/send",
+            balance_url="http://example.com/bal",
+            auth_type=AuthType.NONE,
+        )
+        # Sent on its last pending day, so the 72h poll outlives the window.
+        Message.objects.filter(pk=self.msg2.pk).update(
+            status=MessageStatus.SENT_TO_PROVIDER,
+            provider=provider,
+            provider_message_id="p-1",
+            created_at=timezone.now() - timedelta(days=9),
+            updated_at=timezone.now() - timedelta(days=2),
+        )
+
+        cutoff = timezone.now() - timedelta(hours=72)
+        self.assertEqual(list(_awaiting_delivery_report(cutoff)), [self.msg2])
+
+    def test_tasks_go_to_a_new_priority_queue(self):
+        from sms_gateway_project.celery import app
+
+        queue = app.amqp.queues[app.conf.task_default_queue]
+        # RabbitMQ rejects x-max-priority on the existing "celery" queue.
+        self.assertNotEqual(queue.name, "celery")
+        self.assertEqual(queue.queue_arguments, {"x-max-priority": 10})
+
+    def test_workers_reserve_one_task_at_a_time(self):
+        from sms_gateway_project.celery import app
+
+        # Otherwise prefetched tasks bypass the queue's priority order.
+        self.assertEqual(app.conf.worker_prefetch_multiplier, 1)
+        self.assertTrue(app.conf.task_acks_late)
+
+    @override_settings(MESSAGE_ACTIVE_WINDOW_DAYS=7)
+    @patch("messaging.tasks.send_sms_with_failover.apply_async")
+    def test_dispatch_fails_messages_outside_active_window(self, mock_apply_async):
+        Message.objects.filter(pk=self.msg2.pk).update(
+            created_at=timezone.now() - timedelta(days=8)
+        )
+
+        with self.assertLogs("messaging.tasks", "WARNING") as logs:
+            dispatch_pending_messages.run(batch_size=10)
+
+        self.msg2.refresh_from_db()
+        self.assertEqual(self.msg2.status, MessageStatus.FAILED)
+        self.assertIn("MESSAGE_ACTIVE_WINDOW_DAYS", self.msg2.error_message)
+        self.assertIn("Failed 1 pending messages", logs.output[0])
+        mock_apply_async.assert_called_once_with(
+            args=[self.msg1.id], priority=MessagePriority.NORMAL
         )
 
 
+class HotQueryIndexTests(SimpleTestCase):
+    """Guard that the sweeper and poller queries match their partial indexes."""
+
+    def _index(self, name):
+        return next(index for index in Message._meta.indexes if index.name == name)
+
+    def _lookups(self, queryset):
+        lookups = set()
+        for lookup in queryset.query.where.children:
+            name = lookup.lhs.target.name
+            if lookup.lookup_name != "exact":
+                name = f"{name}__{lookup.lookup_name}"
+            lookups.add((name, lookup.rhs))
+        return lookups
+
+    def test_indexes_are_created_by_migrations(self):
+        state = MigrationLoader(None, ignore_no_migrations=True).project_state()
+        indexes = {
+            index.name: index for index in state.models["messaging", "message"].options["indexes"]
+        }
+        for name in ("msg_pending_dispatch_idx", "msg_awaiting_dlr_idx"):
+            self.assertEqual(indexes[name].deconstruct(), self._index(name).deconstruct())
+
+    def test_dispatch_sweeper_query_matches_pending_partial_index(self):
+        index = self._index("msg_pending_dispatch_idx")
+        queryset = _pending_for_dispatch(timezone.now(), 50)
+
+        self.assertEqual(index.condition, PENDING_DISPATCH_CONDITION)
+        self.assertLessEqual(set(index.condition.children), self._lookups(queryset))
+        self.assertEqual(list(queryset.query.order_by), index.fields)
+
+    def test_status_poller_query_matches_awaiting_dlr_partial_index(self):
+        index = self._index("msg_awaiting_dlr_idx")
+        queryset = _awaiting_delivery_report(timezone.now())
+
+        self.assertEqual(index.condition, AWAITING_DELIVERY_REPORT_CONDITION)
+        self.assertLessEqual(set(index.condition.children), self._lookups(queryset))
+        self.assertIn("updated_at__gte", {name for name, _ in self._lookups(queryset)})
+
+
+@skipUnless(connection.vendor == "postgresql", "Index names only show up in PostgreSQL plans.")
+class HotQueryPlanTests(TestCase):
+    """Guard that PostgreSQL actually picks the partial indexes.
+
+    The table is loaded with a production-like skew: a large delivered/failed
+    history spread over the active window and only a handful of rows in the
+    hot states, so neither the time bounds nor the status alone make the
+    queries cheap.
+    """
+
+    HISTORY_ROWS = 200_000
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("planner", password="pass")
+        provider = SmsProvider.objects.create(
+            name="Provider",
+            slug="provider",
+            send_url="http://example.com/send",
+            balance_url="http://example.com/bal",
+            default_sender="100",
+            auth_type=AuthType.NONE,
+        )
+        # Generated in the database; building this many rows in Python would
+        # dominate the test run.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO messaging_message (
+                    user_id, provider_id, tracking_id, recipient, text, status,
+                    send_attempts, priority, provider_message_id, created_at, updated_at
+                )
+                SELECT
+                    %(user)s, %(provider)s, md5('history-' || i)::uuid, i::text, 'history',
+                    CASE WHEN i %% 2 = 0 THEN %(delivered)s ELSE %(failed)s END,
+                    1, %(priority)s, i::text,
+                    now() - (i %% 10080) * interval '1 minute',
+                    now() - (i %% 10080) * interval '1 minute' + interval '30 seconds'
+                FROM generate_series(1, %(rows)s) AS i
+                """,
+                {
+                    "user": user.id,
+                    "provider": provider.id,
+                    "delivered": MessageStatus.DELIVERED.value,
+                    "failed": MessageStatus.FAILED.value,
+                    "priority": MessagePriority.NORMAL.value,
+                    "rows": cls.HISTORY_ROWS,
+                },
+            )
+        rows = [
+            Message(user=user, tracking_id=uuid.uuid4(), recipient="p", text="pending")
+            for _ in range(5)
+        ]
+        rows += [
+            Message(
+                user=user,
+                tracking_id=uuid.uuid4(),
+                recipient="s",
+                text="sent",
+                provider=provider,
+                provider_message_id=f"sent-{index}",
+                status=MessageStatus.SENT_TO_PROVIDER,
+            )
+            for index in range(5)
+        ]
+        Message.objects.bulk_create(rows)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE messaging_message")
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f"Expected {index_name} in plan:\n{plan}")
+
+    def test_dispatch_sweeper_uses_pending_partial_index(self):
+        window_start = timezone.now() - timedelta(days=7)
+        with transaction.atomic():
+            self.assertUsesIndex(
+                _pending_for_dispatch(window_start, 50), "msg_pending_dispatch_idx"
+            )
+
+    def test_status_poller_uses_awaiting_dlr_partial_index(self):
+        cutoff = timezone.now() - timedelta(hours=72)
+        self.assertUsesIndex(_awaiting_delivery_report(cutoff), "msg_awaiting_dlr_idx")
+
+
+@override_settings(ATTEMPT_LOG_BATCH_SIZE=1)
 class SendSmsWithFailoverTaskTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user("user", password="pass")
@@ -847,6 +1181,70 @@ class SendSmsWithFailoverTaskTests(TestCase):
         self.assertEqual(logs[1].provider, self.provider2)
         self.assertEqual(logs[1].status, AttemptStatus.SUCCESS)
 
+    @patch("messaging.tasks.get_provider_adapter")
+    def test_redelivered_task_does_not_resend(self, mock_get_adapter):
+        Message.objects.filter(pk=self.message.pk).update(status=MessageStatus.SENT_TO_PROVIDER)
+
+        send_sms_with_failover.run(self.message.id)
+
+        mock_get_adapter.assert_not_called()
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.send_attempts, 0)
+
+    @patch("messaging.tasks.attempt_log_buffer")
+    @patch("messaging.tasks.get_provider_adapter")
+    def test_attempt_is_counted_when_the_provider_loop_raises(self, mock_get_adapter, mock_buffer):
+        adapter1 = MagicMock()
+        adapter1.send_sms.return_value = {
+            "status": "failure",
+            "type": "transient",
+            "reason": "oops",
+            "raw_response": {},
+        }
+        mock_get_adapter.side_effect = [adapter1, RuntimeError("bad adapter config")]
+
+        with self.assertRaises(RuntimeError):
+            send_sms_with_failover.run(self.message.id)
+
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.send_attempts, 1)
+        self.assertEqual(self.message.status, MessageStatus.PENDING)
+        (logs,), _ = mock_buffer.add.call_args
+        self.assertEqual([(log.provider, log.status) for log in logs], [(self.provider1, AttemptStatus.FAILURE)])
+
+    @override_settings(ATTEMPT_LOG_BATCH_SIZE=2)
+    @patch("messaging.tasks.get_provider_adapter")
+    def test_failover_writes_state_in_a_single_update(self, mock_get_adapter):
+        adapter1 = MagicMock()
+        adapter1.send_sms.return_value = {
+            "status": "failure",
+            "type": "transient",
+            "reason": "oops",
+            "raw_response": {},
+        }
+        adapter2 = MagicMock()
+        adapter2.send_sms.return_value = {
+            "status": "success",
+            "message_id": "xyz",
+            "raw_response": {},
+        }
+        mock_get_adapter.side_effect = [adapter1, adapter2]
+
+        # Message read and provider list; then, in one transaction, the state
+        # UPDATE and the usage bucket moves (two UPDATEs plus the INSERT of the
+        # new SENT bucket in its own savepoint); then the buffered logs' bulk
+        # INSERT (flushed immediately because the batch is full), in a
+        # savepoint of its own.
+        with self.assertNumQueries(13):
+            send_sms_with_failover.run(self.message.id)
+
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.send_attempts, 1)
+        self.assertEqual(self.message.status, MessageStatus.SENT_TO_PROVIDER)
+        self.assertEqual(
+            MessageAttemptLog.objects.filter(message=self.message).count(), 2
+        )
+
     @patch("messaging.tasks.publish_to_dlq")
     @patch("messaging.tasks.get_provider_adapter")
     def test_retry_on_transient_failure(self, mock_get_adapter, mock_publish):
@@ -957,7 +1355,107 @@ class SendSmsWithFailoverTaskTests(TestCase):
         mock_publish.assert_called_once_with(self.message)
 
 
-@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+@override_settings(ATTEMPT_LOG_BATCH_SIZE=3, ATTEMPT_LOG_FLUSH_INTERVAL_SECONDS=60)
+class AttemptLogBufferTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("buffer", password="pass")
+        self.provider = SmsProvider.objects.create(
+            name="Provider",
+            slug="provider",
+            send_url="http://example.com/send",
+            balance_url="http://example.com/bal",
+            default_sender="100",
+            auth_type=AuthType.NONE,
+        )
+        self.message = Message.objects.create(
+            user=user,
+            tracking_id=uuid.uuid4(),
+            recipient="12345",
+            text="hello",
+        )
+        self.buffer = AttemptLogBuffer()
+        # Keep the background flusher out of the test transaction.
+        self.buffer._ensure_flusher = lambda: None
+
+    def _logs(self, count):
+        return [
+            MessageAttemptLog(
+                message=self.message,
+                provider=self.provider,
+                status=AttemptStatus.FAILURE,
+            )
+            for _ in range(count)
+        ]
+
+    def test_logs_are_held_until_the_batch_is_full(self):
+        self.buffer.add(self._logs(2))
+        self.assertEqual(len(self.buffer), 2)
+        self.assertFalse(MessageAttemptLog.objects.exists())
+
+        self.buffer.add(self._logs(1))
+
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(MessageAttemptLog.objects.count(), 3)
+
+    def test_flush_writes_pending_logs_in_one_query(self):
+        self.buffer.add(self._logs(2))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.buffer.flush(), 2)
+
+        # Inside the test transaction the flush also sets a savepoint.
+        inserts = [q["sql"] for q in queries.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 1)
+
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(MessageAttemptLog.objects.count(), 2)
+
+    def test_failed_flush_keeps_logs_for_the_next_attempt(self):
+        self.buffer.add(self._logs(2))
+
+        with patch(
+            "messaging.attempt_logs.MessageAttemptLog.objects.bulk_create",
+            side_effect=django.db.DatabaseError("down"),
+        ):
+            self.assertEqual(self.buffer.flush(), 0)
+
+        self.assertEqual(len(self.buffer), 2)
+        self.assertEqual(self.buffer.flush(), 2)
+
+    def _dropped(self, reason):
+        return SMS_ATTEMPT_LOGS_DROPPED_TOTAL.labels(reason=reason)._value.get()
+
+    def test_rejected_row_is_dropped_without_blocking_the_batch(self):
+        dropped = self._dropped("rejected")
+        poison = MessageAttemptLog(message=self.message, provider=self.provider, status=None)
+
+        # The third row fills the batch and triggers the flush.
+        self.buffer.add(self._logs(1) + [poison] + self._logs(1))
+
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(MessageAttemptLog.objects.count(), 2)
+        self.assertEqual(self._dropped("rejected"), dropped + 1)
+
+        self.buffer.add(self._logs(3))
+        self.assertEqual(MessageAttemptLog.objects.count(), 5)
+
+    @override_settings(ATTEMPT_LOG_MAX_PENDING=4)
+    def test_pending_logs_are_capped_while_the_database_is_down(self):
+        dropped = self._dropped("overflow")
+        first, second = self._logs(3), self._logs(3)
+
+        with patch(
+            "messaging.attempt_logs.MessageAttemptLog.objects.bulk_create",
+            side_effect=django.db.OperationalError("down"),
+        ):
+            self.buffer.add(first)
+            self.buffer.add(second)
+
+        self.assertEqual(self.buffer._pending, first[2:] + second)
+        self.assertEqual(self._dropped("overflow"), dropped + 2)
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True, ATTEMPT_LOG_BATCH_SIZE=1)
 class SmsSendFlowTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user("user", password="pass")
@@ -987,8 +1485,10 @@ class SmsSendFlowTests(TestCase):
         }
         mock_get_adapter.return_value = adapter
 
-        with patch("messaging.tasks.send_sms_with_failover.delay") as mock_delay:
-            mock_delay.side_effect = lambda mid: send_sms_with_failover.run(mid)
+        with patch("messaging.tasks.send_sms_with_failover.apply_async") as mock_apply_async:
+            mock_apply_async.side_effect = (
+                lambda args, priority: send_sms_with_failover.run(*args)
+            )
             dispatch_pending_messages.run()
 
         message.refresh_from_db()
@@ -1038,8 +1538,10 @@ class SmsSendFlowTests(TestCase):
         }
         mock_get_adapter.side_effect = [adapter_a, adapter_b]
 
-        with patch("messaging.tasks.send_sms_with_failover.delay") as mock_delay:
-            mock_delay.side_effect = lambda mid: send_sms_with_failover.run(mid)
+        with patch("messaging.tasks.send_sms_with_failover.apply_async") as mock_apply_async:
+            mock_apply_async.side_effect = (
+                lambda args, priority: send_sms_with_failover.run(*args)
+            )
             dispatch_pending_messages.run()
 
         message.refresh_from_db()
@@ -1090,7 +1592,7 @@ class SmsSendFlowTests(TestCase):
         }
         mock_get_adapter.side_effect = [adapter_a, adapter_b]
 
-        with patch("messaging.tasks.send_sms_with_failover.delay"):
+        with patch("messaging.tasks.send_sms_with_failover.apply_async"):
             dispatch_pending_messages.run()
 
         original = send_sms_with_failover.request.retries
@@ -1150,7 +1652,7 @@ class SmsSendFlowTests(TestCase):
         }
         mock_get_adapter.side_effect = [adapter_a, adapter_b]
 
-        with patch("messaging.tasks.send_sms_with_failover.delay"):
+        with patch("messaging.tasks.send_sms_with_failover.apply_async"):
             dispatch_pending_messages.run()
         send_sms_with_failover.run(message.id)
 
@@ -1228,8 +1730,10 @@ class SmsSendFlowTests(TestCase):
 
         mock_get_adapter.side_effect = fake_get_adapter
 
-        with patch("messaging.tasks.send_sms_with_failover.delay") as mock_delay:
-            mock_delay.side_effect = lambda mid: send_sms_with_failover.run(mid)
+        with patch("messaging.tasks.send_sms_with_failover.apply_async") as mock_apply_async:
+            mock_apply_async.side_effect = (
+                lambda args, priority: send_sms_with_failover.run(*args)
+            )
             dispatch_pending_messages.run()
 
         message.refresh_from_db()
@@ -1238,6 +1742,232 @@ class SmsSendFlowTests(TestCase):
         self.assertEqual(send_order, ["C", "A"])
         adapter_b.send_sms.assert_not_called()
 
+class EstimateCountTests(TestCase):
+    def test_count_is_capped(self):
+        user = User.objects.create_user("counter", password="pass")
+        Message.objects.bulk_create(
+            [
+                Message(user=user, tracking_id=uuid.uuid4(), recipient=str(i), text="x")
+                for i in range(5)
+            ]
+        )
+
+        self.assertEqual(str(estimate_count(Message.objects.all(), cap=3)), "3+")
+        self.assertEqual(str(estimate_count(Message.objects.all(), cap=10)), "5")
+
+
+class MonthRangeTests(SimpleTestCase):
+    def test_upcoming_months_cross_year_boundary(self):
+        months = upcoming_months(date(2025, 11, 20), months_ahead=2)
+
+        self.assertEqual(
+            [m.partition_name("messaging_message") for m in months],
+            [
+                "messaging_message_p2025_11",
+                "messaging_message_p2025_12",
+                "messaging_message_p2026_01",
+            ],
+        )
+        self.assertEqual(months[-1].end, date(2026, 2, 1))
+
+    def test_partition_month_ignores_foreign_names(self):
+        self.assertEqual(
+            partition_month("messaging_message", "messaging_message_p2024_02"),
+            MonthRange(date(2024, 2, 1), date(2024, 3, 1)),
+        )
+        self.assertIsNone(partition_month("messaging_message", "messaging_message_default"))
+
+
+class MaintainMessagePartitionsCommandTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("archiver", password="pass")
+        provider = SmsProvider.objects.create(
+            name="Provider",
+            slug="provider",
+            send_url="http://example.com/send",
+            balance_url="http://example.com/bal",
+            default_sender="100",
+            auth_type=AuthType.NONE,
+        )
+        self.old = Message.objects.create(
+            user=user, tracking_id=uuid.uuid4(), recipient="1", text="old"
+        )
+        self.recent = Message.objects.create(
+            user=user, tracking_id=uuid.uuid4(), recipient="2", text="recent"
+        )
+        Message.objects.filter(pk=self.old.pk).update(
+            created_at=timezone.now() - timedelta(days=120)
+        )
+        MessageAttemptLog.objects.create(
+            message=self.old, provider=provider, status=AttemptStatus.SUCCESS
+        )
+        self.archive_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.archive_dir, ignore_errors=True)
+
+    def _read_archive(self, table):
+        (path,) = (self.archive_dir / table).glob("*.jsonl.gz")
+        with gzip.open(path, "rt", encoding="utf-8") as fh:
+            return [json.loads(line) for line in fh]
+
+    def test_archives_and_deletes_messages_past_retention(self):
+        call_command(
+            "maintain_message_partitions",
+            retention_days=90,
+            archive_dir=str(self.archive_dir),
+            stdout=StringIO(),
+        )
+
+        self.assertEqual(list(Message.objects.values_list("pk", flat=True)), [self.recent.pk])
+        self.assertFalse(MessageAttemptLog.objects.exists())
+        archived = self._read_archive("messaging_message")
+        self.assertEqual([row["id"] for row in archived], [self.old.pk])
+        self.assertEqual(archived[0]["text"], "old")
+        self.assertEqual(len(self._read_archive("messaging_messageattemptlog")), 1)
+
+    def test_dry_run_changes_nothing(self):
+        out = StringIO()
+        call_command(
+            "maintain_message_partitions",
+            retention_days=90,
+            archive_dir=str(self.archive_dir),
+            dry_run=True,
+            stdout=out,
+        )
+
+        self.assertIn("Would archive 1 messages", out.getvalue())
+        self.assertEqual(Message.objects.count(), 2)
+        self.assertFalse(any(self.archive_dir.iterdir()))
+
+    def test_retention_disabled_by_default(self):
+        out = StringIO()
+        call_command(
+            "maintain_message_partitions",
+            retention_days=0,
+            archive_dir=str(self.archive_dir),
+            stdout=out,
+        )
+
+        self.assertIn("Retention disabled", out.getvalue())
+        self.assertEqual(Message.objects.count(), 2)
+
+
+class DailyUserUsageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("usage", password="pass")
+        self.provider = SmsProvider.objects.create(
+            name="Provider",
+            slug="provider",
+            send_url="http://example.com/send",
+            balance_url="http://example.com/bal",
+            default_sender="100",
+            auth_type=AuthType.NONE,
+        )
+        self.message = Message.objects.create(
+            user=self.user, tracking_id=uuid.uuid4(), recipient="1", text="hi"
+        )
+
+    def _buckets(self):
+        return {
+            (row.status, row.provider_id): (row.message_count, row.total_cost)
+            for row in DailyUserUsage.objects.filter(user=self.user)
+        }
+
+    def test_status_change_moves_message_between_buckets(self):
+        record_usage_change(self.message)
+        previous = usage_state(self.message)
+
+        self.message.status = MessageStatus.SENT_TO_PROVIDER
+        self.message.provider = self.provider
+        self.message.cost = Decimal("1200")
+        self.message.save()
+        record_usage_change(self.message, previous)
+
+        self.assertEqual(
+            self._buckets(),
+            {
+                (MessageStatus.PENDING, None): (0, None),
+                (MessageStatus.SENT_TO_PROVIDER, self.provider.id): (1, Decimal("1200")),
+            },
+        )
+        bucket = DailyUserUsage.objects.get(status=MessageStatus.SENT_TO_PROVIDER)
+        self.assertEqual(bucket.day, timezone.localdate(self.message.created_at))
+        self.assertEqual(bucket.last_message_at, self.message.created_at)
+
+    @patch("messaging.tasks.send_sms_with_failover.apply_async")
+    def test_dispatch_moves_claimed_messages_to_processing(self, mock_apply_async):
+        record_usage_change(self.message)
+
+        dispatch_pending_messages.run(batch_size=10)
+
+        self.assertEqual(
+            self._buckets(),
+            {
+                (MessageStatus.PENDING, None): (0, None),
+                (MessageStatus.PROCESSING, None): (1, None),
+            },
+        )
+
+    def test_rebuild_command_reports_and_repairs_drift(self):
+        # The message was created without going through the tasks, so the
+        # rollup does not know about it yet.
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, "1 usage buckets are out of sync"):
+            call_command("rebuild_daily_usage", check=True, stdout=out)
+        self.assertIn("status=PENDING", out.getvalue())
+
+        call_command("rebuild_daily_usage", stdout=StringIO())
+        self.assertEqual(self._buckets(), {(MessageStatus.PENDING, None): (1, None)})
+
+        out = StringIO()
+        call_command("rebuild_daily_usage", check=True, stdout=out)
+        self.assertIn("in sync", out.getvalue())
+
+    def test_rebuild_keeps_usage_for_days_without_messages(self):
+        call_command("rebuild_daily_usage", stdout=StringIO())
+        Message.objects.filter(pk=self.message.pk).update(
+            created_at=timezone.now() + timedelta(days=1)
+        )
+
+        call_command("rebuild_daily_usage", stdout=StringIO())
+
+        self.assertEqual(DailyUserUsage.objects.filter(user=self.user).count(), 2)
+
+
+    def test_migration_backfills_existing_messages_per_day(self):
+        from importlib import import_module
+
+        from django.apps import apps
+
+        backfill = import_module("messaging.migrations.0012_backfill_dailyuserusage")
+        # Already counted incrementally; the backfill must not count it twice.
+        record_usage_change(self.message)
+        older = Message.objects.create(
+            user=self.user,
+            tracking_id=uuid.uuid4(),
+            recipient="2",
+            text="hi",
+            status=MessageStatus.DELIVERED,
+            provider=self.provider,
+            cost=Decimal("500"),
+        )
+        older_at = timezone.now() - timedelta(days=3)
+        Message.objects.filter(pk=older.pk).update(created_at=older_at)
+
+        backfill.backfill_daily_usage(apps, None)
+
+        self.assertEqual(
+            {
+                (row.day, row.status, row.provider_id): (row.message_count, row.total_cost)
+                for row in DailyUserUsage.objects.filter(user=self.user)
+            },
+            {
+                (timezone.localdate(self.message.created_at), MessageStatus.PENDING, None): (1, None),
+                (timezone.localdate(older_at), MessageStatus.DELIVERED, self.provider.id): (1, Decimal("500")),
+            },
+        )
+        # Raises if the rollup disagrees with the messages.
+        call_command("rebuild_daily_usage", check=True, stdout=StringIO())
+
 class MessageDetailViewTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user("user", password="pass")
@@ -1316,7 +2046,7 @@ class MessageDetailViewTests(TestCase):
         self.assertContains(response, delivered_at.strftime("%Y-%m-%d %I:%M %p"))
 
 
-class AdminMessageListViewTests(TestCase):
+class AdminMessageListRenderingTests(TestCase):
     def setUp(self):
         self.admin = User.objects.create_user("admin", password="pass", is_staff=True)
         self.user = User.objects.create_user("user", password="pass")
@@ -0,0 +1,229 @@
+"""Incrementally maintained per-user daily usage (``DailyUserUsage``).
+
+Every message is counted in exactly one bucket, keyed by its user, the day it
+was created (in ``TIME_ZONE``), its current status and its provider. When a
+message changes status or provider the tasks call :func:`record_usage_change`
+with the state captured before the change; the message is moved from the old
+bucket to the new one with ``F()`` updates so concurrent workers never
+overwrite each other's counts.
+
+Buckets can drift if a worker dies between writing a message and its usage
+row; ``manage.py rebuild_daily_usage`` recomputes them from ``Message``.
+"""
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Iterable, NamedTuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+
+from messaging.models import DailyUserUsage, Message
+
+logger = logging.getLogger(__name__)
+
+
+class BucketKey(NamedTuple):
+    user_id: int
+    day: date
+    status: str
+    provider_id: int | None
+
+
+class UsageState(NamedTuple):
+    """The parts of a message that decide its bucket and contribution."""
+
+    key: BucketKey
+    cost: Decimal | None
+    created_at: datetime
+
+
+@dataclass
+class UsageDelta:
+    message_count: int = 0
+    total_cost: Decimal | None = None
+    last_message_at: datetime | None = None
+
+    def add(self, state: UsageState, sign: int) -> None:
+        self.message_count += sign
+        if state.cost is not None:
+            self.total_cost = (self.total_cost or Decimal(0)) + sign * state.cost
+        if sign > 0 and (self.last_message_at is None or state.created_at > self.last_message_at):
+            self.last_message_at = state.created_at
+
+
+def usage_state(message: Message) -> UsageState:
+    """Snapshot ``message`` before changing its status or provider."""
+    return UsageState(
+        key=BucketKey(
+            user_id=message.user_id,
+            day=timezone.localdate(message.created_at),
+            status=message.status,
+            provider_id=message.provider_id,
+        ),
+        cost=message.cost,
+        created_at=message.created_at,
+    )
+
+
+def record_usage_change(message: Message, previous: UsageState | None = None) -> None:
+    """Move ``message`` from the ``previous`` bucket (if any) to its current one."""
+    record_usage_changes([(previous, message)])
+
+
+def record_usage_changes(changes: Iterable[tuple[UsageState | None, Message]]) -> None:
+    """Apply several ``(previous, message)`` transitions in one pass."""
+    deltas: dict[BucketKey, UsageDelta] = {}
+    for previous, message in changes:
+        current = usage_state(message)
+        if previous == current:
+            continue
+        if previous is not None:
+            deltas.setdefault(previous.key, UsageDelta()).add(previous, -1)
+        deltas.setdefault(current.key, UsageDelta()).add(current, 1)
+    apply_usage_deltas(deltas)
+
+
+def _bucket(key: BucketKey):
+    return DailyUserUsage.objects.filter(
+        user_id=key.user_id, day=key.day, status=key.status, provider_id=key.provider_id
+    )
+
+
+def apply_usage_deltas(deltas: dict[BucketKey, UsageDelta]) -> None:
+    """Add ``deltas`` to their buckets, creating missing buckets as needed.
+
+    Buckets are written in key order so two workers updating overlapping
+    buckets always lock rows in the same order.
+    """
+    for key in sorted(deltas, key=lambda k: (k.user_id, k.day, k.status, k.provider_id or 0)):
+        delta = deltas[key]
+        if not delta.message_count and not delta.total_cost:
+            continue
+
+        values = {"message_count": F("message_count") + delta.message_count}
+        if delta.total_cost:
+            values["total_cost"] = Coalesce(F("total_cost"), Value(Decimal(0))) + delta.total_cost
+        if delta.last_message_at is not None:
+            values["last_message_at"] = Greatest(
+                Coalesce(F("last_message_at"), Value(delta.last_message_at)),
+                Value(delta.last_message_at),
+            )
+        if _bucket(key).update(**values):
+            continue
+
+        if delta.message_count <= 0:
+            # The message was counted before this bucket existed (e.g. it
+            # predates the rollup); leave it to ``rebuild_daily_usage``.
+            logger.debug("Skipping negative usage delta for missing bucket %s", key)
+            continue
+        try:
+            with transaction.atomic():
+                DailyUserUsage.objects.create(
+                    user_id=key.user_id,
+                    day=key.day,
+                    status=key.status,
+                    provider_id=key.provider_id,
+                    message_count=delta.message_count,
+                    total_cost=delta.total_cost,
+                    last_message_at=delta.last_message_at,
+                )
+        except IntegrityError:
+            # Another worker created the bucket first.
+            _bucket(key).update(**values)
+
+
+def _day_start(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time.min), timezone.get_current_timezone())
+
+
+def aggregate_usage(since: date | None = None) -> dict[BucketKey, UsageDelta]:
+    """Recompute the buckets for messages created on or after ``since``."""
+    messages = Message.objects.all()
+    if since is not None:
+        messages = messages.filter(created_at__gte=_day_start(since))
+    rows = (
+        messages.annotate(day=TruncDate("created_at", tzinfo=timezone.get_current_timezone()))
+        .values("user_id", "day", "status", "provider_id")
+        .annotate(
+            message_count=Count("id"),
+            total_cost=Sum("cost"),
+            last_message_at=Max("created_at"),
+        )
+        .order_by()
+    )
+    return {
+        BucketKey(row["user_id"], row["day"], row["status"], row["provider_id"]): UsageDelta(
+            message_count=row["message_count"],
+            total_cost=row["total_cost"],
+            last_message_at=row["last_message_at"],
+        )
+        for row in rows
+    }
+
+
+def earliest_message_day() -> date | None:
+    first = Message.objects.order_by("created_at").values_list("created_at", flat=True).first()
+    return timezone.localdate(first) if first else None
+
+
+def rebuild_daily_usage(since: date | None = None) -> int:
+    """Replace the buckets from ``since`` onwards with freshly computed ones.
+
+    ``since`` defaults to the day of the oldest remaining message, so usage
+    for archived messages is kept. Returns the number of buckets written.
+    """
+    since = since or earliest_message_day()
+    if since is None:
+        return 0
+    expected = aggregate_usage(since)
+    with transaction.atomic():
+        DailyUserUsage.objects.filter(day__gte=since).delete()
+        DailyUserUsage.objects.bulk_create(
+            [
+                DailyUserUsage(
+                    user_id=key.user_id,
+                    day=key.day,
+                    status=key.status,
+                    provider_id=key.provider_id,
+                    message_count=delta.message_count,
+                    total_cost=delta.total_cost,
+                    last_message_at=delta.last_message_at,
+                )
+                for key, delta in expected.items()
+            ],
+            batch_size=1000,
+        )
+    return len(expected)
+
+
+def find_usage_drift(since: date | None = None) -> dict[BucketKey, tuple[tuple, tuple]]:
+    """Return ``{key: (stored, expected)}`` for buckets that disagree with ``Message``.
+
+    Only counts and costs are compared; ``last_message_at`` is a running
+    maximum and is not lowered when messages leave a bucket.
+    """
+    since = since or earliest_message_day()
+    if since is None:
+        return {}
+    expected = {
+        key: (delta.message_count, delta.total_cost or Decimal(0))
+        for key, delta in aggregate_usage(since).items()
+    }
+    stored = {
+        BucketKey(row.user_id, row.day, row.status, row.provider_id): (
+            row.message_count,
+            row.total_cost or Decimal(0),
+        )
+        for row in DailyUserUsage.objects.filter(day__gte=since)
+        if row.message_count
+    }
+    empty = (0, Decimal(0))
+    return {
+        key: (stored.get(key, empty), expected.get(key, empty))
+        for key in stored.keys() | expected.keys()
+        if stored.get(key, empty) != expected.get(key, empty)
+    }
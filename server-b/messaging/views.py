@@ -3,17 +3,17 @@ from django.utils import dateformat
 from django.views.generic import ListView, DetailView
 from .models import Message
 from .forms import MessageFilterForm
+from .pagination import AFTER_PARAM, BEFORE_PARAM, KeysetPaginationMixin, estimate_count
 import uuid
 
 
-class UserMessageListView(LoginRequiredMixin, ListView):
+class UserMessageListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Message
     template_name = 'messaging/message_list.html'
     context_object_name = 'message_list'
-    paginate_by = 10
 
     def get_queryset(self):
-        queryset = Message.objects.filter(user=self.request.user).order_by('-sent_at')
+        queryset = Message.objects.filter(user=self.request.user)
         tracking_id = self.request.GET.get('tracking_id', '').strip()
         if tracking_id:
             try:
@@ -26,28 +26,19 @@ class UserMessageListView(LoginRequiredMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['tracking_id'] = self.request.GET.get('tracking_id', '').strip()
-        paginator = context.get('paginator')
-        page_obj = context.get('page_obj')
-        if paginator and page_obj:
-            context['page_range'] = paginator.get_elided_page_range(
-                page_obj.number, on_each_side=1, on_ends=1
-            )
-        else:
-            context['page_range'] = []
         return context
 
-class AdminMessageListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+class AdminMessageListView(LoginRequiredMixin, UserPassesTestMixin, KeysetPaginationMixin, ListView):
     model = Message
     template_name = 'messaging/admin_message_list.html'
     context_object_name = 'message_list'
-    paginate_by = 10
 
     def test_func(self):
         return self.request.user.is_staff
 
     def get_queryset(self):
         self.filter_form = MessageFilterForm(self.request.GET or None)
-        queryset = Message.objects.all().order_by('-sent_at')
+        queryset = Message.objects.select_related('user', 'provider')
 
         if self.filter_form.is_valid():
             data = self.filter_form.cleaned_data
@@ -84,9 +75,11 @@ class AdminMessageListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
         context['active_filter_count'] = len(active_filters)
         context['filter_panel_open'] = bool(active_filters or filter_form.errors)
 
+        # Changing a filter restarts from the newest page.
         query_params = self.request.GET.copy()
-        if 'page' in query_params:
-            query_params.pop('page')
+        for param in (AFTER_PARAM, BEFORE_PARAM):
+            if param in query_params:
+                query_params.pop(param)
 
         active_filter_chips = []
 
@@ -158,15 +151,7 @@ class AdminMessageListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
             )
 
         context['active_filter_chips'] = active_filter_chips
-
-        paginator = context.get('paginator')
-        page_obj = context.get('page_obj')
-        if paginator and page_obj:
-            context['page_range'] = paginator.get_elided_page_range(
-                page_obj.number, on_each_side=1, on_ends=1
-            )
-        else:
-            context['page_range'] = []
+        context['result_count'] = estimate_count(self.object_list)
         return context
 
 
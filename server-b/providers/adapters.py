@@ -3,12 +3,33 @@ from datetime import datetime
 from decimal import Decimal, InvalidOperation
 
 import logging
+import threading
+
 import requests
+from requests.adapters import HTTPAdapter
 
 from .models import SmsProvider, ProviderType
 
 logger = logging.getLogger(__name__)
 
+# ``requests.Session`` objects are not safe to share between threads. Each
+# worker thread (or greenlet, once gevent has patched ``threading``) keeps its
+# own session so provider connections stay alive between sends.
+_session_local = threading.local()
+HTTP_POOL_MAXSIZE = 10
+
+
+def get_http_session() -> requests.Session:
+    """Return the keep-alive HTTP session owned by the current thread."""
+    session = getattr(_session_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        http_adapter = HTTPAdapter(pool_maxsize=HTTP_POOL_MAXSIZE)
+        session.mount("http://", http_adapter)
+        session.mount("https://", http_adapter)
+        _session_local.session = session
+    return session
+
 class BaseSmsProvider:
     def __init__(self, provider: SmsProvider):
         self.provider = provider
@@ -49,7 +70,7 @@ class MagfaSmsProvider(BaseSmsProvider):
         }
 
         try:
-            response = requests.post(
+            response = get_http_session().post(
                 self.provider.send_url,
                 headers=headers,
                 auth=auth,
@@ -141,7 +162,7 @@ class MagfaSmsProvider(BaseSmsProvider):
             auth = (username, password)
 
         try:
-            response = requests.get(self.provider.balance_url, headers=headers, auth=auth, timeout=10)
+            response = get_http_session().get(self.provider.balance_url, headers=headers, auth=auth, timeout=10)
             response.raise_for_status()  # Raise an exception for bad status codes
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -176,7 +197,7 @@ class MagfaSmsProvider(BaseSmsProvider):
             logger.debug(f"Requesting status for mid {mid} from URL: {statuses_url}")
             
             try:
-                response = requests.get(
+                response = get_http_session().get(
                     statuses_url,
                     headers=headers,
                     auth=auth,
@@ -0,0 +1,74 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from providers.adapters import MagfaSmsProvider
+from providers.models import AuthType, ProviderType, SmsProvider
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """Return the nearest-rank percentile of already sorted ``samples``."""
+    if not samples:
+        return 0.0
+    index = max(0, min(len(samples) - 1, round(pct / 100 * len(samples)) - 1))
+    return samples[index]
+
+
+class Command(BaseCommand):
+    """Fire concurrent sends at a provider endpoint and report throughput.
+
+    Intended for the mock provider (``tests/mock_provider``); run it inside the
+    same pool the worker uses (e.g. after ``gevent.monkey.patch_all()`` via
+    ``python -m gevent.monkey manage.py ...``) to compare worker profiles.
+    """
+
+    help = "Benchmark concurrent provider sends against a (mock) provider URL."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            default="http://mock-provider-api:8000/send",
+            help="Provider send URL (default: the docker-compose.test.yml mock provider).",
+        )
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--concurrency", type=int, default=200)
+
+    def handle(self, *args, **options):  # pragma: no cover - network I/O
+        total = options["requests"]
+        concurrency = options["concurrency"]
+        provider = SmsProvider(
+            name="benchmark",
+            slug="benchmark",
+            send_url=options["url"],
+            balance_url=options["url"],
+            default_sender="100",
+            auth_type=AuthType.NONE,
+            provider_type=ProviderType.MAGFA,
+        )
+        adapter = MagfaSmsProvider(provider)
+
+        def send_one(index: int) -> tuple[float, bool]:
+            started = time.perf_counter()
+            result = adapter.send_sms(f"0912{index:07d}", "benchmark")
+            return time.perf_counter() - started, result.get("status") == "success"
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(send_one, range(total)))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for latency, _ in results)
+        succeeded = sum(1 for _, ok in results if ok)
+        self.stdout.write(
+            f"requests={total} concurrency={concurrency} succeeded={succeeded} "
+            f"elapsed={elapsed:.2f}s throughput={total / elapsed:.1f}/s"
+        )
+        self.stdout.write(
+            "latency_ms "
+            f"mean={statistics.fmean(latencies) * 1000:.1f} "
+            f"p50={percentile(latencies, 50) * 1000:.1f} "
+            f"p95={percentile(latencies, 95) * 1000:.1f} "
+            f"p99={percentile(latencies, 99) * 1000:.1f}"
+        )
@@ -1,3 +1,4 @@
+import threading
 from datetime import datetime
 
 from django.core.exceptions import ValidationError
@@ -5,7 +6,7 @@ from django.test import TestCase
 from unittest.mock import patch
 import requests
 
-from providers.adapters import MagfaSmsProvider
+from providers.adapters import MagfaSmsProvider, get_http_session
 from providers.models import SmsProvider, AuthType, ProviderType
 
 
@@ -46,6 +47,19 @@ class SmsProviderModelTests(TestCase):
         self.assertEqual(str(provider), "Provider")
 
 
+class HttpSessionTests(TestCase):
+    def test_session_is_reused_within_a_thread(self):
+        self.assertIs(get_http_session(), get_http_session())
+
+    def test_each_thread_gets_its_own_session(self):
+        sessions = []
+        worker = threading.Thread(target=lambda: sessions.append(get_http_session()))
+        worker.start()
+        worker.join()
+
+        self.assertIsNot(sessions[0], get_http_session())
+
+
 class MagfaSmsProviderAdapterTests(TestCase):
     def setUp(self):
         self.provider = SmsProvider.objects.create(
@@ -62,7 +76,7 @@ class MagfaSmsProviderAdapterTests(TestCase):
     def test_supports_status_check_true(self):
         self.assertTrue(self.adapter.supports_status_check)
 
-    @patch("providers.adapters.requests.post")
+    @patch("providers.adapters.requests.Session.post")
     def test_success(self, mock_post):
         mock_post.return_value.raise_for_status.return_value = None
         mock_post.return_value.json.return_value = {
@@ -75,7 +89,7 @@ class MagfaSmsProviderAdapterTests(TestCase):
         self.assertEqual(result["message_id"], "1")
         self.assertEqual(result["cost"], 500)
 
-    @patch("providers.adapters.requests.post")
+    @patch("providers.adapters.requests.Session.post")
     def test_cost_invalid_or_missing(self, mock_post):
         mock_post.return_value.raise_for_status.return_value = None
         mock_post.return_value.json.return_value = {
@@ -87,7 +101,7 @@ class MagfaSmsProviderAdapterTests(TestCase):
         self.assertEqual(result["status"], "success")
         self.assertIsNone(result["cost"])
 
-    @patch("providers.adapters.requests.get")
+    @patch("providers.adapters.requests.Session.get")
     def test_check_status_success(self, mock_get):
         mock_get.return_value.raise_for_status.return_value = None
         mock_get.return_value.json.return_value = {
@@ -114,7 +128,7 @@ class MagfaSmsProviderAdapterTests(TestCase):
         self.assertEqual(args[0], "http://example.com/statuses/1,2,3")
         self.assertIn("timeout", kwargs)
 
-    @patch("providers.adapters.requests.post")
+    @patch("providers.adapters.requests.Session.post")
     def test_permanent_failure(self, mock_post):
         mock_post.return_value.raise_for_status.return_value = None
         mock_post.return_value.json.return_value = {"status": 27}
@@ -124,7 +138,7 @@ class MagfaSmsProviderAdapterTests(TestCase):
         self.assertEqual(result["type"], "permanent")
         self.assertIn("27", result["reason"])
 
-    @patch("providers.adapters.requests.post")
+    @patch("providers.adapters.requests.Session.post")
     def test_transient_failure(self, mock_post):
         mock_post.return_value.raise_for_status.return_value = None
         mock_post.return_value.json.return_value = {"status": 15}
@@ -132,7 +146,7 @@ class MagfaSmsProviderAdapterTests(TestCase):
         result = self.adapter.send_sms("123", "hi")
         self.assertEqual(result["type"], "transient")
 
-    @patch("providers.adapters.requests.post", side_effect=requests.exceptions.Timeout())
+    @patch("providers.adapters.requests.Session.post", side_effect=requests.exceptions.Timeout())
     def test_timeout(self, mock_post):
         result = self.adapter.send_sms("123", "hi")
         self.assertEqual(result["status"], "failure")
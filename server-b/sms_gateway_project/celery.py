@@ -1,10 +1,50 @@
 import os
+import sys
+
 from celery import Celery
+from celery.signals import worker_process_shutdown
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sms_gateway_project.settings')
 
+
+def _make_psycopg_cooperative() -> None:
+    """Let psycopg2 yield to other greenlets when the worker runs ``-P gevent``.
+
+    Celery monkey-patches the standard library before this module is imported,
+    but psycopg2 is a C extension and would otherwise block the whole hub on
+    every query.
+    """
+    if 'gevent' not in sys.modules:
+        return
+
+    from gevent import monkey
+
+    if not monkey.is_module_patched('socket'):
+        return
+
+    from psycogreen.gevent import patch_psycopg
+
+    patch_psycopg()
+
+
+_make_psycopg_cooperative()
+
 app = Celery('sms_gateway_project')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 
+@worker_process_shutdown.connect
+def _mark_metrics_process_dead(pid=None, **kwargs):
+    """Drop live gauge samples of prefork children that exit and archive the rest."""
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if not path:
+        return
+
+    from prometheus_client import multiprocess
+
+    from sms_gateway_project.multiprocess_metrics import archive_process
+
+    pid = pid or os.getpid()
+    multiprocess.mark_process_dead(pid)
+    archive_process(path, pid)
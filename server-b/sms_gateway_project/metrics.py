@@ -5,16 +5,11 @@ from __future__ import annotations
 import os
 from typing import Final
 
+from django.conf import settings
 from django.http import HttpRequest, HttpResponse, HttpResponseServerError
-from prometheus_client import (
-    CONTENT_TYPE_LATEST,
-    CollectorRegistry,
-    Counter,
-    Gauge,
-    Histogram,
-    generate_latest,
-    multiprocess,
-)
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram
+
+from sms_gateway_project.multiprocess_metrics import scrape
 
 # ---------------------------------------------------------------------------
 # Shared metrics definitions
@@ -87,6 +82,13 @@ SMS_DLQ_MESSAGES_TOTAL: Final[Counter] = Counter(
 )
 
 
+SMS_ATTEMPT_LOGS_DROPPED_TOTAL: Final[Counter] = Counter(
+    "sms_attempt_logs_dropped_total",
+    "Provider attempt logs dropped instead of written, by reason.",
+    labelnames=("reason",),
+)
+
+
 EXPECTED_CONFIG_FINGERPRINT_SERVICE_LABEL_VALUE: Final[str] = "sms-gateway-server-b"
 
 EXPECTED_CONFIG_FINGERPRINT: Final[Gauge] = Gauge(
@@ -97,6 +99,28 @@ EXPECTED_CONFIG_FINGERPRINT: Final[Gauge] = Gauge(
 )
 
 
+SERVER_A_HEARTBEAT_AGE_SECONDS: Final[Gauge] = Gauge(
+    "sms_server_a_heartbeat_age_seconds",
+    "Seconds since the last heartbeat of each Server A instance.",
+    labelnames=("instance",),
+    multiprocess_mode="max",
+)
+
+
+SERVER_A_CONFIG_FINGERPRINT_MATCH: Final[Gauge] = Gauge(
+    "sms_server_a_config_fingerprint_match",
+    "1 when a Server A instance reports the expected configuration fingerprint, else 0.",
+    labelnames=("instance",),
+    multiprocess_mode="max",
+)
+
+
+SERVER_A_CONFIG_RESYNCS_TOTAL: Final[Counter] = Counter(
+    "sms_server_a_config_resyncs_total",
+    "Targeted configuration resyncs sent to drifting Server A instances.",
+)
+
+
 # ---------------------------------------------------------------------------
 # HTTP endpoint
 # ---------------------------------------------------------------------------
@@ -115,8 +139,6 @@ def metrics_view(request: HttpRequest) -> HttpResponse:
             f"Configured PROMETHEUS_MULTIPROC_DIR '{multiproc_dir}' does not exist."
         )
 
-    registry = CollectorRegistry()
-    multiprocess.MultiProcessCollector(registry)
-    payload = generate_latest(registry)
+    payload = scrape(multiproc_dir, settings.METRICS_CACHE_TTL_SECONDS)
     return HttpResponse(payload, content_type=CONTENT_TYPE_LATEST)
 
@@ -0,0 +1,165 @@
+"""Scraping and compaction of the per-process files in ``PROMETHEUS_MULTIPROC_DIR``.
+
+Every process that touches a metric writes its own ``<kind>_<pid>.db`` file
+and ``MultiProcessCollector`` reads all of them on each scrape. Files of
+exited processes are never removed, so each restart of a Celery child or a
+Gunicorn worker makes scrapes slower.
+
+``archive_process`` folds the files of an exited process into one
+``<kind>_archive.db`` file per kind, merged the way the collector would merge
+them, so totals are unchanged. It runs from the process-exit hooks
+(``sms_gateway_project.celery`` and ``gunicorn.conf.py``) rather than from a
+PID liveness check, because the directory is shared by containers that do not
+share a PID namespace.
+
+``scrape`` caches the rendered payload for a few seconds so that concurrent
+or back-to-back scrapes do not each read every file.
+
+Both take ``fcntl`` locks on a file in the directory: compaction holds it
+exclusively, and collection holds it shared. A scrape therefore never sees a
+sample both in a process file and in the archive.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import glob
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from prometheus_client import CollectorRegistry, generate_latest, multiprocess
+from prometheus_client.mmap_dict import MmapedDict
+
+# Stands in for the pid in archive file names; shows up as ``pid="archive"``
+# only on ``multiprocess_mode="all"`` gauges, which are not archived.
+ARCHIVE_ID = "archive"
+LOCK_FILE = ".compaction.lock"
+
+Sample = Tuple[float, float]  # (value, timestamp)
+
+
+def _add(current: Sample, new: Sample) -> Sample:
+    return current[0] + new[0], max(current[1], new[1])
+
+
+def _max(current: Sample, new: Sample) -> Sample:
+    return new if new[0] > current[0] else current
+
+
+def _min(current: Sample, new: Sample) -> Sample:
+    return new if new[0] < current[0] else current
+
+
+def _most_recent(current: Sample, new: Sample) -> Sample:
+    return new if new[1] > current[1] else current
+
+
+# How samples of two files of the same kind combine, matching
+# ``MultiProcessCollector._accumulate_metrics``. Histogram files hold
+# per-bucket (not cumulative) counts, so they add up like counters. ``all``
+# gauges keep one series per pid and ``live*`` gauges are dropped when their
+# process exits, so neither is archived.
+_MERGERS: Dict[str, Callable[[Sample, Sample], Sample]] = {
+    "counter": _add,
+    "histogram": _add,
+    "summary": _add,
+    "gauge_sum": _add,
+    "gauge_max": _max,
+    "gauge_min": _min,
+    "gauge_mostrecent": _most_recent,
+}
+
+
+@contextmanager
+def _locked(path: str, exclusive: bool) -> Iterator[None]:
+    with open(os.path.join(path, LOCK_FILE), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _read(filename: str) -> Dict[str, Sample]:
+    return {
+        key: (value, timestamp)
+        for key, value, timestamp, _ in MmapedDict.read_all_values_from_file(filename)
+    }
+
+
+def _write(filename: str, samples: Dict[str, Sample]) -> None:
+    """Replace ``filename`` with ``samples`` without exposing a partial file."""
+    # No ``.db`` suffix, so a concurrent glob never picks it up.
+    partial = f"{filename}.partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+    values = MmapedDict(partial)
+    try:
+        for key, (value, timestamp) in samples.items():
+            values.write_value(key, value, timestamp)
+    finally:
+        values.close()
+    os.replace(partial, filename)
+
+
+def archive_process(path: str, pid: int | str) -> int:
+    """Merge the metric files of exited process ``pid`` into the archive.
+
+    Returns the number of process files removed. Files of ``live*`` gauges
+    are deleted without merging; ``all`` gauges are left in place.
+    """
+    suffix = f"_{pid}.db"
+    removed = 0
+    with _locked(path, exclusive=True):
+        for filename in glob.glob(os.path.join(path, f"*{suffix}")):
+            kind = os.path.basename(filename)[: -len(suffix)]
+            merge = _MERGERS.get(kind)
+            if merge is None:
+                if kind.startswith("gauge_live"):
+                    os.remove(filename)
+                    removed += 1
+                continue
+            archive = os.path.join(path, f"{kind}_{ARCHIVE_ID}.db")
+            samples = _read(archive) if os.path.exists(archive) else {}
+            for key, sample in _read(filename).items():
+                current = samples.get(key)
+                samples[key] = sample if current is None else merge(current, sample)
+            _write(archive, samples)
+            os.remove(filename)
+            removed += 1
+    return removed
+
+
+def collect(path: str) -> bytes:
+    """Render the metrics of every process file under ``path``."""
+    with _locked(path, exclusive=False):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=path)
+        return generate_latest(registry)
+
+
+class _CachedPayload:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.path: Optional[str] = None
+        self.payload = b""
+        self.expires_at = 0.0
+
+
+_cached = _CachedPayload()
+
+
+def scrape(path: str, ttl: float) -> bytes:
+    """Return ``collect(path)``, reusing a payload rendered less than ``ttl`` seconds ago."""
+    if ttl <= 0:
+        return collect(path)
+    with _cached.lock:
+        now = time.monotonic()
+        if _cached.path != path or now >= _cached.expires_at:
+            _cached.payload = collect(path)
+            _cached.path = path
+            _cached.expires_at = time.monotonic() + ttl
+        return _cached.payload
@@ -88,9 +88,15 @@ WSGI_APPLICATION = 'sms_gateway_project.wsgi.application'
 
 # Default to a local SQLite database if no DATABASE_URL environment variable is
 # supplied. This allows the test suite to run without additional configuration.
+#
+# DATABASE_CONN_MAX_AGE keeps connections open between requests/tasks. Leave it
+# at 0 for the gevent/threads worker profile, where every greenlet holds its own
+# connection, and put PgBouncer (transaction pooling) in front of PostgreSQL.
 DATABASES = {
     'default': dj_database_url.config(
-        default=f'sqlite:///{BASE_DIR / "db.sqlite3"}'
+        default=f'sqlite:///{BASE_DIR / "db.sqlite3"}',
+        conn_max_age=int(os.environ.get('DATABASE_CONN_MAX_AGE', '0')),
+        conn_health_checks=os.environ.get('DATABASE_CONN_HEALTH_CHECKS', 'True').lower() in ('true', '1', 't'),
     )
 }
 
@@ -159,6 +165,19 @@ RABBITMQ_PASS = os.environ.get('RABBITMQ_PASS', 'guest')
 
 RABBITMQ_VHOST = os.environ.get('RABBITMQ_VHOST', '/')
 RABBITMQ_SMS_QUEUE = os.environ.get('RABBITMQ_SMS_QUEUE', 'sms_outbound_queue')
+RABBITMQ_SMS_HIGH_PRIORITY_QUEUE = os.environ.get(
+    'RABBITMQ_SMS_HIGH_PRIORITY_QUEUE', 'sms_outbound_high_queue'
+)
+RABBITMQ_SMS_LOW_PRIORITY_QUEUE = os.environ.get(
+    'RABBITMQ_SMS_LOW_PRIORITY_QUEUE', 'sms_outbound_low_queue'
+)
+# Per-lane consumer prefetch: keep the OTP lane latency-oriented and let the
+# bulk lane trade latency for throughput.
+RABBITMQ_SMS_PREFETCH_COUNTS = {
+    'high': int(os.environ.get('RABBITMQ_SMS_HIGH_PRIORITY_PREFETCH', '1')),
+    'normal': int(os.environ.get('RABBITMQ_SMS_PREFETCH', '1')),
+    'low': int(os.environ.get('RABBITMQ_SMS_LOW_PRIORITY_PREFETCH', '20')),
+}
 RABBITMQ_SMS_DLQ_USER_NOT_FOUND = os.environ.get(
     'RABBITMQ_SMS_DLQ_USER_NOT_FOUND', 'sms_dlq_user_not_found'
 )
@@ -171,7 +190,37 @@ RABBITMQ_SMS_RETRY_WAIT_TTL_MS = int(
 
 CONFIG_EVENTS_EXCHANGE = os.environ.get('CONFIG_EVENTS_EXCHANGE', 'config_events_exchange')
 CONFIG_STATE_EXCHANGE = os.environ.get('CONFIG_STATE_EXCHANGE', 'config_state_exchange')
+# Direct exchange for snapshots sent to a single Server A instance (routing key:
+# the instance id from its heartbeats).
+CONFIG_STATE_DIRECT_EXCHANGE = os.environ.get('CONFIG_STATE_DIRECT_EXCHANGE', 'config_state_direct_exchange')
 CONFIG_STATE_SYNC_ENABLED = os.environ.get('CONFIG_STATE_SYNC_ENABLED', 'True').lower() in ('true', '1', 't')
+# Configuration changes are broadcast to Server A as versioned deltas every
+# CONFIG_STATE_DELTA_INTERVAL_SECONDS. The state fingerprint is checked every
+# CONFIG_STATE_SNAPSHOT_INTERVAL_SECONDS and only published as a checkpoint
+# when it changed, every CONFIG_STATE_KEEPALIVE_SECONDS, or on resync requests
+# (see core.config_state).
+CONFIG_STATE_DELTA_INTERVAL_SECONDS = float(os.environ.get('CONFIG_STATE_DELTA_INTERVAL_SECONDS', '2'))
+CONFIG_STATE_SNAPSHOT_INTERVAL_SECONDS = int(os.environ.get('CONFIG_STATE_SNAPSHOT_INTERVAL_SECONDS', '60'))
+CONFIG_STATE_KEEPALIVE_SECONDS = int(os.environ.get('CONFIG_STATE_KEEPALIVE_SECONDS', '900'))
+CONFIG_STATE_RESYNC_QUEUE = os.environ.get('CONFIG_STATE_RESYNC_QUEUE', 'config_state_resync_queue')
+CONFIG_STATE_RESYNC_POLL_SECONDS = float(os.environ.get('CONFIG_STATE_RESYNC_POLL_SECONDS', '10'))
+# Server A heartbeats, consumed by `manage.py consume_heartbeats` (see
+# core.fleet). An instance is stale after HEARTBEAT_STALE_AFTER_SECONDS without
+# a heartbeat and forgotten after HEARTBEAT_FORGET_AFTER_SECONDS. One that
+# reports another configuration fingerprint for CONFIG_DRIFT_GRACE_SECONDS is
+# sent a snapshot of its own, at most once per CONFIG_DRIFT_RESYNC_COOLDOWN_SECONDS.
+RABBITMQ_HEARTBEAT_EXCHANGE = os.environ.get('RABBITMQ_HEARTBEAT_EXCHANGE', 'sms_gateway_heartbeat_exchange')
+RABBITMQ_HEARTBEAT_QUEUE = os.environ.get('RABBITMQ_HEARTBEAT_QUEUE', 'sms_heartbeat_queue')
+HEARTBEAT_BATCH_SIZE = int(os.environ.get('HEARTBEAT_BATCH_SIZE', '100'))
+HEARTBEAT_STALE_AFTER_SECONDS = float(os.environ.get('HEARTBEAT_STALE_AFTER_SECONDS', '180'))
+HEARTBEAT_FORGET_AFTER_SECONDS = float(os.environ.get('HEARTBEAT_FORGET_AFTER_SECONDS', '3600'))
+CONFIG_DRIFT_GRACE_SECONDS = float(os.environ.get('CONFIG_DRIFT_GRACE_SECONDS', '120'))
+CONFIG_DRIFT_RESYNC_COOLDOWN_SECONDS = float(os.environ.get('CONFIG_DRIFT_RESYNC_COOLDOWN_SECONDS', '600'))
+# /metrics reuses its rendered payload for this many seconds (0 renders on
+# every scrape); see sms_gateway_project.multiprocess_metrics.
+METRICS_CACHE_TTL_SECONDS = float(os.environ.get('METRICS_CACHE_TTL_SECONDS', '5'))
+# Key for the API key hashes sent to Server A; must match its API_KEY_HASH_SECRET.
+API_KEY_HASH_SECRET = os.environ.get('API_KEY_HASH_SECRET', '')
 
 # Ensure the vhost starts with a /
 vhost_path = RABBITMQ_VHOST if RABBITMQ_VHOST.startswith('/') else f'/{RABBITMQ_VHOST}'
@@ -184,10 +233,44 @@ CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'rpc://')
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 CELERY_RESULT_BACKEND = None
 CELERY_IGNORE_RESULT = True
+# Enable per-task priorities on the Celery queue so high priority messages are
+# picked up ahead of bulk traffic (see messaging.models.MessagePriority).
+# RabbitMQ refuses to redeclare an existing queue with x-max-priority
+# (PRECONDITION_FAILED), so tasks go to a new queue instead of Celery's
+# "celery"; docs/WORKER_PROFILES.md describes draining the old one.
+CELERY_TASK_DEFAULT_QUEUE = os.environ.get('CELERY_TASK_DEFAULT_QUEUE', 'sms_tasks')
+CELERY_TASK_QUEUE_MAX_PRIORITY = 10
+CELERY_TASK_DEFAULT_PRIORITY = 5
+# Priorities only order tasks still in the queue. Each process/greenlet
+# reserves one task at a time (the default multiplier of 4 would let a
+# gevent worker at concurrency 200 hold 800 tasks, and later high-priority
+# tasks would wait behind them). With acks_late a task is acknowledged when
+# it finishes, so the broker never hands out more than can run now.
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.environ.get('CELERY_WORKER_PREFETCH_MULTIPLIER', '1'))
+CELERY_TASK_ACKS_LATE = True
+# Provider attempt logs are audit data: each worker process buffers them and
+# inserts them with bulk_create once the batch is full or the oldest row has
+# waited for the flush interval (see messaging.attempt_logs).
+ATTEMPT_LOG_BATCH_SIZE = int(os.environ.get('ATTEMPT_LOG_BATCH_SIZE', '200'))
+ATTEMPT_LOG_FLUSH_INTERVAL_SECONDS = float(
+    os.environ.get('ATTEMPT_LOG_FLUSH_INTERVAL_SECONDS', '2')
+)
+# Rows kept while the database is unreachable; beyond this the oldest are dropped.
+ATTEMPT_LOG_MAX_PENDING = int(os.environ.get('ATTEMPT_LOG_MAX_PENDING', '10000'))
 CELERY_IMPORTS = (
     'core.state_broadcaster',
     'user_management.tasks',
 )
+# Message retention and partition maintenance (see docs/PARTITIONING.md).
+# Hot-path queries (dispatch, status polling) only look at messages created in
+# the last MESSAGE_ACTIVE_WINDOW_DAYS so old partitions are pruned; older pending
+# messages are marked FAILED by the dispatcher.
+MESSAGE_ACTIVE_WINDOW_DAYS = int(os.environ.get('MESSAGE_ACTIVE_WINDOW_DAYS', '7'))
+# 0 keeps messages forever; otherwise older data is archived to MESSAGE_ARCHIVE_DIR.
+MESSAGE_RETENTION_DAYS = int(os.environ.get('MESSAGE_RETENTION_DAYS', '0'))
+MESSAGE_ARCHIVE_DIR = os.environ.get('MESSAGE_ARCHIVE_DIR', str(BASE_DIR / 'archive'))
+MESSAGE_PARTITION_MONTHS_AHEAD = int(os.environ.get('MESSAGE_PARTITION_MONTHS_AHEAD', '2'))
+
 CELERY_BEAT_SCHEDULE = {
     'dispatch-pending-messages': {
         'task': 'messaging.tasks.dispatch_pending_messages',
@@ -197,21 +280,35 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'providers.tasks.update_provider_balance_metrics',
         'schedule': timedelta(minutes=15),
     },
-    'update-expected-config-fingerprint': {
-        'task': 'user_management.tasks.update_expected_config_fingerprint_metric',
-        'schedule': timedelta(seconds=60),
-    },
     'update-delivery-statuses': {
         'task': 'messaging.tasks.update_delivery_statuses',
         'schedule': timedelta(minutes=5),
     },
+    'maintain-message-partitions': {
+        'task': 'messaging.tasks.maintain_message_partitions',
+        'schedule': timedelta(hours=24),
+    },
 
 }
 
 
 if CONFIG_STATE_SYNC_ENABLED:
+    # publish_full_state also keeps the expected fingerprint gauge current.
     CELERY_BEAT_SCHEDULE['publish-full-state'] = {
         'task': 'core.state_broadcaster.publish_full_state',
+        'schedule': timedelta(seconds=CONFIG_STATE_SNAPSHOT_INTERVAL_SECONDS),
+    }
+    CELERY_BEAT_SCHEDULE['publish-config-deltas'] = {
+        'task': 'core.state_broadcaster.publish_config_deltas',
+        'schedule': timedelta(seconds=CONFIG_STATE_DELTA_INTERVAL_SECONDS),
+    }
+    CELERY_BEAT_SCHEDULE['process-config-resync-requests'] = {
+        'task': 'core.state_broadcaster.process_config_resync_requests',
+        'schedule': timedelta(seconds=CONFIG_STATE_RESYNC_POLL_SECONDS),
+    }
+else:
+    CELERY_BEAT_SCHEDULE['update-expected-config-fingerprint'] = {
+        'task': 'user_management.tasks.update_expected_config_fingerprint_metric',
         'schedule': timedelta(seconds=60),
     }
 
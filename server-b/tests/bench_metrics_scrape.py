@@ -0,0 +1,93 @@
+"""Measure /metrics scrape latency against the number of process files.
+
+Fills a temporary PROMETHEUS_MULTIPROC_DIR with the files of ``N`` exited
+processes and times a full collection, the same after archiving them, and a
+cached scrape. Not collected by the test runners; run from ``server-b``::
+
+    python tests/bench_metrics_scrape.py --processes 10 100 1000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+TEST_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if TEST_ROOT not in sys.path:
+    sys.path.insert(0, TEST_ROOT)
+
+from prometheus_client.mmap_dict import MmapedDict, mmap_key  # noqa: E402
+
+from sms_gateway_project.multiprocess_metrics import archive_process, collect, scrape  # noqa: E402
+
+PROVIDERS = ("magfa", "kavenegar", "smsir")
+BUCKETS = ("0.005", "0.01", "0.025", "0.05", "0.075", "0.1", "0.25", "0.5", "0.75", "1.0", "2.5", "5.0", "7.5", "10.0", "+Inf")
+
+
+def write_process_files(path: str, pid: int) -> None:
+    """Write what a Celery child that sent a few messages leaves behind."""
+    counters = MmapedDict(os.path.join(path, f"counter_{pid}.db"))
+    histograms = MmapedDict(os.path.join(path, f"histogram_{pid}.db"))
+    gauges = MmapedDict(os.path.join(path, f"gauge_max_{pid}.db"))
+    try:
+        for provider in PROVIDERS:
+            for outcome in ("success", "failure"):
+                key = mmap_key(
+                    "sms_provider_send_attempts", "sms_provider_send_attempts_total",
+                    ["provider", "outcome"], [provider, outcome], "Provider send attempts.",
+                )
+                counters.write_value(key, float(pid % 7), 0.0)
+            for le in BUCKETS:
+                key = mmap_key(
+                    "sms_provider_send_latency_seconds", "sms_provider_send_latency_seconds_bucket",
+                    ["provider", "le"], [provider, le], "Provider send latency.",
+                )
+                histograms.write_value(key, 1.0, 0.0)
+            key = mmap_key(
+                "sms_provider_balance_gauge", "sms_provider_balance_gauge",
+                ["provider"], [provider], "Provider balance.",
+            )
+            gauges.write_value(key, float(pid), time.time())
+    finally:
+        for values in (counters, histograms, gauges):
+            values.close()
+
+
+def timed(func, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--ttl", type=float, default=5.0)
+    args = parser.parse_args()
+
+    for count in args.processes:
+        with tempfile.TemporaryDirectory() as path:
+            for pid in range(1, count + 1):
+                write_process_files(path, pid)
+            uncompacted = timed(lambda: collect(path))
+            started = time.perf_counter()
+            for pid in range(1, count + 1):
+                archive_process(path, pid)
+            compaction = time.perf_counter() - started
+            compacted = timed(lambda: collect(path))
+            scrape(path, args.ttl)
+            cached = timed(lambda: scrape(path, args.ttl))
+        print(
+            f"processes={count} files={count * 3} "
+            f"collect={uncompacted * 1e3:.1f}ms "
+            f"compaction={compaction * 1e3:.1f}ms "
+            f"collect_compacted={compacted * 1e3:.2f}ms "
+            f"cached_scrape={cached * 1e6:.1f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -59,6 +59,53 @@ def set_task_globals(task, monkeypatch, **overrides):
         monkeypatch.setitem(globals_dict, name, value)
 
 
+class DummyAtomic:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+def disable_usage_tracking(task, monkeypatch):
+    """Skip the ``DailyUserUsage`` bookkeeping, which needs a real database."""
+    set_task_globals(
+        task,
+        monkeypatch,
+        usage_state=lambda message: None,
+        record_usage_change=lambda message, previous=None: None,
+        record_usage_changes=lambda changes: None,
+        transaction=SimpleNamespace(atomic=DummyAtomic),
+    )
+
+
+class DummyMessageManager:
+    """Stand-in for ``Message.objects`` that records coalesced updates."""
+
+    def __init__(self, message):
+        self._message = message
+        self.updates = []
+
+    def get(self, pk):
+        return self._message
+
+    def filter(self, **kwargs):
+        return self
+
+    def update(self, **values):
+        self.updates.append(values)
+        return 1
+
+
+def make_attempt_log_model():
+    """Return a ``MessageAttemptLog`` stand-in that only holds its fields."""
+
+    class DummyAttemptLog(SimpleNamespace):
+        pass
+
+    return DummyAttemptLog
+
+
 def import_messaging_tasks(monkeypatch):
     module_name = "messaging.tasks"
     monkeypatch.setenv("DJANGO_SETTINGS_MODULE", "sms_gateway_project.settings")
@@ -80,6 +127,7 @@ def import_messaging_tasks(monkeypatch):
 
 def test_update_delivery_statuses_updates_recent_messages(monkeypatch):
     module = import_messaging_tasks(monkeypatch)
+    disable_usage_tracking(module.update_delivery_statuses, monkeypatch)
 
     module.SMS_MESSAGE_FINAL_STATUS_TOTAL.clear()
     reset_histogram(module.SMS_PROCESSING_DURATION_SECONDS)
@@ -139,6 +187,12 @@ def test_update_delivery_statuses_updates_recent_messages(monkeypatch):
                     data = [item for item in data if item.status == value]
                 elif key == "updated_at__gte":
                     data = [item for item in data if item.updated_at >= value]
+                elif key == "created_at__gte":
+                    data = [item for item in data if item.created_at >= value]
+                elif key == "provider_message_id__gt":
+                    data = [
+                        item for item in data if (item.provider_message_id or "") > value
+                    ]
                 elif key == "provider__isnull":
                     if value:
                         data = [item for item in data if item.provider is None]
@@ -173,6 +227,9 @@ def test_update_delivery_statuses_updates_recent_messages(monkeypatch):
         def select_related(self, *args, **kwargs):
             return DummyQuerySet(self._data)
 
+        def filter(self, **kwargs):
+            return DummyQuerySet(self._data).filter(**kwargs)
+
     captured_ids = []
 
     class DummyAdapter:
@@ -324,6 +381,7 @@ def test_publish_to_dlq_uses_configured_virtual_host(monkeypatch):
 
 def test_send_sms_with_failover_records_success_metrics(monkeypatch):
     module = import_messaging_tasks(monkeypatch)
+    disable_usage_tracking(module.send_sms_with_failover, monkeypatch)
 
     module.SMS_PROVIDER_SEND_ATTEMPTS_TOTAL.clear()
     reset_histogram(module.SMS_PROVIDER_SEND_LATENCY_SECONDS)
@@ -360,16 +418,14 @@ def test_send_sms_with_failover_records_success_metrics(monkeypatch):
     monkeypatch.setattr(
         module,
         "Message",
-        SimpleNamespace(objects=SimpleNamespace(get=lambda pk: message)),
+        SimpleNamespace(objects=DummyMessageManager(message)),
     )
 
     attempt_logs = []
     monkeypatch.setattr(
         module,
         "MessageAttemptLog",
-        SimpleNamespace(
-            objects=SimpleNamespace(create=lambda **kwargs: attempt_logs.append(kwargs))
-        ),
+        make_attempt_log_model(),
     )
 
     class DummyProvider:
@@ -442,6 +498,7 @@ def test_send_sms_with_failover_records_success_metrics(monkeypatch):
         get_provider_adapter=module.get_provider_adapter,
         publish_to_dlq=module.publish_to_dlq,
         timezone=module.timezone,
+        attempt_log_buffer=SimpleNamespace(add=attempt_logs.extend),
     )
 
     module.send_sms_with_failover.run(message.id)
@@ -451,6 +508,12 @@ def test_send_sms_with_failover_records_success_metrics(monkeypatch):
     assert message.send_attempts == 1
     assert message.sent_at == fake_now
     assert send_calls == [(message.recipient, message.text)]
+    updates = module.Message.objects.updates
+    assert len(updates) == 1
+    assert updates[0]["status"] == module.MessageStatus.SENT_TO_PROVIDER
+    assert updates[0]["provider_message_id"] == "mid-1"
+    assert len(attempt_logs) == 1
+    assert attempt_logs[0].timestamp == fake_now
 
     success_label = module.MessageStatus.SENT_TO_PROVIDER
     assert (
@@ -495,6 +558,7 @@ def test_send_sms_with_failover_records_success_metrics(monkeypatch):
 
 def test_send_sms_with_failover_records_failover_metric(monkeypatch):
     module = import_messaging_tasks(monkeypatch)
+    disable_usage_tracking(module.send_sms_with_failover, monkeypatch)
 
     module.SMS_PROVIDER_SEND_ATTEMPTS_TOTAL.clear()
     reset_histogram(module.SMS_PROVIDER_SEND_LATENCY_SECONDS)
@@ -531,16 +595,14 @@ def test_send_sms_with_failover_records_failover_metric(monkeypatch):
     monkeypatch.setattr(
         module,
         "Message",
-        SimpleNamespace(objects=SimpleNamespace(get=lambda pk: message)),
+        SimpleNamespace(objects=DummyMessageManager(message)),
     )
 
     attempt_logs = []
     monkeypatch.setattr(
         module,
         "MessageAttemptLog",
-        SimpleNamespace(
-            objects=SimpleNamespace(create=lambda **kwargs: attempt_logs.append(kwargs))
-        ),
+        make_attempt_log_model(),
     )
 
     class DummyProvider:
@@ -624,6 +686,7 @@ def test_send_sms_with_failover_records_failover_metric(monkeypatch):
         get_provider_adapter=module.get_provider_adapter,
         publish_to_dlq=module.publish_to_dlq,
         timezone=module.timezone,
+        attempt_log_buffer=SimpleNamespace(add=attempt_logs.extend),
     )
 
     module.send_sms_with_failover.run(message.id)
@@ -676,6 +739,7 @@ def test_send_sms_with_failover_records_failover_metric(monkeypatch):
 
 def test_send_sms_with_failover_transient_failure_increments_retry_metric(monkeypatch):
     module = import_messaging_tasks(monkeypatch)
+    disable_usage_tracking(module.send_sms_with_failover, monkeypatch)
 
     module.SMS_PROVIDER_SEND_ATTEMPTS_TOTAL.clear()
     reset_histogram(module.SMS_PROVIDER_SEND_LATENCY_SECONDS)
@@ -707,13 +771,13 @@ def test_send_sms_with_failover_transient_failure_increments_retry_metric(monkey
     monkeypatch.setattr(
         module,
         "Message",
-        SimpleNamespace(objects=SimpleNamespace(get=lambda pk: message)),
+        SimpleNamespace(objects=DummyMessageManager(message)),
     )
 
     monkeypatch.setattr(
         module,
         "MessageAttemptLog",
-        SimpleNamespace(objects=SimpleNamespace(create=lambda **kwargs: None)),
+        make_attempt_log_model(),
     )
 
     class DummyProvider:
@@ -775,6 +839,7 @@ def test_send_sms_with_failover_transient_failure_increments_retry_metric(monkey
         get_provider_adapter=module.get_provider_adapter,
         publish_to_dlq=module.publish_to_dlq,
         timezone=module.timezone,
+        attempt_log_buffer=SimpleNamespace(add=lambda logs: None),
     )
 
     with pytest.raises(RuntimeError):
@@ -806,6 +871,8 @@ def test_send_sms_with_failover_transient_failure_increments_retry_metric(monkey
 
 def test_dispatch_pending_messages_updates_pending_gauge(monkeypatch):
     module = import_messaging_tasks(monkeypatch)
+    disable_usage_tracking(module.dispatch_pending_messages, monkeypatch)
+    from messaging.models import MessagePriority
 
     module.SMS_MESSAGES_PENDING_GAUGE.set(0)
 
@@ -813,6 +880,7 @@ def test_dispatch_pending_messages_updates_pending_gauge(monkeypatch):
         def __init__(self, mid, status):
             self.id = mid
             self.status = status
+            self.priority = MessagePriority.NORMAL
 
     pending_status = module.MessageStatus.PENDING
     processing_status = module.MessageStatus.PROCESSING
@@ -837,6 +905,9 @@ def test_dispatch_pending_messages_updates_pending_gauge(monkeypatch):
                 data = [m for m in data if m.id in ids]
             return DummyQuerySet(data)
 
+        def order_by(self, *fields):
+            return self
+
         def update(self, **kwargs):
             for obj in self._data:
                 for key, value in kwargs.items():
@@ -868,31 +939,25 @@ def test_dispatch_pending_messages_updates_pending_gauge(monkeypatch):
         SimpleNamespace(objects=DummyManager(messages)),
     )
 
-    class DummyAtomic:
-        def __enter__(self):
-            return self
-
-        def __exit__(self, exc_type, exc, tb):
-            return False
-
-    monkeypatch.setattr(module.transaction, "atomic", lambda: DummyAtomic())
-
     dispatched = []
     monkeypatch.setattr(
-        module.send_sms_with_failover, "delay", lambda mid: dispatched.append(mid)
+        module.send_sms_with_failover,
+        "apply_async",
+        lambda args, priority: dispatched.append((args[0], priority)),
     )
 
     set_task_globals(
         module.dispatch_pending_messages,
         monkeypatch,
         Message=module.Message,
-        transaction=module.transaction,
         send_sms_with_failover=module.send_sms_with_failover,
+        # The dummy queryset ignores created_at bounds.
+        _expire_stale_pending=lambda window_start: 0,
     )
 
     module.dispatch_pending_messages.run(batch_size=1)
 
-    assert dispatched == [1]
+    assert dispatched == [(1, MessagePriority.NORMAL)]
     assert messages[0].status == processing_status
     assert messages[1].status == pending_status
     assert module.SMS_MESSAGES_PENDING_GAUGE._value.get() == 1
@@ -900,6 +965,7 @@ def test_dispatch_pending_messages_updates_pending_gauge(monkeypatch):
 
 def test_send_sms_with_failover_records_permanent_failure_metrics(monkeypatch):
     module = import_messaging_tasks(monkeypatch)
+    disable_usage_tracking(module.send_sms_with_failover, monkeypatch)
 
     module.SMS_PROVIDER_SEND_ATTEMPTS_TOTAL.clear()
     reset_histogram(module.SMS_PROVIDER_SEND_LATENCY_SECONDS)
@@ -933,13 +999,13 @@ def test_send_sms_with_failover_records_permanent_failure_metrics(monkeypatch):
     monkeypatch.setattr(
         module,
         "Message",
-        SimpleNamespace(objects=SimpleNamespace(get=lambda pk: message)),
+        SimpleNamespace(objects=DummyMessageManager(message)),
     )
 
     monkeypatch.setattr(
         module,
         "MessageAttemptLog",
-        SimpleNamespace(objects=SimpleNamespace(create=lambda **kwargs: None)),
+        make_attempt_log_model(),
     )
 
     class DummyProvider:
@@ -1042,6 +1108,7 @@ def test_send_sms_with_failover_records_permanent_failure_metrics(monkeypatch):
         get_provider_adapter=module.get_provider_adapter,
         publish_to_dlq=module.publish_to_dlq,
         timezone=module.timezone,
+        attempt_log_buffer=SimpleNamespace(add=lambda logs: None),
     )
 
     module.send_sms_with_failover.run(message.id)
@@ -78,3 +78,64 @@ def test_metrics_endpoint_serves_multiprocess_data(monkeypatch, tmp_path):
             REGISTRY.unregister(metric)
         except KeyError:
             pass
+
+
+def _write_samples(path, filename, samples):
+    from prometheus_client.mmap_dict import MmapedDict, mmap_key
+
+    values = MmapedDict(os.path.join(path, filename))
+    for (name, labels, value, timestamp) in samples:
+        key = mmap_key(name, name, list(labels), list(labels.values()), "help")
+        values.write_value(key, value, timestamp)
+    values.close()
+
+
+def _parsed(payload):
+    from prometheus_client.parser import text_string_to_metric_families
+
+    return sorted(
+        (sample.name, tuple(sorted(sample.labels.items())), sample.value)
+        for family in text_string_to_metric_families(payload.decode())
+        for sample in family.samples
+    )
+
+
+def test_archiving_exited_processes_keeps_totals(tmp_path):
+    from sms_gateway_project.multiprocess_metrics import archive_process, collect
+
+    path = str(tmp_path)
+    for pid, value in ((101, 2.0), (102, 5.0), (103, 3.0)):
+        _write_samples(path, f"counter_{pid}.db", [("sent_total", {"provider": "magfa"}, value, 0.0)])
+        _write_samples(path, f"gauge_max_{pid}.db", [("balance", {"provider": "magfa"}, value, 0.0)])
+        _write_samples(path, f"gauge_livesum_{pid}.db", [("pending", {}, 1.0, 0.0)])
+    before = collect(path)
+
+    assert archive_process(path, 101) == 3
+    assert archive_process(path, 102) == 3
+
+    remaining = sorted(os.listdir(path))
+    assert "counter_archive.db" in remaining
+    assert "gauge_max_archive.db" in remaining
+    assert not [name for name in remaining if "_101" in name or "_102" in name]
+    # Totals survive; live gauges of the exited processes are gone.
+    assert _parsed(before) == [
+        ("balance", (("provider", "magfa"),), 5.0),
+        ("pending", (), 3.0),
+        ("sent_total", (("provider", "magfa"),), 10.0),
+    ]
+    assert _parsed(collect(path)) == [
+        ("balance", (("provider", "magfa"),), 5.0),
+        ("pending", (), 1.0),
+        ("sent_total", (("provider", "magfa"),), 10.0),
+    ]
+
+def test_scrape_reuses_payload_within_ttl(tmp_path):
+    from sms_gateway_project import multiprocess_metrics
+
+    path = str(tmp_path)
+    _write_samples(path, "counter_1.db", [("sent_total", {}, 1.0, 0.0)])
+    first = multiprocess_metrics.scrape(path, ttl=60)
+    _write_samples(path, "counter_2.db", [("sent_total", {}, 1.0, 0.0)])
+
+    assert multiprocess_metrics.scrape(path, ttl=60) == first
+    assert multiprocess_metrics.scrape(path, ttl=0) != first
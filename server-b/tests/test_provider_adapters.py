@@ -47,13 +47,13 @@ def test_magfa_check_status_converts_dates_to_naive_datetimes(monkeypatch):
 
     captured = {}
 
-    def fake_get(url, headers=None, auth=None, timeout=None):
+    def fake_get(self, url, headers=None, auth=None, timeout=None):
         captured["url"] = url
         captured["auth"] = auth
         captured["timeout"] = timeout
         return DummyResponse()
 
-    monkeypatch.setattr("providers.adapters.requests.get", fake_get)
+    monkeypatch.setattr("providers.adapters.requests.Session.get", fake_get)
 
     adapter = MagfaSmsProvider(provider)
     result = adapter.check_status([123])
@@ -1,6 +1,4 @@
-import hashlib
 import importlib
-import json
 import os
 import sys
 from types import SimpleNamespace
@@ -145,12 +143,14 @@ def test_generate_server_a_config_data(monkeypatch):
 def test_update_expected_config_fingerprint_metric(monkeypatch):
     module = import_tasks_module(monkeypatch)
 
-    sample_payload = {"providers": {"Example": {"is_active": True}}, "users": {}}
-    monkeypatch.setattr(
-        module,
-        "generate_server_a_config_data",
-        lambda: sample_payload,
-    )
+    from core import config_state
+
+    sample_snapshot = {
+        "version": 0,
+        "users": [],
+        "providers": [{"id": 1, "name": "Example", "is_active": True, "aliases": []}],
+    }
+    monkeypatch.setattr(config_state, "build_snapshot", lambda: sample_snapshot)
 
     module.EXPECTED_CONFIG_FINGERPRINT.clear()
     module._last_fingerprint = "seed"
@@ -161,8 +161,7 @@ def test_update_expected_config_fingerprint_metric(monkeypatch):
 
     module.update_expected_config_fingerprint_metric.run()
 
-    serialized = json.dumps(sample_payload, sort_keys=True, separators=(",", ":"))
-    expected_hash = hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+    expected_hash = config_state.fingerprint_snapshot(sample_snapshot)
 
     metric_families = module.EXPECTED_CONFIG_FINGERPRINT.collect()
     samples = [
@@ -2,9 +2,6 @@
 
 from __future__ import annotations
 
-import hashlib
-import json
-
 from celery import shared_task
 
 from sms_gateway_project.metrics import (
@@ -12,21 +9,13 @@ from sms_gateway_project.metrics import (
     EXPECTED_CONFIG_FINGERPRINT_SERVICE_LABEL_VALUE,
 )
 
-from .utils import generate_server_a_config_data
-
 _last_fingerprint: str | None = None
 
 
-@shared_task
-def update_expected_config_fingerprint_metric() -> None:
-    """Compute and publish the expected configuration fingerprint metric."""
+def set_expected_config_fingerprint(current_fingerprint: str) -> None:
+    """Point the expected fingerprint gauge at ``current_fingerprint``."""
     global _last_fingerprint
 
-    config_payload = generate_server_a_config_data()
-    
-    serialized = json.dumps(config_payload, sort_keys=True, separators=(",", ":"))
-    current_fingerprint = hashlib.sha256(serialized.encode("utf-8")).hexdigest()
-
     labels = {
         "service": EXPECTED_CONFIG_FINGERPRINT_SERVICE_LABEL_VALUE,
         "fingerprint": current_fingerprint,
@@ -41,3 +30,17 @@ def update_expected_config_fingerprint_metric() -> None:
     if _last_fingerprint != current_fingerprint:
         EXPECTED_CONFIG_FINGERPRINT.labels(**labels).set(1)
         _last_fingerprint = current_fingerprint
+
+
+@shared_task
+def update_expected_config_fingerprint_metric() -> None:
+    """Compute and publish the expected configuration fingerprint metric.
+
+    Only scheduled when configuration state sync is disabled; otherwise
+    ``core.state_broadcaster.publish_full_state`` sets the gauge from the
+    fingerprint it maintains for its broadcasts. Without sync no changes are
+    recorded, so the state is fingerprinted from the database.
+    """
+    from core.config_state import build_snapshot, fingerprint_snapshot
+
+    set_expected_config_fingerprint(fingerprint_snapshot(build_snapshot()))
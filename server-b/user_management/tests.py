@@ -2,8 +2,10 @@ import json
 import uuid
 from datetime import timedelta
 from decimal import Decimal
+from io import StringIO
 
 from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
 from django.urls import reverse
 from django.utils import timezone
@@ -200,6 +202,7 @@ class UserStatsViewTests(TestCase):
         Message.objects.filter(user=self.bob).update(
             created_at=self.now - timedelta(days=10)
         )
+        call_command("rebuild_daily_usage", stdout=StringIO())
 
     def test_staff_can_view_aggregated_user_stats(self):
         response = self.client.get(reverse("user_stats"))
@@ -228,6 +231,16 @@ class UserStatsViewTests(TestCase):
         self.assertIsNone(admin_stats.total_cost)
         self.assertIsNone(admin_stats.last_sent)
 
+    def test_stats_are_read_from_the_daily_rollup(self):
+        # Usage survives message archival because the view never reads Message.
+        Message.objects.all().delete()
+
+        response = self.client.get(reverse("user_stats"))
+
+        stats = {user.username: user for user in response.context["user_stats"]}
+        self.assertEqual(stats["alice"].total_messages, 3)
+        self.assertEqual(stats["bob"].total_cost, Decimal("5000"))
+
     def test_date_filters_limit_results(self):
         target_date = (timezone.now() - timedelta(days=1)).strftime("%Y-%m-%d")
         response = self.client.get(
@@ -11,10 +11,9 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
-from datetime import datetime, time
+from datetime import datetime
 
-from django.db.models import Count, Max, Q, Sum
-from django.utils import timezone
+from django.db.models import Max, Q, Sum
 from django.views.generic import (
     CreateView,
     DeleteView,
@@ -24,7 +23,7 @@ from django.views.generic import (
     View,
 )
 
-from messaging.models import MessageStatus
+from messaging.models import DailyUserUsage, MessageStatus
 
 from .forms import CustomUserChangeForm, CustomUserCreationForm
 from .utils import generate_server_a_config_data
@@ -156,57 +155,61 @@ def my_profile(request):
 
 
 class UserStatsView(StaffRequiredMixin, TemplateView):
+    """Per-user message totals read from the ``DailyUserUsage`` rollup."""
+
     template_name = "user_management/user_stats.html"
 
-    def _parse_date(self, date_string, *, is_end=False):
+    def _parse_date(self, date_string):
         if not date_string:
             return None
 
         try:
-            date_value = datetime.strptime(date_string, "%Y-%m-%d").date()
+            return datetime.strptime(date_string, "%Y-%m-%d").date()
         except (TypeError, ValueError):
             return None
 
-        base_time = time.max if is_end else time.min
-        combined = datetime.combine(date_value, base_time)
-        if timezone.is_naive(combined):
-            combined = timezone.make_aware(combined, timezone.get_current_timezone())
-        return combined
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
         date_from = self._parse_date(self.request.GET.get("from"))
-        date_to = self._parse_date(self.request.GET.get("to"), is_end=True)
+        date_to = self._parse_date(self.request.GET.get("to"))
 
-        base_filter = Q()
+        usage = DailyUserUsage.objects.all()
         if date_from:
-            base_filter &= Q(messages__created_at__gte=date_from)
+            usage = usage.filter(day__gte=date_from)
         if date_to:
-            base_filter &= Q(messages__created_at__lte=date_to)
+            usage = usage.filter(day__lte=date_to)
 
         success_statuses = [
             MessageStatus.SENT_TO_PROVIDER,
             MessageStatus.DELIVERED,
         ]
 
-        users = list(
-            User.objects.all()
+        totals = {
+            row["user_id"]: row
+            for row in usage.values("user_id")
             .annotate(
-                total_messages=Count("messages", filter=base_filter),
-                successful_messages=Count(
-                    "messages",
-                    filter=base_filter & Q(messages__status__in=success_statuses),
+                total_messages=Sum("message_count"),
+                successful_messages=Sum(
+                    "message_count", filter=Q(status__in=success_statuses)
                 ),
-                failed_messages=Count(
-                    "messages",
-                    filter=base_filter & Q(messages__status=MessageStatus.FAILED),
+                failed_messages=Sum(
+                    "message_count", filter=Q(status=MessageStatus.FAILED)
                 ),
-                total_cost=Sum("messages__cost", filter=base_filter),
-                last_sent=Max("messages__created_at", filter=base_filter),
+                total_cost=Sum("total_cost"),
+                last_sent=Max("last_message_at"),
             )
-            .order_by("username")
-        )
+            .order_by()
+        }
+
+        users = list(User.objects.order_by("username"))
+        for user in users:
+            row = totals.get(user.pk, {})
+            user.total_messages = row.get("total_messages") or 0
+            user.successful_messages = row.get("successful_messages") or 0
+            user.failed_messages = row.get("failed_messages") or 0
+            user.total_cost = row.get("total_cost")
+            user.last_sent = row.get("last_sent")
 
         filter_values = {
             "from": self.request.GET.get("from", ""),
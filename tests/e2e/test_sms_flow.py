@@ -20,10 +20,10 @@ def reset_server_a_cache():
     making these tests independent of server-b's state and any previous tests.
     """
     print("\\n[Fixture] Deleting server-a cache to ensure fresh bootstrap from .env...")
-    # The cache file is located at /app/app/state/config_cache.json inside the container
+    # The cache file is located at /app/app/state/config_cache.bin inside the container
     delete_cache_cmd = [
         "docker", "compose", "exec", "-T", "server-a",
-        "rm", "-f", "/app/app/state/config_cache.json"
+        "rm", "-f", "/app/app/state/config_cache.bin"
     ]
     subprocess.run(delete_cache_cmd, check=True)
     
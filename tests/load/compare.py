@@ -0,0 +1,68 @@
+"""Compare two result files of ``run.py``, step by step.
+
+    python tests/load/compare.py results/old.json results/new.json
+"""
+import argparse
+import json
+from typing import Dict, Optional
+
+# (label, path into a step) of the figures worth comparing across releases.
+FIELDS = (
+    ("achieved rps", ("achieved_rps",)),
+    ("error rate", ("error_rate",)),
+    ("ingress p50 ms", ("ingress_latency_ms", "p50")),
+    ("ingress p95 ms", ("ingress_latency_ms", "p95")),
+    ("ingress p99 ms", ("ingress_latency_ms", "p99")),
+    ("e2e p50 ms", ("end_to_end", "latency_ms", "p50")),
+    ("e2e p99 ms", ("end_to_end", "latency_ms", "p99")),
+)
+
+
+def lookup(step: Dict, path) -> Optional[float]:
+    value = step
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def change(old: Optional[float], new: Optional[float]) -> str:
+    if old is None or new is None:
+        return ""
+    if old == 0:
+        return "" if new == 0 else "new"
+    return f"{(new - old) / old:+.1%}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("old")
+    parser.add_argument("new")
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    if old["scenario"] != new["scenario"]:
+        print(f"warning: comparing {old['scenario']} with {new['scenario']}")
+
+    print(f"{old.get('git_commit')} -> {new.get('git_commit')} ({new['scenario']})")
+    print(f"max sustainable rps: {old['max_sustainable_rps']} -> {new['max_sustainable_rps']}"
+          f" {change(old['max_sustainable_rps'], new['max_sustainable_rps'])}")
+    old_steps = {step["target_rps"]: step for step in old["steps"]}
+    for step in new["steps"]:
+        previous = old_steps.get(step["target_rps"])
+        if previous is None:
+            continue
+        print(f"\ntarget rps {step['target_rps']:g}")
+        for label, path in FIELDS:
+            before, after = lookup(previous, path), lookup(step, path)
+            if before is None and after is None:
+                continue
+            print(f"  {label:<16} {before!s:>10} -> {after!s:>10} {change(before, after):>8}")
+
+
+if __name__ == "__main__":
+    main()
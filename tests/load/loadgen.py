@@ -0,0 +1,133 @@
+"""Open-loop HTTP load generator and latency statistics.
+
+Requests are started on a fixed schedule (constant or Poisson arrivals at the
+target rate) whether or not earlier ones have finished, so a slow server
+builds up a backlog instead of slowing the generator down. Latency is
+measured from a request's *scheduled* start, so time spent waiting for a free
+connection counts against the server, not the schedule (no coordinated
+omission).
+"""
+import asyncio
+import math
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+
+@dataclass
+class Sample:
+    seq: int
+    # Wall clock (``time.time()``) of the scheduled start, to match provider logs.
+    scheduled_at: float
+    latency: float
+    status: Optional[int]
+    error: Optional[str] = None
+
+
+@dataclass
+class Run:
+    target_rps: float
+    duration: float
+    samples: List[Sample] = field(default_factory=list)
+    # How far behind schedule the generator itself fell, at worst.
+    max_schedule_lag: float = 0.0
+
+    def ok(self) -> List[Sample]:
+        return [s for s in self.samples if s.status is not None and s.status < 400]
+
+    def summary(self) -> Dict:
+        latencies = [s.latency for s in self.samples]
+        statuses: Dict[str, int] = {}
+        for s in self.samples:
+            key = str(s.status) if s.status is not None else (s.error or "error")
+            statuses[key] = statuses.get(key, 0) + 1
+        return {
+            "target_rps": self.target_rps,
+            "duration_seconds": self.duration,
+            "requests": len(self.samples),
+            "achieved_rps": round(len(self.ok()) / self.duration, 2) if self.duration else 0,
+            "error_rate": round(1 - len(self.ok()) / len(self.samples), 4) if self.samples else 0,
+            "statuses": statuses,
+            "ingress_latency_ms": latency_summary(latencies),
+            "max_schedule_lag_ms": round(self.max_schedule_lag * 1e3, 2),
+        }
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, ``q`` in [0, 100]."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, Optional[float]]:
+    def ms(value):
+        return None if value is None else round(value * 1e3, 3)
+
+    return {
+        "count": len(seconds),
+        "p50": ms(percentile(seconds, 50)),
+        "p95": ms(percentile(seconds, 95)),
+        "p99": ms(percentile(seconds, 99)),
+        "max": ms(max(seconds) if seconds else None),
+    }
+
+
+# ``send(client, seq)`` issues the request(s) of one arrival and returns the
+# HTTP status of the one that counts.
+Sender = Callable[[httpx.AsyncClient, int], Awaitable[int]]
+
+
+async def run_open_loop(
+    client: httpx.AsyncClient,
+    send: Sender,
+    rps: float,
+    duration: float,
+    arrivals: str = "constant",
+    burst: int = 1,
+    seed: Optional[int] = None,
+) -> Run:
+    """Start ``send`` ``rps`` times a second for ``duration`` seconds and wait for all of them.
+
+    With ``burst`` > 1, requests arrive in groups of ``burst`` started at the
+    same instant, ``rps / burst`` groups a second.
+    """
+    rng = random.Random(seed)
+    run = Run(target_rps=rps, duration=duration)
+    tasks = []
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    wall_started = time.time()
+    offset = 0.0
+    seq = 0
+
+    async def one(seq: int, offset: float) -> None:
+        scheduled = started + offset
+        try:
+            status = await send(client, seq)
+            error = None
+        except httpx.HTTPError as exc:
+            status, error = None, type(exc).__name__
+        run.samples.append(
+            Sample(seq, wall_started + offset, loop.time() - scheduled, status, error)
+        )
+
+    while offset < duration:
+        delay = started + offset - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            run.max_schedule_lag = max(run.max_schedule_lag, -delay)
+        for _ in range(burst):
+            tasks.append(asyncio.create_task(one(seq, offset)))
+            seq += 1
+        rate = rps / burst
+        offset += rng.expovariate(rate) if arrivals == "poisson" else 1 / rate
+    await asyncio.gather(*tasks)
+    run.samples.sort(key=lambda s: s.seq)
+    return run
@@ -0,0 +1,288 @@
+"""Throughput and latency benchmark of the SMS flow against the compose stack.
+
+Drives server-a's ``/api/v1/sms/send`` with the open-loop generator in
+``loadgen.py`` and reads the mock provider's request log to measure
+end-to-end latency: from a request's scheduled start to the provider
+accepting the message. Results are written as JSON under ``results/`` so runs
+of different releases can be compared with ``compare.py``.
+
+Scenarios:
+
+* ``single`` -- one message per request.
+* ``idempotent_retry`` -- every accepted request is replayed with the same
+  ``Idempotency-Key`` as soon as it is answered. The replay runs alongside
+  the schedule; its latency and mismatches are reported separately and do
+  not count towards the ingress latency.
+* ``batch`` -- requests arrive in bursts of ``--batch-size`` sent at the same
+  instant, the way a client pushes a campaign (the API takes one recipient
+  per request).
+* ``provider_outage`` -- the provider answers 503 to everything between
+  ``--outage-start`` and ``--outage-end`` (fractions of the run), then
+  recovers; end-to-end latency shows how long retries take to drain.
+
+``--ramp START STEP MAX`` repeats the scenario at increasing rates and
+reports the highest rate that stayed within ``--max-error-rate`` and
+``--p99-slo-ms`` as the maximum sustainable throughput.
+
+Run from the repository root with the stack up (``make up`` and
+``docker compose -f docker-compose.test.yml up -d``)::
+
+    python tests/load/run.py single --rps 50 --duration 30
+    python tests/load/run.py batch --batch-size 100 --ramp 100 100 1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadgen import Run, latency_summary, run_open_loop  # noqa: E402
+
+SCENARIOS = ("single", "idempotent_retry", "batch", "provider_outage")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def parse_latency(spec: Optional[str]) -> Optional[Dict]:
+    """``lognormal:mean=80,stddev=40`` -> the mock provider's latency config."""
+    if not spec:
+        return None
+    distribution, _, params = spec.partition(":")
+    latency = {"distribution": distribution}
+    for item in filter(None, params.split(",")):
+        name, _, value = item.partition("=")
+        latency[name.strip()] = float(value)
+    return latency
+
+
+class Scenario:
+    def __init__(self, args: argparse.Namespace, run_id: str):
+        self.args = args
+        self.run_id = run_id
+        self.replay_latencies: List[float] = []
+        self.replay_mismatches = 0
+        self._replays: List[asyncio.Task] = []
+
+    def text(self, seq: int) -> str:
+        return f"load {self.run_id} {seq}"
+
+    def payload(self, seq: int) -> Dict:
+        payload = {"to": f"+98912{seq % 10_000_000:07d}", "text": self.text(seq)}
+        if self.args.provider:
+            payload["providers"] = [self.args.provider]
+        return payload
+
+    async def send(self, client: httpx.AsyncClient, seq: int) -> int:
+        headers = {"API-Key": self.args.api_key, "Idempotency-Key": f"{self.run_id}-{seq}"}
+        url = f"{self.args.server_a}/api/v1/sms/send"
+        response = await client.post(url, json=self.payload(seq), headers=headers)
+        if self.args.scenario == "idempotent_retry" and response.status_code < 400:
+            # Replayed in its own task so the sample's ingress latency covers
+            # only the original request.
+            self._replays.append(
+                asyncio.create_task(self.replay(client, url, seq, headers, response.json().get("tracking_id")))
+            )
+        return response.status_code
+
+    async def replay(self, client: httpx.AsyncClient, url: str, seq: int, headers: Dict, tracking_id) -> None:
+        started = time.perf_counter()
+        try:
+            replay = await client.post(url, json=self.payload(seq), headers=headers)
+        except httpx.HTTPError:
+            self.replay_mismatches += 1
+            return
+        self.replay_latencies.append(time.perf_counter() - started)
+        if replay.status_code >= 400 or replay.json().get("tracking_id") != tracking_id:
+            self.replay_mismatches += 1
+
+    async def wait_for_replays(self) -> None:
+        await asyncio.gather(*self._replays)
+
+
+async def configure_provider(client: httpx.AsyncClient, args: argparse.Namespace, **overrides) -> Dict:
+    config = {
+        "mode": "success",
+        "latency": parse_latency(args.provider_latency),
+        "transient_error_rate": args.provider_error_rate,
+        "tps": args.provider_tps,
+        **overrides,
+    }
+    response = await client.post(f"{args.mock_provider}/config", json=config)
+    response.raise_for_status()
+    return config
+
+
+async def schedule_outage(client: httpx.AsyncClient, args: argparse.Namespace) -> None:
+    await asyncio.sleep(args.duration * args.outage_start)
+    await configure_provider(client, args, mode="transient", reset_logs=False)
+    await asyncio.sleep(args.duration * (args.outage_end - args.outage_start))
+    await configure_provider(client, args, reset_logs=False)
+
+
+async def end_to_end(client: httpx.AsyncClient, args: argparse.Namespace, scenario: Scenario, run: Run) -> Dict:
+    """Wait for accepted messages to reach the provider and summarise their latency."""
+    accepted = {s.seq: s for s in run.ok()}
+    prefix = f"load {scenario.run_id} "
+    delivered: Dict[int, float] = {}
+    deadline = time.monotonic() + args.drain
+    while True:
+        logs = (await client.get(f"{args.mock_provider}/logs")).json()
+        for entry in logs:
+            if entry.get("outcome") != "success":
+                continue
+            for text in entry.get("messages") or []:
+                if isinstance(text, str) and text.startswith(prefix):
+                    seq = int(text[len(prefix):])
+                    if seq in accepted:
+                        received = entry["received_at"]
+                        delivered[seq] = min(delivered.get(seq, received), received)
+        if len(delivered) >= len(accepted) or time.monotonic() >= deadline:
+            break
+        await asyncio.sleep(1)
+    latencies = [delivered[seq] - accepted[seq].scheduled_at for seq in delivered]
+    return {
+        "accepted": len(accepted),
+        "delivered": len(delivered),
+        "latency_ms": latency_summary(latencies),
+    }
+
+
+async def run_step(args: argparse.Namespace, rps: float) -> Dict:
+    run_id = uuid.uuid4().hex[:12]
+    scenario = Scenario(args, run_id)
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        provider_config = await configure_provider(client, args)
+        outage = None
+        if args.scenario == "provider_outage":
+            outage = asyncio.create_task(schedule_outage(client, args))
+        run = await run_open_loop(
+            client,
+            scenario.send,
+            rps,
+            args.duration,
+            arrivals=args.arrivals,
+            burst=args.batch_size if args.scenario == "batch" else 1,
+            seed=args.seed,
+        )
+        await scenario.wait_for_replays()
+        if outage is not None:
+            await outage
+        result = run.summary()
+        result["run_id"] = run_id
+        result["provider"] = provider_config
+        if args.scenario == "idempotent_retry":
+            result["replay_latency_ms"] = latency_summary(scenario.replay_latencies)
+            result["replay_mismatches"] = scenario.replay_mismatches
+        if args.drain > 0:
+            result["end_to_end"] = await end_to_end(client, args, scenario, run)
+    return result
+
+
+def sustainable(step: Dict, args: argparse.Namespace) -> bool:
+    p99 = step["ingress_latency_ms"]["p99"]
+    return (
+        step["error_rate"] <= args.max_error_rate
+        and p99 is not None
+        and p99 <= args.p99_slo_ms
+        # A generator that cannot keep its own schedule measures itself.
+        and step["max_schedule_lag_ms"] <= args.p99_slo_ms
+    )
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main_async(args: argparse.Namespace) -> Dict:
+    if args.ramp:
+        start, step, stop = args.ramp
+        rates = []
+        rate = start
+        while rate <= stop:
+            rates.append(rate)
+            rate += step
+    else:
+        rates = [args.rps]
+
+    steps = []
+    for rate in rates:
+        result = await run_step(args, rate)
+        result["sustainable"] = sustainable(result, args)
+        steps.append(result)
+        latency = result["ingress_latency_ms"]
+        print(
+            f"rps={rate:g} achieved={result['achieved_rps']:g} errors={result['error_rate']:.2%} "
+            f"p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms"
+            + (f" e2e_p99={result['end_to_end']['latency_ms']['p99']}ms" if "end_to_end" in result else "")
+        )
+        if args.ramp and not result["sustainable"]:
+            break
+
+    passing = [s["achieved_rps"] for s in steps if s["sustainable"]]
+    return {
+        "scenario": args.scenario,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "settings": {
+            key: value for key, value in vars(args).items() if key not in ("api_key", "output")
+        },
+        "max_sustainable_rps": max(passing) if passing else None,
+        "steps": steps,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenario", choices=SCENARIOS)
+    parser.add_argument("--server-a", default="http://localhost:8001")
+    parser.add_argument("--mock-provider", default="http://localhost:5005")
+    parser.add_argument("--api-key", default=os.environ.get("LOAD_API_KEY", "api_key_for_service_A"))
+    parser.add_argument("--provider", default="ProviderA", help="empty for smart selection")
+    parser.add_argument("--rps", type=float, default=20)
+    parser.add_argument("--ramp", type=float, nargs=3, metavar=("START", "STEP", "MAX"))
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--arrivals", choices=("constant", "poisson"), default="poisson")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--provider-latency", default="lognormal:mean=80,stddev=40",
+                        help="DIST:param=value,... (fixed, uniform, normal, lognormal, exponential)")
+    parser.add_argument("--provider-error-rate", type=float, default=0.0)
+    parser.add_argument("--provider-tps", type=float,
+                        help="messages/s the provider accepts before answering code 15")
+    parser.add_argument("--outage-start", type=float, default=0.3)
+    parser.add_argument("--outage-end", type=float, default=0.6)
+    parser.add_argument("--drain", type=float, default=60,
+                        help="seconds to wait for end-to-end delivery (0 skips it)")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--p99-slo-ms", type=float, default=250)
+    parser.add_argument("--output", help="result file (default: results/<time>-<scenario>.json)")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{args.scenario}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"max_sustainable_rps={report['max_sustainable_rps']} written to {output}")
+
+
+if __name__ == "__main__":
+    main()
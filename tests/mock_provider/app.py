@@ -1,34 +1,291 @@
+"""Magfa SMS API simulator for end-to-end and load tests.
+
+Implements the parts of the Magfa v2 HTTP API that server-b uses (see
+``docs/MAGFA.md``), at the same paths relative to the send URL:
+
+* ``POST /send`` -- aligned ``senders``/``messages``/``recipients`` arrays;
+  returns one result per recipient with ``id``, ``parts``, ``tariff`` and
+  ``alphabet``, and deducts the cost from the balance.
+* ``GET /statuses/{mid1,mid2,...}`` -- delivery reports (``dlrs``).
+* ``GET /balance``.
+
+Behaviour is set with ``POST /config``:
+
+* ``latency`` and ``route_latency``: delay distributions, for all routes or
+  per route (``send``, ``statuses``, ``balance``).
+* ``tps``: messages accepted per second; above it a request is answered with
+  ``throttle_code`` (15, "server busy, retry"). A balance too low for a
+  request is answered with 14.
+* ``transient_error_rate``: fraction of sends answered with HTTP 503;
+  ``failure_mix``: Magfa status codes returned for a fraction of sends,
+  e.g. ``{"15": 0.02, "1": 0.01}``.
+* ``dlr_latency`` and ``dlr_mix``: after the sampled delay, a sent message's
+  delivery report changes from 0 (no report yet) to a status drawn from the
+  mix (1 delivered, 2 not delivered, 8 at operator, 16 not at operator).
+  ``report_ttl_seconds`` after that the report is forgotten and
+  ``/statuses`` answers -1 (unknown id) for it, so long load runs do not
+  keep every report in memory.
+
+``mode`` (``success``, ``transient``, ``permanent``) forces the outcome of
+every send, as before. ``GET /logs`` returns every send request received,
+including rejected ones, with its ``outcome`` (``success``, ``http_503`` or
+``status_<code>``); filter on ``outcome == "success"`` for accepted sends.
+"""
+import asyncio
+import itertools
+import math
+import random
+import re
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
 from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
-from typing import List
 
 app = FastAPI()
 
-MODE = "success"
-REQUEST_LOGS: List[dict] = []
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+MAX_RECIPIENTS = 100
+MAX_STATUS_IDS = 100
+RECIPIENT_PATTERN = re.compile(r"^(?:\+?989|09|9)\d{9}$")
+
+
+class Latency(BaseModel):
+    """A delay in milliseconds.
+
+    ``fixed`` uses ``value``; ``uniform`` draws between ``low`` and ``high``;
+    ``normal`` and ``lognormal`` use ``mean`` and ``stddev`` (of the delay, not
+    of its logarithm); ``exponential`` uses ``mean``.
+    """
+    distribution: str = "fixed"
+    value: float = 0
+    low: float = 0
+    high: float = 0
+    mean: float = 0
+    stddev: float = 0
+
+    def sample_ms(self) -> float:
+        if self.distribution == "uniform":
+            return random.uniform(self.low, self.high)
+        if self.distribution == "normal":
+            return max(0.0, random.gauss(self.mean, self.stddev))
+        if self.distribution == "lognormal":
+            if self.mean <= 0:
+                return 0.0
+            sigma2 = math.log(1 + (self.stddev / self.mean) ** 2)
+            mu = math.log(self.mean) - sigma2 / 2
+            return random.lognormvariate(mu, math.sqrt(sigma2))
+        if self.distribution == "exponential":
+            return random.expovariate(1 / self.mean) if self.mean > 0 else 0.0
+        return self.value
+
 
 class ConfigMode(BaseModel):
-    mode: str
+    mode: str = "success"
+    latency: Optional[Latency] = None
+    route_latency: Dict[str, Latency] = {}
+    # Fractions of sends answered with a 503 / with status 1, on top of ``mode``.
+    transient_error_rate: float = 0
+    permanent_error_rate: float = 0
+    # Magfa status code -> fraction of sends answered with it.
+    failure_mix: Dict[str, float] = {}
+    tps: Optional[float] = None
+    throttle_code: int = 15
+    balance: float = 1_000_000_000
+    # Rials per part, by alphabet.
+    tariffs: Dict[str, float] = {"DEFAULT": 110.0, "UCS2": 160.0}
+    dlr_latency: Latency = Latency(value=2000)
+    dlr_mix: Dict[str, float] = {"1": 0.95, "2": 0.03, "8": 0.01, "16": 0.01}
+    # Seconds a settled delivery report stays queryable.
+    report_ttl_seconds: float = 3600
+    # Keep the request log, sent messages and balance, e.g. when a load test
+    # switches modes mid-run.
+    reset_logs: bool = True
+
+
+class State:
+    def __init__(self, config: ConfigMode):
+        self.config = config
+        self.balance = config.balance
+        self.tokens = config.tps or 0.0
+        self.refilled_at = time.monotonic()
+        self.logs: List[dict] = []
+        # mid -> [dlr status, dlr date]
+        self.reports: Dict[int, list] = {}
+        self.ids = itertools.count(random.randint(10**9, 2 * 10**9))
+
+    def take(self, count: int) -> bool:
+        """Consume ``count`` messages of the TPS budget, if there is enough."""
+        tps = self.config.tps
+        if not tps:
+            return True
+        now = time.monotonic()
+        self.tokens = min(tps, self.tokens + (now - self.refilled_at) * tps)
+        self.refilled_at = now
+        if self.tokens < count:
+            return False
+        self.tokens -= count
+        return True
+
+
+STATE = State(ConfigMode())
+
 
 @app.post("/config")
 def set_mode(cfg: ConfigMode):
-    global MODE, REQUEST_LOGS
-    MODE = cfg.mode
-    REQUEST_LOGS = []
-    return {"mode": MODE}
+    global STATE
+    previous = STATE
+    STATE = State(cfg)
+    if not cfg.reset_logs:
+        STATE.logs = previous.logs
+        STATE.reports = previous.reports
+        STATE.ids = previous.ids
+        STATE.balance = previous.balance
+    return cfg.model_dump()
+
 
 @app.get("/logs")
 def get_logs():
-    return REQUEST_LOGS
+    return STATE.logs
+
+
+async def _delay(route: str) -> None:
+    latency = STATE.config.route_latency.get(route) or STATE.config.latency
+    if latency is not None:
+        delay = latency.sample_ms()
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+
+def _draw(mix: Dict[str, float]) -> Optional[int]:
+    roll = random.random()
+    for code, share in mix.items():
+        if roll < share:
+            return int(code)
+        roll -= share
+    return None
+
+
+def _request_status() -> int:
+    """Status of the whole send request, before looking at its messages."""
+    config = STATE.config
+    if config.mode == "transient":
+        return 503
+    if config.mode == "permanent":
+        return 1
+    roll = random.random()
+    if roll < config.transient_error_rate:
+        return 503
+    if roll < config.transient_error_rate + config.permanent_error_rate:
+        return 1
+    return _draw(config.failure_mix) or 0
+
+
+def _parts(text: str):
+    if text.isascii():
+        return "DEFAULT", 1 if len(text) <= 160 else math.ceil(len(text) / 153)
+    return "UCS2", 1 if len(text) <= 70 else math.ceil(len(text) / 67)
+
+
+def _deliver(reports: Dict[int, list], mid: int) -> None:
+    report = reports.get(mid)
+    if report is not None:
+        report[0] = _draw(STATE.config.dlr_mix) or 1
+        report[1] = datetime.now().strftime(DATE_FORMAT)
+        asyncio.get_running_loop().call_later(STATE.config.report_ttl_seconds, reports.pop, mid, None)
+
 
 @app.post("/send")
 async def send(request: Request):
-    payload = await request.json()
-    REQUEST_LOGS.append(payload)
-    if MODE == "success":
-        return {"status": 0, "messages": [{"id": 1, "status": 0}]}
-    if MODE == "transient":
+    received_at = time.time()
+    try:
+        payload = await request.json()
+    except ValueError:
+        return {"status": 31, "messages": []}
+    recipients = payload.get("recipients") or []
+    messages = payload.get("messages") or []
+    senders = payload.get("senders") or []
+    log = {**payload, "received_at": received_at}
+    STATE.logs.append(log)
+
+    def reply(status: int, results: Optional[list] = None) -> dict:
+        log["outcome"] = "success" if status == 0 else f"status_{status}"
+        return {"status": status, "messages": results or []}
+
+    if not recipients:
+        return reply(106)
+    if len(recipients) > MAX_RECIPIENTS:
+        return reply(107)
+    if len(messages) != len(recipients):
+        return reply(101)
+    if len(senders) != len(recipients):
+        return reply(103)
+    if not STATE.take(len(recipients)):
+        return reply(STATE.config.throttle_code)
+
+    await _delay("send")
+
+    status = _request_status()
+    if status == 503:
+        log["outcome"] = "http_503"
         raise HTTPException(status_code=503, detail="temporary failure")
-    if MODE == "permanent":
-        return {"status": 1, "messages": [{"id": 1, "status": 1}]}
-    return {"status": 0, "messages": [{"id": 1, "status": 0}]}
+    if status != 0:
+        return reply(status)
+
+    priced = [(recipient, text, *_parts(text or "")) for recipient, text in zip(recipients, messages)]
+    cost = sum(
+        STATE.config.tariffs.get(alphabet, 0) * parts
+        for recipient, text, alphabet, parts in priced
+        if text and RECIPIENT_PATTERN.match(str(recipient))
+    )
+    if cost > STATE.balance:
+        return reply(14)
+    STATE.balance -= cost
+
+    loop = asyncio.get_running_loop()
+    results = []
+    for recipient, text, alphabet, parts in priced:
+        if not RECIPIENT_PATTERN.match(str(recipient)):
+            results.append({"status": 1, "recipient": recipient})
+            continue
+        if not text:
+            results.append({"status": 13, "recipient": recipient})
+            continue
+        mid = next(STATE.ids)
+        STATE.reports[mid] = [0, None]
+        loop.call_later(STATE.config.dlr_latency.sample_ms() / 1000, _deliver, STATE.reports, mid)
+        results.append({
+            "status": 0,
+            "id": mid,
+            "parts": parts,
+            "tariff": STATE.config.tariffs.get(alphabet, 0),
+            "alphabet": alphabet,
+            "recipient": recipient,
+        })
+    return reply(0, results)
+
+
+@app.get("/statuses/{mids}")
+async def statuses(mids: str):
+    await _delay("statuses")
+    ids = [mid for mid in mids.split(",") if mid.strip()]
+    if not ids or len(ids) > MAX_STATUS_IDS:
+        return {"status": 24, "dlrs": []}
+    dlrs = []
+    for mid in ids:
+        try:
+            report = STATE.reports.get(int(mid))
+        except ValueError:
+            report = None
+        if report is None:
+            dlrs.append({"mid": mid, "status": -1, "date": None})
+        else:
+            dlrs.append({"mid": int(mid), "status": report[0], "date": report[1]})
+    return {"status": 0, "dlrs": dlrs}
+
+
+@app.get("/balance")
+async def balance():
+    await _delay("balance")
+    return {"status": 0, "balance": int(STATE.balance)}